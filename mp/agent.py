@@ -0,0 +1,152 @@
+##
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Stefan Wendler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+import hashlib
+
+from mp import hashing
+
+# module name of the agent on the device
+NAME = "_mpfs_agent"
+
+# name the agent is imported as in the raw REPL
+VAR = "_a"
+
+_BODY = """try:
+    import uos
+except ImportError:
+    import os as uos
+import sys
+try:
+    import ubinascii
+except ImportError:
+    import binascii as ubinascii
+%(hash_import)s
+
+E = {%(encoders)s}
+
+
+def ls(d):
+    print(repr([e[:2] for e in uos.ilistdir(d)]))
+
+
+def rm(p):
+    try:
+        uos.remove(p)
+    except OSError:
+        uos.rmdir(p)
+
+
+def size(p):
+    print(uos.stat(p)[6])
+
+
+%(file_hash)s
+
+
+def w(f, b, n):
+    if f.write(b) != n:
+        raise ValueError('short write')
+
+
+def r(f, n, e):
+    e = E[e]
+    while True:
+        c = f.read(n)
+        if not c:
+            break
+        sys.stdout.write(e(c))
+
+
+def bh(p, n):
+    with open(p, 'rb') as hf:
+        while True:
+            b = hf.read(n)
+            if not b:
+                break
+            %(hash_new)s
+            %(hash_update)s
+            sys.stdout.write(%(hash_digest)s + '\\n')
+"""
+
+
+def source(codecs, hash=None, block_size=512):
+    """
+    Generate the agent module.
+
+    :param codecs:      transfer codecs the agent has to encode downloads with
+    :param hash:        content hash for block and file hashes (None if not
+                        available)
+    :param block_size:  size of the reads when hashing a whole file
+    :return:        tuple (version, module source), the version is the digest
+                    of the module body and is also stored in its VERSION
+    """
+
+    if hash:
+        hash_code = {
+            "hash_import": hash.remote_import,
+            "hash_new": hash.remote_new("h"),
+            "hash_update": hash.remote_update("h", "b"),
+            "hash_digest": hash.remote_digest("h"),
+            "file_hash": hashing.remote_file_hash(hash, block_size, imports=False),
+        }
+    else:
+        hash_code = {
+            "hash_import": "",
+            "hash_new": "pass",
+            "hash_update": "pass",
+            "hash_digest": "''",
+            "file_hash": "def hs(p, n=-1):\n    return ''",
+        }
+
+    body = _BODY % dict(
+        hash_code,
+        encoders=", ".join(
+            "%r: lambda c: %s" % (c.name, c.remote_encode("c")) for c in codecs
+        ),
+    )
+
+    digest = version(body)
+
+    return digest, "VERSION = '%s'\n%s" % (digest, body)
+
+
+def version(body):
+    """
+    :return:    short digest identifying the agent module body
+    """
+
+    return hashlib.sha1(body.encode("utf-8")).hexdigest()[:16]
+
+
+# device code importing the agent (from the current directory) and printing
+# its version, or None if it can't be imported
+PROBE = (
+    "try:\n"
+    "    import %s as %s\n"
+    "    print(repr(%s.VERSION))\n"
+    "except Exception:\n"
+    "    print(None)" % (NAME, VAR, VAR)
+)
+
+# device code dropping the agent, so it is imported again
+UNLOAD = "sys.modules.pop('%s', None)\n%s = None" % (NAME, VAR)
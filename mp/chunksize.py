@@ -0,0 +1,109 @@
+##
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Stefan Wendler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+
+
+class AdaptiveChunkSize(object):
+    """
+    Chunk size which adapts itself to the measured throughput.
+
+    The size starts from an initial guess and is doubled as long as this
+    increases the number of bytes per second by at least GAIN. As soon as a
+    step does not pay off, the size falls back to the best one seen so far and
+    stays there. A MemoryError on the device permanently lowers the maximum.
+    """
+
+    # number of chunks to measure before deciding on the next step
+    SAMPLES = 3
+
+    # minimal relative throughput gain which justifies doubling the size
+    GAIN = 1.05
+
+    def __init__(self, initial, minimum=64, maximum=4096):
+
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.size = self.__clamp(initial)
+        self.settled = False
+
+        self.best_size = self.size
+        self.best_rate = 0.0
+
+        self.__bytes = 0
+        self.__elapsed = 0.0
+        self.__samples = 0
+
+    def __clamp(self, size):
+        return min(max(int(size), self.minimum), self.maximum)
+
+    def measure(self, nbytes, elapsed):
+        """
+        Report one transferred chunk.
+
+        :param nbytes:      number of payload bytes transferred
+        :param elapsed:     seconds the transfer took
+        """
+
+        if self.settled:
+            return
+
+        self.__bytes += nbytes
+        self.__elapsed += elapsed
+        self.__samples += 1
+
+        if self.__samples < self.SAMPLES:
+            return
+
+        rate = self.__bytes / max(self.__elapsed, 1e-6)
+
+        self.__bytes = 0
+        self.__elapsed = 0.0
+        self.__samples = 0
+
+        if rate > self.best_rate * self.GAIN:
+            self.best_rate = rate
+            self.best_size = self.size
+
+            if self.size < self.maximum:
+                self.size = self.__clamp(self.size * 2)
+            else:
+                self.settled = True
+        else:
+            self.size = self.best_size
+            self.settled = True
+
+    def shrink(self):
+        """
+        Halve the size (and the maximum) after the device ran out of memory.
+
+        :return:    False if the size is already at its minimum
+        """
+
+        if self.size <= self.minimum:
+            return False
+
+        self.maximum = self.__clamp(self.size // 2)
+        self.size = self.maximum
+        self.best_size = min(self.best_size, self.size)
+
+        return True
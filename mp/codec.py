@@ -0,0 +1,228 @@
+##
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Stefan Wendler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+import ast
+import base64
+import binascii
+
+
+class Codec(object):
+    """
+    A transfer codec describes how binary data is carried through the raw REPL.
+
+    For uploads, the host turns a chunk of data into a Python expression which
+    evaluates to the original bytes on the device. For downloads, the device
+    turns a chunk of data into one line of printable text, which the host
+    decodes again.
+    """
+
+    name = None
+
+    # names of the (u)binascii functions the device needs for this codec
+    requires = ()
+
+    def encode(self, data):
+        """
+        Host side encoding for uploads.
+
+        :param data:    bytes (or any buffer) to encode
+        :return:        Python expression which evaluates to data on the device
+        """
+        raise NotImplementedError
+
+    def remote_encode(self, var):
+        """
+        Device side encoding for downloads.
+
+        :param var:     name of the device variable holding the bytes to encode
+        :return:        Python expression which evaluates to one line of text
+        """
+        raise NotImplementedError
+
+    def decode(self, line):
+        """
+        Host side decoding for downloads.
+
+        :param line:    one line as produced by remote_encode (without line ending)
+        :return:        decoded bytes
+        """
+        raise NotImplementedError
+
+    def decode_lines(self, data):
+        """
+        Decode the complete output of a download.
+
+        :param data:    lines as produced by remote_encode
+        :return:        decoded bytes
+        """
+
+        return b"".join(
+            self.decode(line.strip()) for line in data.split(b"\n") if line.strip()
+        )
+
+    def __repr__(self):
+        return "%s()" % self.__class__.__name__
+
+
+class HexCodec(Codec):
+    """
+    Hex encoding, two characters per byte. Works on every firmware.
+    """
+
+    name = "hex"
+    requires = ("hexlify", "unhexlify")
+
+    def encode(self, data):
+        return "ubinascii.unhexlify('%s')" % binascii.hexlify(data).decode("ascii")
+
+    def remote_encode(self, var):
+        return "ubinascii.hexlify(%s) + b'\\n'" % var
+
+    def decode(self, line):
+        return binascii.unhexlify(line)
+
+
+class Base64Codec(Codec):
+    """
+    Base64 encoding, four characters per three bytes.
+    """
+
+    name = "base64"
+    requires = ("a2b_base64", "b2a_base64")
+
+    def encode(self, data):
+        return "ubinascii.a2b_base64('%s')" % base64.b64encode(data).decode("ascii")
+
+    def remote_encode(self, var):
+        # b2a_base64 already terminates its output with a newline
+        return "ubinascii.b2a_base64(%s)" % var
+
+    def decode(self, line):
+        return binascii.a2b_base64(line)
+
+
+class LiteralCodec(Codec):
+    """
+    Printable-escaped bytes literal (b'...'). Printable ASCII is carried as is,
+    which makes this the cheapest codec for text files, while every other byte
+    costs four characters.
+    """
+
+    name = "literal"
+
+    def encode(self, data):
+        return repr(bytes(data))
+
+    def remote_encode(self, var):
+        return "repr(%s) + '\\n'" % var
+
+    def decode(self, line):
+        return ast.literal_eval(line.decode("ascii"))
+
+
+class LineDecoder(object):
+    """
+    Decodes the output of a download incrementally, as it arrives.
+
+    Only the last incomplete line is buffered, decoded data is handed to the
+    write function right away.
+    """
+
+    def __init__(self, codec, write):
+
+        self.codec = codec
+        self.write = write
+        self.size = 0
+        self.lines = 0
+        self.__pending = bytearray()
+
+    def __decode(self, lines):
+
+        for line in lines.split(b"\n"):
+            line = line.strip()
+            if line:
+                data = self.codec.decode(line)
+                self.size += len(data)
+                self.lines += 1
+                self.write(data)
+
+    def feed(self, data):
+        """
+        :param data:    raw output as received from the device
+        """
+
+        # the raw REPL terminates the output with ctrl-D
+        data = data.replace(b"\x04", b"")
+        self.__pending += data
+
+        if b"\n" in data:
+            end = self.__pending.rfind(b"\n")
+            lines = bytes(self.__pending[:end])
+            del self.__pending[: end + 1]
+            self.__decode(lines)
+
+    def close(self):
+        """
+        Decode what is left after the last line ending.
+        """
+
+        lines = bytes(self.__pending)
+        del self.__pending[:]
+        self.__decode(lines)
+
+
+# all known codecs, in order of preference for downloads
+CODECS = [Base64Codec(), HexCodec(), LiteralCodec()]
+
+
+def probe_expression():
+    """
+    :return:    device expression listing the (u)binascii functions required by
+                any of the known codecs which are available on the device
+    """
+
+    names = []
+
+    for codec in CODECS:
+        names.extend(n for n in codec.requires if n not in names)
+
+    return "[n for n in %r if hasattr(ubinascii, n)]" % (tuple(names),)
+
+
+def supported(names):
+    """
+    :param names:   (u)binascii functions available on the device
+    :return:        codecs usable with the given functions, in order of preference
+    """
+
+    return [c for c in CODECS if all(n in names for n in c.requires)]
+
+
+def smallest(codecs, sample):
+    """
+    :param codecs:  codecs to choose from
+    :param sample:  representative chunk of the data to transfer
+    :return:        the codec producing the shortest encoding for sample
+    """
+
+    return min(codecs, key=lambda c: len(c.encode(sample)))
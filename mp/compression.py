@@ -0,0 +1,154 @@
+##
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Stefan Wendler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+import tempfile
+import zlib
+
+# zlib window size (2^WBITS bytes), the device has to allocate a window of
+# this size for (de)compression
+WBITS = 10
+
+
+# device code printing the available (de)compressors:
+#   "deflate"           deflate.DeflateIO (MicroPython >= 1.21) can decompress
+#   "deflate-compress"  deflate.DeflateIO can also compress, into a stream
+#                       implemented in Python
+#   "uzlib"             uzlib.DecompIO (older firmwares) can decompress
+PROBE = (
+    "r = []\n"
+    "try:\n"
+    "    import deflate\n"
+    "    r.append('deflate')\n"
+    "    try:\n"
+    "        import io\n"
+    "        class Z(io.IOBase):\n"
+    "            def write(self, b):\n"
+    "                return len(b)\n"
+    "        d = deflate.DeflateIO(Z(), deflate.ZLIB, %d)\n"
+    "        d.write(b'x')\n"
+    "        d.close()\n"
+    "        r.append('deflate-compress')\n"
+    "    except Exception:\n"
+    "        pass\n"
+    "except ImportError:\n"
+    "    try:\n"
+    "        import uzlib\n"
+    "        if hasattr(uzlib, 'DecompIO'):\n"
+    "            r.append('uzlib')\n"
+    "    except ImportError:\n"
+    "        pass\n"
+    "print(r)" % WBITS
+)
+
+
+def _copy(src, dst, chunk_size):
+    return (
+        "    while True:\n"
+        "        b = %s.read(%d)\n"
+        "        if not b:\n"
+        "            break\n"
+        "        %s.write(b)\n" % (src, chunk_size, dst)
+    )
+
+
+def remote_decompress(method, src, dst, chunk_size):
+    """
+    :param method:  "deflate" or "uzlib"
+    :return:        device code decompressing the file src into the file dst
+                    and removing src
+    """
+
+    if method == "deflate":
+        decomp = "import deflate\nd = deflate.DeflateIO(zf, deflate.ZLIB, %d)" % WBITS
+    else:
+        decomp = "import uzlib\nd = uzlib.DecompIO(zf, %d)" % WBITS
+
+    return (
+        "zf = open('%s', 'rb')\n"
+        "%s\n"
+        "with open('%s', 'wb') as f:\n"
+        "%s"
+        "zf.close()\n"
+        "uos.remove('%s')" % (src, decomp, dst, _copy("d", "f", chunk_size), src)
+    )
+
+
+def remote_compress(src, chunk_size, encode):
+    """
+    :param encode:  device expression encoding the bytes in b to one line of
+                    text, as returned by Codec.remote_encode
+    :return:        device code printing the file src compressed, as encoded
+                    lines, while it is compressed
+    """
+
+    return (
+        "import deflate\n"
+        "import io\n"
+        "class Z(io.IOBase):\n"
+        "    def write(self, b):\n"
+        "        if b:\n"
+        "            sys.stdout.write(%s)\n"
+        "        return len(b)\n"
+        "d = deflate.DeflateIO(Z(), deflate.ZLIB, %d)\n"
+        "with open('%s', 'rb') as f:\n"
+        "%s"
+        "d.close()" % (encode, WBITS, src, _copy("f", "d", chunk_size))
+    )
+
+
+def compress(src):
+    """
+    :param src:     binary file to compress, from its current position
+    :return:        temporary file holding the compressed data, positioned at 0
+    """
+
+    z = zlib.compressobj(9, zlib.DEFLATED, WBITS)
+    dst = tempfile.TemporaryFile()
+
+    while True:
+        b = src.read(65536)
+        if not b:
+            break
+        dst.write(z.compress(b))
+
+    dst.write(z.flush())
+    dst.seek(0)
+
+    return dst
+
+
+class Decompressor(object):
+    """
+    Writer which decompresses the data written to it into another writer.
+    """
+
+    def __init__(self, write):
+
+        self.__write = write
+        self.__z = zlib.decompressobj(WBITS)
+
+    def write(self, data):
+        self.__write(self.__z.decompress(data))
+
+    def close(self):
+        self.__write(self.__z.flush())
@@ -21,6 +21,8 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 ##
+import contextlib
+import time
 
 
 class ConError(Exception):
@@ -29,7 +31,9 @@ class ConError(Exception):
 
 class ConBase:
     def __init__(self):
-        pass
+
+        # data written within buffered(), not sent yet
+        self.wbuf = None
 
     def close(self):
         raise NotImplementedError
@@ -38,8 +42,52 @@ class ConBase:
         raise NotImplementedError
 
     def write(self, data):
+
+        if self.wbuf is None:
+            return self._write(data)
+
+        self.wbuf += data
+        return len(data)
+
+    def _write(self, data):
+        """
+        Send data right away. Implemented by the connections, which are
+        written to through write.
+        """
+
         raise NotImplementedError
 
+    def flush(self):
+        """
+        Send the data written within buffered() so far.
+        """
+
+        if self.wbuf:
+            data = bytes(self.wbuf)
+            del self.wbuf[:]
+            self._write(data)
+
+    @contextlib.contextmanager
+    def buffered(self):
+        """
+        Context which collects all writes, and sends them at once at its end
+        (e.g. as one websocket frame or TCP segment), or when flush is called.
+        Data still buffered when an exception leaves the context is dropped.
+        """
+
+        if self.wbuf is not None:
+            # nested, the outer context sends the data
+            yield
+            return
+
+        self.wbuf = bytearray()
+
+        try:
+            yield
+            self.flush()
+        finally:
+            self.wbuf = None
+
     def inWaiting(self):
         raise NotImplementedError
 
@@ -47,5 +95,54 @@ class ConBase:
     def in_waiting(self):
         return self.inWaiting()
 
+    def wait(self, timeout):
+        """
+        Block until data is waiting to be read, or timeout seconds passed.
+        Connections which can, override this to sleep until data arrives.
+
+        :param timeout:     seconds to wait at most, None to wait forever
+        :return:            False if timeout passed without data arriving
+        """
+
+        start = time.time()
+
+        while not self.inWaiting():
+            if timeout is not None and time.time() - start >= timeout:
+                return False
+            time.sleep(0.001)
+
+        return True
+
+    def drain(self, idle=0.05, limit=1.0):
+        """
+        Read and drop input until the line was quiet for idle seconds. While
+        data keeps arriving, idle grows with the gaps seen between it (up to
+        limit seconds), since e.g. a booting device pauses between messages.
+
+        :return:    the dropped data
+        """
+
+        data = bytearray()
+        last = time.time()
+
+        while self.wait(idle):
+            n = self.inWaiting()
+            if n:
+                data += self.read(n)
+
+            now = time.time()
+            idle = min(max(idle, 4 * (now - last)), limit)
+            last = now
+
+        return bytes(data)
+
+    def supports_file_transfer(self):
+        """
+        Connections with a file transfer protocol of their own (like WebREPL)
+        implement put_file and get_file, and return True here.
+        """
+
+        return False
+
     def survives_soft_reset(self):
         return False
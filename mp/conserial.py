@@ -22,6 +22,8 @@
 # THE SOFTWARE.
 ##
 import logging
+import os
+import select
 import time
 
 from serial import Serial
@@ -31,7 +33,16 @@ from mp.conbase import ConError
 
 
 class ConSerial(ConBase):
-    def __init__(self, port, baudrate=115200, reset=False):
+
+    # seconds to wait for a device to start talking after a hard reset
+    RESET_TIMEOUT = 2.0
+
+    # in low-latency mode: receive buffer of the driver (only settable on
+    # Windows), and ms the USB-serial adapter may hold back received data
+    RX_BUFFER_SIZE = 65536
+    LATENCY_TIMER = 1
+
+    def __init__(self, port, baudrate=115200, reset=False, low_latency=False):
         ConBase.__init__(self)
 
         try:
@@ -47,30 +58,81 @@ class ConSerial(ConBase):
                 self.serial.close()
                 self.serial = Serial(port, baudrate=baudrate, interCharTimeout=1)
 
-                while True:
-                    time.sleep(2.0)
-                    if not self.inWaiting():
-                        break
-                    self.serial.read(self.inWaiting())
+                # drop the boot messages
+                if self.wait(self.RESET_TIMEOUT):
+                    self.drain(0.1)
 
         except Exception as e:
             logging.error(e)
             raise ConError(e)
 
+        if low_latency:
+            self.__set_low_latency(port)
+
+    def __set_low_latency(self, port):
+        """
+        Make the driver pass on received data right away, as far as the
+        platform and the permissions allow. Whatever isn't possible is
+        logged and skipped.
+        """
+
+        try:
+            # sets ASYNC_LOW_LATENCY, pyserial only has it on Linux
+            self.serial.set_low_latency_mode(True)
+        except (AttributeError, ValueError) as e:
+            logging.info("no low latency mode for %s: %s" % (port, e))
+
+        try:
+            self.serial.set_buffer_size(rx_size=self.RX_BUFFER_SIZE)
+        except AttributeError:
+            pass
+
+        # FTDI adapters wait up to 16 ms by default before passing on data
+        timer = "/sys/bus/usb-serial/devices/%s/latency_timer" % os.path.basename(
+            os.path.realpath(port)
+        )
+
+        if os.path.exists(timer):
+            try:
+                with open(timer, "w") as f:
+                    f.write("%d" % self.LATENCY_TIMER)
+            except IOError as e:
+                logging.info("could not set latency timer of %s: %s" % (port, e))
+
     def close(self):
         return self.serial.close()
 
     def read(self, size):
+
         data = self.serial.read(size)
-        logging.debug("serial read < %s" % str(data))
+
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug("serial read < %s" % str(data))
+
         return data
 
-    def write(self, data):
-        logging.debug("serial write > %s" % str(data))
+    def _write(self, data):
+
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug("serial write > %s" % str(data))
+
         return self.serial.write(data)
 
     def inWaiting(self):
         return self.serial.inWaiting()
 
+    def wait(self, timeout):
+
+        if self.serial.inWaiting():
+            return True
+
+        try:
+            # only the POSIX implementation of pyserial has a file descriptor
+            fd = self.serial.fileno()
+        except AttributeError:
+            return ConBase.wait(self, timeout)
+
+        return len(select.select([fd], [], [], timeout)[0]) > 0
+
     def survives_soft_reset(self):
         return False
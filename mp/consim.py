@@ -0,0 +1,533 @@
+##
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Stefan Wendler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+import binascii
+import builtins
+import errno
+import hashlib
+import io
+import logging
+import os
+import posixpath
+import re
+import struct
+import sys
+import time
+import traceback
+import types
+import zlib
+
+from mp.conbase import ConBase
+from mp.conbase import ConError
+
+
+class DeflateIO(object):
+    """
+    Emulates deflate.DeflateIO (and uzlib.DecompIO) for the zlib format.
+    """
+
+    def __init__(self, stream, format=1, wbits=0, close=False):
+
+        self.stream = stream
+        self.wbits = wbits or 8
+        self.__d = None
+        self.__c = None
+        self.__pending = b""
+
+    def read(self, size=-1):
+
+        if self.__d is None:
+            self.__d = zlib.decompressobj(15)
+
+        while size < 0 or len(self.__pending) < size:
+            data = self.stream.read(512)
+            if not data:
+                self.__pending += self.__d.flush()
+                break
+            self.__pending += self.__d.decompress(data)
+
+        if size < 0:
+            size = len(self.__pending)
+
+        data, self.__pending = self.__pending[:size], self.__pending[size:]
+        return data
+
+    def write(self, data):
+
+        if self.__c is None:
+            self.__c = zlib.compressobj(9, zlib.DEFLATED, self.wbits)
+
+        self.stream.write(self.__c.compress(bytes(data)))
+        return len(data)
+
+    def close(self):
+
+        if self.__c is not None:
+            self.stream.write(self.__c.flush())
+            self.__c = None
+
+
+def DecompIO(stream, wbits=0):
+    return DeflateIO(stream, 1, wbits)
+
+
+class SimDevice(object):
+    """
+    Emulates the file system related parts of a MicroPython device on top of
+    a local directory. Code received through the REPL is executed by the
+    host's Python interpreter, with the MicroPython modules replaced by shims
+    which confine all file access to the root directory.
+
+    This is a test and benchmark aid, not a security boundary.
+    """
+
+    SYSNAME = "sim"
+    RELEASE = "1.22.0"
+    VERSION = "v1.22.0 on 2024-01-01"
+    MACHINE = "mpfshell simulated device"
+
+    # modules taken from the host as they are
+    HOST_MODULES = ("struct", "math", "errno", "collections", "json", "re", "io")
+
+    def __init__(self, root, mem_free=100000, block_size=4096):
+
+        self.root = os.path.realpath(root)
+        self.mem_free = mem_free
+        self.block_size = block_size
+
+        if not os.path.isdir(self.root):
+            raise ConError("No such directory: %s" % root)
+
+        self.stdout = None
+        self.modules = {}
+        self.globals = {}
+        self.cwd = "/"
+
+        self.shims = {
+            "uos": self.__os_module(),
+            "ubinascii": self.__module("ubinascii", binascii),
+            "uhashlib": self.__module(
+                "uhashlib", sha1=hashlib.sha1, sha256=hashlib.sha256
+            ),
+            "uzlib": self.__module(
+                "uzlib", decompress=zlib.decompress, DecompIO=DecompIO
+            ),
+            "deflate": self.__module(
+                "deflate", DeflateIO=DeflateIO, RAW=-1, ZLIB=1, GZIP=2, AUTO=0
+            ),
+            "gc": self.__module(
+                "gc",
+                mem_free=lambda: self.mem_free,
+                mem_alloc=lambda: self.mem_free // 4,
+                collect=lambda: None,
+            ),
+            "sys": self.__module(
+                "sys",
+                stdout=self.__module("stdout", write=self.__write_stdout),
+                path=["", "/lib"],
+                platform=self.SYSNAME,
+                implementation=types.SimpleNamespace(name="micropython"),
+                modules=self.modules,
+                exit=sys.exit,
+            ),
+            "time": self.__module(
+                "time",
+                time,
+                ticks_ms=lambda: int(time.monotonic() * 1000),
+                ticks_us=lambda: int(time.monotonic() * 1000000),
+                ticks_diff=lambda a, b: a - b,
+                sleep_ms=lambda ms: time.sleep(ms / 1000.0),
+            ),
+            "machine": self.__module(
+                "machine",
+                unique_id=lambda: hashlib.sha1(self.root.encode("utf-8")).digest()[:6],
+            ),
+        }
+
+        for name in ("os", "binascii", "hashlib"):
+            self.shims[name] = self.shims["u" + name]
+
+        self.builtins = dict(vars(builtins))
+        self.builtins.update(
+            open=self.__open, print=self.__print, __import__=self.__import
+        )
+
+        self.soft_reset()
+
+    def soft_reset(self):
+
+        self.modules.clear()
+        self.globals = {"__name__": "__main__", "__builtins__": self.builtins}
+        self.cwd = "/"
+
+    @staticmethod
+    def __module(name, base=None, **attrs):
+
+        module = types.ModuleType(name)
+
+        if base is not None:
+            module.__dict__.update(
+                (k, v) for k, v in vars(base).items() if not k.startswith("_")
+            )
+
+        module.__dict__.update(attrs)
+        return module
+
+    @staticmethod
+    def __oserror(e):
+        # MicroPython reports errors as "OSError: [Errno 2] ENOENT"
+        code = e.errno
+
+        if code in (errno.ENOTEMPTY, errno.EPERM, errno.EISDIR):
+            code = errno.EACCES
+
+        return OSError(code, errno.errorcode.get(code, str(code)))
+
+    def local(self, path):
+        """
+        :param path:    path on the device
+        :return:        path in the local root directory
+        """
+
+        path = posixpath.normpath(posixpath.join(self.cwd, path))
+        return os.path.join(self.root, *[p for p in path.split("/") if p])
+
+    def __fs(self, func):
+        def wrapper(path="", *args):
+            try:
+                return func(self.local(path), *args)
+            except OSError as e:
+                raise self.__oserror(e) from None
+
+        return wrapper
+
+    def __os_module(self):
+        def ilistdir(path):
+            for e in os.scandir(path):
+                st = e.stat()
+                yield (e.name, 0x4000 if e.is_dir() else 0x8000, 0, st.st_size)
+
+        def stat(path):
+            st = os.stat(path)
+            mode = 0x4000 if os.path.isdir(path) else 0x8000
+            return (mode, 0, 0, 0, 0, 0, st.st_size, 0, int(st.st_mtime), 0)
+
+        def statvfs(path):
+            st = os.statvfs(path)
+            free = st.f_bavail * st.f_frsize // self.block_size
+            return (self.block_size, self.block_size, free, free, free, 0, 0, 0, 0, 255)
+
+        def remove(path):
+            if os.path.isdir(path):
+                raise OSError(errno.EISDIR, "")
+            os.remove(path)
+
+        def rename(src, dst):
+            os.rename(src, self.local(dst))
+
+        def chdir(path):
+            if not os.path.isdir(path):
+                raise OSError(errno.ENOENT, "")
+            self.cwd = "/" + os.path.relpath(path, self.root).replace(os.sep, "/")
+            self.cwd = posixpath.normpath(self.cwd)
+
+        def uname():
+            return types.SimpleNamespace(
+                sysname=self.SYSNAME,
+                nodename=self.SYSNAME,
+                release=self.RELEASE,
+                version=self.VERSION,
+                machine=self.MACHINE,
+            )
+
+        uos = self.__module(
+            "uos",
+            listdir=self.__fs(lambda p: sorted(os.listdir(p))),
+            ilistdir=self.__fs(lambda p: list(ilistdir(p))),
+            mkdir=self.__fs(os.mkdir),
+            rmdir=self.__fs(os.rmdir),
+            remove=self.__fs(remove),
+            rename=self.__fs(rename),
+            stat=self.__fs(stat),
+            statvfs=self.__fs(statvfs),
+            chdir=self.__fs(chdir),
+            getcwd=lambda: self.cwd,
+            uname=lambda: tuple(vars(uname()).values()),
+            sep="/",
+        )
+
+        return uos
+
+    def __open(self, path, mode="r", *args, **kwargs):
+        try:
+            return open(self.local(path), mode, *args, **kwargs)
+        except OSError as e:
+            raise self.__oserror(e) from None
+
+    def __write_stdout(self, data):
+
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        self.stdout.write(bytes(data))
+        return len(data)
+
+    def __print(self, *args, sep=" ", end="\n", file=None):
+
+        text = sep.join(str(a) for a in args) + end
+        self.__write_stdout(text.replace("\n", "\r\n"))
+
+    def __import(self, name, globals=None, locals=None, fromlist=(), level=0):
+
+        if name in self.shims:
+            return self.shims[name]
+
+        if name in self.modules:
+            return self.modules[name]
+
+        for path in self.shims["sys"].path:
+            source = self.local(posixpath.join(path, name + ".py"))
+            if os.path.isfile(source):
+                module = types.ModuleType(name)
+                module.__dict__["__builtins__"] = self.builtins
+                self.modules[name] = module
+
+                with open(source, "rb") as f:
+                    code = compile(f.read(), name + ".py", "exec")
+
+                exec(code, module.__dict__)
+                return module
+
+        if name in self.HOST_MODULES:
+            return __import__(name, globals, locals, fromlist, level)
+
+        raise ImportError("no module named '%s'" % name)
+
+    def execute(self, code):
+        """
+        Execute code as the raw REPL would do.
+
+        :param code:    source code (bytes)
+        :return:        tuple of (stdout, stderr) as bytes
+        """
+
+        self.stdout = io.BytesIO()
+        err = b""
+
+        try:
+            exec(compile(code, "<stdin>", "exec"), self.globals)
+        except SystemExit:
+            pass
+        except BaseException:
+            etype, evalue, tb = sys.exc_info()
+            lines = ["Traceback (most recent call last):\r\n"]
+            lines += [
+                '  File "<stdin>", line %d\r\n' % t.lineno
+                for t in traceback.extract_tb(tb)
+                if t.filename == "<stdin>"
+            ]
+            # MicroPython has no OSError subclasses
+            name = "OSError" if isinstance(evalue, OSError) else etype.__name__
+            lines += ["%s: %s\r\n" % (name, evalue)]
+            err = "".join(lines).encode("utf-8")
+
+        out = self.stdout.getvalue()
+        self.stdout = None
+
+        return out, err
+
+
+class ConSim(ConBase):
+    """
+    Connection to a simulated device, speaking the raw REPL protocol
+    (including raw-paste mode) in-process. If a baudrate is given, reads and
+    writes are delayed like on a serial line with that speed. With raw_paste
+    False, raw-paste mode is refused, with None, the firmware predates it.
+    """
+
+    BANNER = b'MicroPython %s; %s\r\nType "help()" for more information.\r\n' % (
+        SimDevice.VERSION.encode("utf-8"),
+        SimDevice.MACHINE.encode("utf-8"),
+    )
+
+    RAW_PASTE_WINDOW = 128
+
+    CONTROL = re.compile(b"[\x00-\x05]")
+
+    def __init__(self, root, baudrate=None, raw_paste=True):
+        ConBase.__init__(self)
+
+        self.device = SimDevice(root)
+        self.baudrate = baudrate
+        self.raw_paste = raw_paste
+
+        self.out = bytearray(self.BANNER + b">>> ")
+        self.raw = False
+        self.pasting = False
+        self.paste_escape = b""
+        self.window = 0
+        self.line = bytearray()
+
+    def __pace(self, nbytes):
+
+        if self.baudrate:
+            # 10 bits per byte (8N1)
+            time.sleep(nbytes * 10.0 / self.baudrate)
+
+    def __exec(self, code):
+
+        out, err = self.device.execute(bytes(code))
+        self.out += out + b"\x04" + err + b"\x04>"
+
+    def __handle(self, c):
+
+        if self.pasting:
+            if c == b"\x04":
+                self.pasting = False
+                self.out += b"\x04"
+                code, self.line = self.line, bytearray()
+                self.__exec(code)
+            else:
+                self.line += c
+                self.window -= 1
+                if self.window == 0:
+                    self.window = self.RAW_PASTE_WINDOW
+                    self.out += b"\x01"
+
+        elif self.paste_escape:
+            self.paste_escape += c
+            if len(self.paste_escape) == 3:
+                if self.paste_escape == b"\x05A\x01" and self.raw_paste:
+                    self.pasting = True
+                    self.window = self.RAW_PASTE_WINDOW
+                    self.out += b"R\x01" + struct.pack("<H", self.RAW_PASTE_WINDOW)
+                else:
+                    self.out += b"R\x00"
+                self.paste_escape = b""
+
+        elif c == b"\x01":
+            self.raw = True
+            self.line = bytearray()
+            self.out += b"\r\nraw REPL; CTRL-B to exit\r\n>"
+
+        elif c == b"\x02":
+            self.raw = False
+            self.line = bytearray()
+            self.out += b"\r\n" + self.BANNER + b">>> "
+
+        elif c == b"\x03":
+            self.line = bytearray()
+            if not self.raw:
+                self.out += b"\r\n>>> "
+
+        elif c == b"\x05" and self.raw and not self.line and self.raw_paste is not None:
+            self.paste_escape = c
+
+        elif c == b"\x04":
+            if self.raw and not self.line:
+                self.device.soft_reset()
+                self.out += b"OK\r\nMPY: soft reboot\r\nraw REPL; CTRL-B to exit\r\n>"
+            elif self.raw:
+                self.out += b"OK"
+                code, self.line = self.line, bytearray()
+                self.__exec(code)
+            else:
+                self.device.soft_reset()
+                self.out += b"\r\nMPY: soft reboot\r\n" + self.BANNER + b">>> "
+
+        elif self.raw:
+            self.line += c
+
+        elif c == b"\r":
+            code, self.line = self.line, bytearray()
+            self.out += b"\r\n"
+            out, err = self.device.execute(bytes(code))
+            self.out += out + err + b">>> "
+
+        else:
+            self.line += c
+            self.out += c
+
+    def __plain_run(self, data, start):
+        """
+        :return:    number of bytes from start on which just add to the code
+                    being received, without any control characters
+        """
+
+        if self.paste_escape or not self.raw:
+            return 0
+
+        end = len(data)
+        if self.pasting:
+            # one flow control byte is due when the window is used up
+            end = min(end, start + self.window - 1)
+
+        m = self.CONTROL.search(data, start, end)
+
+        return (m.start() if m else end) - start
+
+    def close(self):
+        pass
+
+    def read(self, size=1):
+
+        data = bytes(self.out[:size])
+        del self.out[:size]
+        self.__pace(len(data))
+
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug("sim read < %s" % str(data))
+
+        return data
+
+    def _write(self, data):
+
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug("sim write > %s" % str(data))
+
+        self.__pace(len(data))
+
+        data = bytes(data)
+        i = 0
+
+        while i < len(data):
+            n = self.__plain_run(data, i)
+
+            if n:
+                # fast path for runs of code bytes
+                self.line += data[i : i + n]
+                if self.pasting:
+                    self.window -= n
+                i += n
+            else:
+                self.__handle(data[i : i + 1])
+                i += 1
+
+        return len(data)
+
+    def inWaiting(self):
+        return len(self.out)
+
+    def wait(self, timeout):
+        # the device answers while being written to, nothing arrives later
+        return len(self.out) > 0
@@ -21,43 +21,59 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 ##
-import sys
-import telnetlib
+
+import selectors
+import socket
 import time
-from collections import deque
 
 from mp.conbase import ConBase
 from mp.conbase import ConError
 
+# telnet commands (RFC 854) which need handling on a REPL connection
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+
 
 class ConTelnet(ConBase):
-    def __init__(self, ip, user, password):
+
+    PORT = 23
+    LOGIN_TIMEOUT = 5.0
+    RECV_SIZE = 4096
+
+    def __init__(self, ip, user, password, port=PORT):
         ConBase.__init__(self)
 
-        if sys.version_info < (3, 0):
-            self.read = self.__read2
-        else:
-            self.read = self.__read3
+        # received data with the telnet commands removed, and the start of a
+        # command which was split between two packets
+        self.buf = bytearray()
+        self.cmd = bytearray()
 
-        self.tn = telnetlib.Telnet(ip)
+        try:
+            self.sock = socket.create_connection((ip, port), self.LOGIN_TIMEOUT)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except socket.error as e:
+            raise ConError(e)
+
+        self.sel = selectors.DefaultSelector()
+        self.sel.register(self.sock, selectors.EVENT_READ)
 
         if user == "":
-            self.fifo = deque()
             return
 
-        if b"Login as:" in self.tn.read_until(b"Login as:", timeout=5.0):
-            self.tn.write(bytes(user.encode("ascii")) + b"\r\n")
+        # the server reads the answer to a prompt only after sending it, so
+        # each answer goes out as soon as its prompt arrived
+        if self.__expect(b"Login as:"):
+            self.write(user.encode("ascii") + b"\r\n")
 
-            if b"Password:" in self.tn.read_until(b"Password:", timeout=5.0):
+            if self.__expect(b"Password:"):
+                self.write(password.encode("ascii") + b"\r\n")
 
-                # needed because of internal implementation details of the telnet server
-                time.sleep(0.2)
-                self.tn.write(bytes(password.encode("ascii")) + b"\r\n")
-
-                if b"for more information." in self.tn.read_until(
-                    b'Type "help()" for more information.', timeout=5.0
-                ):
-                    self.fifo = deque()
+                if self.__expect(b'Type "help()" for more information.'):
                     return
 
         raise ConError()
@@ -67,60 +83,131 @@ class ConTelnet(ConBase):
 
     def close(self):
         try:
-            self.tn.close()
+            self.sel.close()
+            self.sock.close()
         except Exception:
-            # the telnet object might not exist yet, so ignore this one
+            # the socket might not exist yet, so ignore this one
             pass
 
-    def __fill_fifo(self, size):
+    def __fill(self, timeout):
+        """
+        Wait for data from the server, and add all of it to the buffer.
+
+        :param timeout:     seconds to wait at most, None to wait forever
+        :return:            False if timeout passed without data arriving
+        """
+
+        if not self.sel.select(timeout):
+            return False
+
+        try:
+            data = self.sock.recv(self.RECV_SIZE)
+        except socket.error as e:
+            raise ConError(e)
+
+        if not data:
+            raise ConError("Connection closed by the server")
+
+        self.__parse(data)
+        return True
+
+    def __parse(self, data):
+        """
+        Add received data to the buffer, without the telnet commands in it.
+        All options the server offers or asks for are refused.
+        """
+
+        data = self.cmd + data
+        self.cmd = bytearray()
+        start = 0
+
+        while True:
+            i = data.find(IAC, start)
 
-        while len(self.fifo) < size:
+            if i < 0:
+                self.buf += data[start:]
+                return
 
-            timeout_count = 0
-            data = self.tn.read_eager()
+            self.buf += data[start:i]
+
+            if i + 1 == len(data):
+                self.cmd = data[i:]
+                return
+
+            cmd = data[i + 1]
+
+            if cmd == IAC:
+                self.buf.append(IAC)
+                start = i + 2
+
+            elif cmd in (DO, DONT, WILL, WONT):
+                if i + 2 == len(data):
+                    self.cmd = data[i:]
+                    return
+
+                # options already off are not acknowledged (RFC 854)
+                if cmd == DO:
+                    self.sock.sendall(bytes([IAC, WONT, data[i + 2]]))
+                elif cmd == WILL:
+                    self.sock.sendall(bytes([IAC, DONT, data[i + 2]]))
+
+                start = i + 3
+
+            elif cmd == SB:
+                end = data.find(bytes([IAC, SE]), i + 2)
+
+                if end < 0:
+                    self.cmd = data[i:]
+                    return
+
+                start = end + 2
 
-            if len(data):
-                self.fifo.extend(data)
             else:
-                time.sleep(0.25)
-                timeout_count += 1
+                start = i + 2
 
-    def __read2(self, size=1):
+    def __expect(self, token, timeout=LOGIN_TIMEOUT):
+        """
+        Read until token was received, and drop everything up to its end.
 
-        self.__fill_fifo(size)
+        :return:    False if token didn't arrive within timeout seconds
+        """
 
-        data = b""
-        while len(data) < size and len(self.fifo) > 0:
-            data += self.fifo.popleft()
+        deadline = time.time() + timeout
 
-        return data
+        while token not in self.buf:
+            left = deadline - time.time()
+            if left <= 0 or not self.__fill(left):
+                return False
 
-    def __read3(self, size=1):
+        del self.buf[: self.buf.index(token) + len(token)]
+        return True
 
-        self.__fill_fifo(size)
+    def read(self, size=1):
 
-        data = b""
-        while len(data) < size and len(self.fifo) > 0:
-            data += bytes([self.fifo.popleft()])
+        while len(self.buf) < size:
+            self.__fill(None)
 
+        data = bytes(self.buf[:size])
+        del self.buf[:size]
         return data
 
-    def write(self, data):
+    def _write(self, data):
+
+        try:
+            self.sock.sendall(bytes(data).replace(b"\xff", b"\xff\xff"))
+        except socket.error as e:
+            raise ConError(e)
 
-        # print("write:", data)
-        self.tn.write(data)
         return len(data)
 
     def inWaiting(self):
 
-        n_waiting = len(self.fifo)
+        self.__fill(0)
+        return len(self.buf)
+
+    def wait(self, timeout):
 
-        if not n_waiting:
-            data = self.tn.read_eager()
-            self.fifo.extend(data)
-            return len(data)
-        else:
-            return n_waiting
+        return len(self.buf) > 0 or self.__fill(timeout)
 
     def survives_soft_reset(self):
         return False
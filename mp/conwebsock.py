@@ -22,30 +22,47 @@
 # THE SOFTWARE.
 ##
 import logging
+import struct
 import threading
-import time
-from collections import deque
 
 import websocket
 
 from mp.conbase import ConBase
 from mp.conbase import ConError
 
+# file transfer protocol of WebREPL: a request, which the device answers
+# with a status before and after the file data
+WEBREPL_REQ_S = "<2sBBQLH64s"
+WEBREPL_RESP_S = "<2sH"
+WEBREPL_PUT_FILE = 1
+WEBREPL_GET_FILE = 2
+
 
 class ConWebsock(ConBase, threading.Thread):
-    def __init__(self, ip, password):
+
+    PORT = 8266
+    LOGIN_TIMEOUT = 5.0
+
+    # seconds to wait for an answer of the device during a file transfer,
+    # and bytes per frame of an upload (as webrepl_cli.py sends them)
+    FILE_TIMEOUT = 10.0
+    FILE_CHUNK_SIZE = 1024
+
+    def __init__(self, ip, password, port=PORT):
 
         ConBase.__init__(self)
         threading.Thread.__init__(self)
 
         self.daemon = True
 
-        self.fifo = deque()
-        self.fifo_lock = threading.Lock()
+        # received data, filled by the websocket thread
+        self.buf = bytearray()
+        self.cond = threading.Condition()
+        self.closed = False
 
         # websocket.enableTrace(logging.root.getEffectiveLevel() < logging.INFO)
         self.ws = websocket.WebSocketApp(
-            "ws://%s:8266" % ip,
+            "ws://%s:%d" % (ip, port),
             on_message=self.on_message,
             on_error=self.on_error,
             on_close=self.on_close,
@@ -53,87 +70,202 @@ class ConWebsock(ConBase, threading.Thread):
 
         self.start()
 
-        self.timeout = 5.0
+        self.timeout = 1.0
 
-        if b"Password:" in self.read(10, blocking=False):
+        if self.__expect(b"Password:"):
             self.ws.send(password + "\r")
-            if b"WebREPL connected" not in self.read(25, blocking=False):
-                raise ConError()
-        else:
-            raise ConError()
-
-        self.timeout = 1.0
+            if self.__expect(b"WebREPL connected"):
+                logging.info("websocket connected to ws://%s:%d" % (ip, port))
+                return
 
-        logging.info("websocket connected to ws://%s:8266" % ip)
+        self.close()
+        raise ConError()
 
     def run(self):
-        self.ws.run_forever()
+        # frames are passed on as bytes, text frames are not decoded either,
+        # since the REPL output might be cut within a UTF-8 sequence
+        self.ws.run_forever(skip_utf8_validation=True)
+        self.__closed()
 
     def __del__(self):
         self.close()
 
+    def __closed(self):
+
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
     def on_message(self, ws, message):
-        self.fifo.extend(message)
 
-        try:
-            self.fifo_lock.release()
-        except:
-            pass
+        if not isinstance(message, bytes):
+            message = message.encode("utf-8")
+
+        with self.cond:
+            self.buf += message
+            self.cond.notify_all()
 
     def on_error(self, ws, error):
         logging.error("websocket error: %s" % error)
 
-        try:
-            self.fifo_lock.release()
-        except:
-            pass
-
-    def on_close(self, ws):
+    def on_close(self, ws, *args):
+        # depending on the version of websocket-client, the close status and
+        # message are passed too
         logging.info("websocket closed")
-
-        try:
-            self.fifo_lock.release()
-        except:
-            pass
+        self.__closed()
 
     def close(self):
         try:
             self.ws.close()
+            # the websocket thread might keep waiting on the closed socket
+            # until its select times out, so don't wait for it too long
+            self.join(self.timeout)
+        except Exception:
+            # the thread might not be started yet, so ignore this one
+            pass
 
-            try:
-                self.fifo_lock.release()
-            except:
-                pass
+    def __expect(self, token, timeout=LOGIN_TIMEOUT):
+        """
+        Read until token was received, and drop everything up to its end.
 
-            self.join()
-        except Exception:
-            try:
-                self.fifo_lock.release()
-            except:
-                pass
+        :return:    False if token didn't arrive within timeout seconds
+        """
+
+        with self.cond:
+            self.cond.wait_for(lambda: token in self.buf or self.closed, timeout)
 
-    def read(self, size=1, blocking=True):
+            if token not in self.buf:
+                return False
 
-        data = ""
+            del self.buf[: self.buf.index(token) + len(token)]
+            return True
 
-        tstart = time.time()
+    def __take(self, size, timeout):
 
-        while (len(data) < size) and (time.time() - tstart < self.timeout):
+        with self.cond:
+            self.cond.wait_for(lambda: len(self.buf) >= size or self.closed, timeout)
 
-            if len(self.fifo) > 0:
-                data += self.fifo.popleft()
-            elif blocking:
-                self.fifo_lock.acquire()
+            data = bytes(self.buf[:size])
+            del self.buf[:size]
 
-        return data.encode("utf-8")
+        return data
 
-    def write(self, data):
+    def read(self, size=1):
+        return self.__take(size, self.timeout)
+
+    def _write(self, data):
 
         self.ws.send(data)
         return len(data)
 
     def inWaiting(self):
-        return len(self.fifo)
+        return len(self.buf)
+
+    def wait(self, timeout):
+
+        with self.cond:
+            self.cond.wait_for(lambda: len(self.buf) or self.closed, timeout)
+            return len(self.buf) > 0
 
     def survives_soft_reset(self):
         return False
+
+    def supports_file_transfer(self):
+        return True
+
+    def __file_read(self, size):
+
+        data = self.__take(size, self.FILE_TIMEOUT)
+
+        if len(data) < size:
+            raise ConError("No answer to WebREPL file transfer")
+
+        return data
+
+    def __file_status(self):
+        """
+        :return:    True if the device reported success
+        """
+
+        sig, status = struct.unpack(WEBREPL_RESP_S, self.__file_read(4))
+
+        if sig != b"WB":
+            raise ConError("Invalid answer to WebREPL file transfer: %r" % sig)
+
+        return status == 0
+
+    def __file_request(self, op, path, size=0):
+        """
+        :return:    True if the device accepted the request, False if it
+                    refused or the file name doesn't fit into the request
+        """
+
+        name = path.encode("utf-8")
+
+        if len(name) > 64:
+            logging.info("file name too long for WebREPL: %s" % path)
+            return False
+
+        self.ws.send(
+            struct.pack(WEBREPL_REQ_S, b"WA", op, 0, 0, size, len(name), name),
+            websocket.ABNF.OPCODE_BINARY,
+        )
+
+        return self.__file_status()
+
+    def put_file(self, path, src, size, progress=None):
+        """
+        Write a remote file with the file transfer protocol of WebREPL.
+
+        :param path:        remote file name (full path)
+        :param src:         binary file to read the data from
+        :param size:        number of bytes to read from src
+        :param progress:    called with the number of bytes of each frame sent
+        :return:            False if the device refused (e.g. it couldn't
+                            open the file), or the file name is too long
+        """
+
+        if not self.__file_request(WEBREPL_PUT_FILE, path, size):
+            return False
+
+        while size:
+            data = src.read(min(size, self.FILE_CHUNK_SIZE))
+            if not data:
+                raise ConError("Local file shrank during upload")
+
+            self.ws.send(data, websocket.ABNF.OPCODE_BINARY)
+            size -= len(data)
+
+            if progress is not None:
+                progress(len(data))
+
+        return self.__file_status()
+
+    def get_file(self, path, write, progress=None):
+        """
+        Read a remote file with the file transfer protocol of WebREPL.
+
+        :param path:        remote file name (full path)
+        :param write:       called with each chunk of data received
+        :param progress:    called with the number of bytes of each chunk
+        :return:            False if the device refused (e.g. it couldn't
+                            open the file), or the file name is too long
+        """
+
+        if not self.__file_request(WEBREPL_GET_FILE, path):
+            return False
+
+        while True:
+            # the device sends the next chunk when asked for it
+            self.ws.send(b"\0", websocket.ABNF.OPCODE_BINARY)
+            size = struct.unpack("<H", self.__file_read(2))[0]
+
+            if not size:
+                break
+
+            write(self.__file_read(size))
+
+            if progress is not None:
+                progress(size)
+
+        return self.__file_status()
@@ -0,0 +1,291 @@
+##
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Stefan Wendler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+import contextlib
+import getpass
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+# A daemon keeps the connections to devices open between invocations of
+# "mpfshell -c". It runs the commands sent by clients over a UNIX socket one
+# request at a time, with a shell which keeps its file explorers in a pool.
+
+# seconds the daemon keeps running without requests
+IDLE_TIMEOUT = 600
+
+# seconds a client waits for a daemon it started to come up
+START_TIMEOUT = 5.0
+
+
+def socket_path():
+    """
+    :return:    default path of the socket, private to the user
+    """
+
+    base = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(base, "mpfshell-%s.sock" % getpass.getuser())
+
+
+class _ClientWriter(object):
+    """
+    File-like object sending everything written to it to the client.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def write(self, s):
+
+        if s:
+            _send(self.conn, {"out": s})
+        return len(s)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+def _send(conn, msg):
+    conn.sendall(json.dumps(msg).encode("utf-8") + b"\n")
+
+
+def _messages(conn):
+    """
+    Generator yielding the messages received on conn, one JSON object per
+    line.
+    """
+
+    buf = b""
+
+    while True:
+        data = conn.recv(4096)
+        if not data:
+            return
+
+        buf += data
+        while b"\n" in buf:
+            line, buf = buf.split(b"\n", 1)
+            yield json.loads(line.decode("utf-8"))
+
+
+class Daemon(object):
+    def __init__(self, shell, path=None, idle_timeout=IDLE_TIMEOUT):
+        """
+        :param shell:           MpFileShell to run the commands with
+        :param path:            path of the UNIX socket to listen on
+        :param idle_timeout:    seconds without requests after which to exit
+        """
+
+        self.shell = shell
+        self.shell.pool = {}
+        self.path = path or socket_path()
+        self.idle_timeout = idle_timeout
+        self.running = False
+
+    def __listen(self):
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        # a socket left behind by a daemon which died is in the way
+        if os.path.exists(self.path):
+            try:
+                _connect(self.path).close()
+            except socket.error:
+                os.remove(self.path)
+            else:
+                raise IOError("daemon already running on %s" % self.path)
+
+        umask = os.umask(0o077)
+        try:
+            sock.bind(self.path)
+        finally:
+            os.umask(umask)
+
+        sock.listen(5)
+        sock.settimeout(self.idle_timeout)
+        return sock
+
+    def __handle(self, conn):
+
+        for request in _messages(conn):
+
+            if request.get("stop"):
+                self.running = False
+                _send(conn, {"exit": 0})
+                return
+
+            out = _ClientWriter(conn)
+
+            # cmd.Cmd writes help and unknown commands to its own stdout
+            stdout, self.shell.stdout = self.shell.stdout, out
+            self.shell.errors = 0
+
+            try:
+                os.chdir(request["cwd"])
+
+                with contextlib.redirect_stdout(out):
+                    for line in request["commands"]:
+                        self.shell.onecmd(line)
+                    # keep the connection in the pool for the next request
+                    self.shell.onecmd("close")
+            except Exception as e:
+                logging.exception(e)
+                _send(conn, {"out": "\n%s\n\n" % e})
+                self.shell.errors += 1
+            finally:
+                self.shell.stdout = stdout
+
+            _send(conn, {"exit": 1 if self.shell.errors else 0})
+            return
+
+    def serve(self):
+        """
+        Serve requests until stopped or idle for too long.
+        """
+
+        sock = self.__listen()
+        self.running = True
+        logging.info("daemon listening on %s" % self.path)
+
+        try:
+            while self.running:
+                try:
+                    conn, _ = sock.accept()
+                except socket.timeout:
+                    logging.info("daemon idle for %ds, exiting" % self.idle_timeout)
+                    break
+
+                conn.settimeout(None)
+                try:
+                    self.__handle(conn)
+                except (socket.error, ValueError) as e:
+                    logging.warning("request failed: %s" % e)
+                finally:
+                    conn.close()
+        finally:
+            sock.close()
+            os.remove(self.path)
+
+            for fe, _ in self.shell.pool.values():
+                fe.close()
+            self.shell.pool.clear()
+
+
+def _connect(path):
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    return sock
+
+
+def connect(path=None, start_args=None):
+    """
+    Connect to the daemon, starting it if it isn't running.
+
+    :param path:        path of the socket
+    :param start_args:  command line arguments for mpfshell to start the
+                        daemon with, None to not start one
+    :return:            connected socket
+    """
+
+    path = path or socket_path()
+
+    try:
+        return _connect(path)
+    except socket.error as e:
+        if start_args is None:
+            raise e
+
+    logging.info("starting daemon on %s" % path)
+    subprocess.Popen(
+        [sys.executable, "-m", "mp.mpfshell", "--serve", "--socket", path] + start_args,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+    start = time.time()
+
+    while True:
+        try:
+            return _connect(path)
+        except socket.error as e:
+            if time.time() - start > START_TIMEOUT:
+                raise e
+            time.sleep(0.05)
+
+
+def run(commands, path=None, start_args=None, out=None):
+    """
+    Let the daemon run shell commands, in the current directory.
+
+    :return:    exit status, 1 if any command failed
+    """
+
+    out = out or sys.stdout
+    sock = connect(path, start_args)
+
+    try:
+        _send(sock, {"cwd": os.getcwd(), "commands": commands})
+
+        for msg in _messages(sock):
+            if "out" in msg:
+                out.write(msg["out"])
+                out.flush()
+            elif "exit" in msg:
+                return msg["exit"]
+    finally:
+        sock.close()
+
+    return 1
+
+
+def stop(path=None):
+    """
+    Stop the daemon, if it is running.
+
+    :return:    True if a daemon was stopped
+    """
+
+    try:
+        sock = _connect(path or socket_path())
+    except socket.error:
+        return False
+
+    try:
+        _send(sock, {"stop": True})
+        for _ in _messages(sock):
+            break
+    finally:
+        sock.close()
+
+    return True
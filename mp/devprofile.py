@@ -0,0 +1,151 @@
+##
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Stefan Wendler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+import json
+import logging
+import os
+import time
+
+# Capability profiles of devices are kept between sessions in a local cache
+# directory. A profile is keyed by the unique id of the device, and only valid
+# for the firmware it was recorded with.
+
+# bump when the layout of the profiles changes, older ones are ignored
+FORMAT = 1
+
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "mpfshell",
+)
+
+# device code printing the unique id of the device (None if the port has no
+# machine.unique_id()) and the uname tuple
+IDENTIFY = (
+    "try:\n"
+    "    import machine\n"
+    "    u = ubinascii.hexlify(machine.unique_id()).decode()\n"
+    "except Exception:\n"
+    "    u = None\n"
+    "print(repr((u, tuple(uos.uname()))))"
+)
+
+# bytes the device prints to measure the speed of the link
+LINK_TEST_SIZE = 2048
+
+
+def firmware(uname):
+    """
+    :return:    firmware version string from a uname tuple
+    """
+
+    return "%s %s" % (uname[2], uname[3])
+
+
+def _path(cache_dir, unique_id):
+    return os.path.join(cache_dir, "%s.json" % unique_id)
+
+
+def new(unique_id, uname, facts):
+    """
+    :return:    profile of the device, for the facts found by probing it
+    """
+
+    return {
+        "format": FORMAT,
+        "unique_id": unique_id,
+        "firmware": firmware(uname),
+        "machine": uname[4],
+        "facts": facts,
+        "raw_paste": None,
+        "chunk_size": None,
+        "link_latency": None,
+        "link_speed": None,
+        "updated": None,
+    }
+
+
+def load(cache_dir, unique_id, uname):
+    """
+    :return:    the profile of the device, None if there is none for the
+                firmware it runs
+    """
+
+    if unique_id is None:
+        return None
+
+    try:
+        with open(_path(cache_dir, unique_id)) as f:
+            profile = json.load(f)
+    except (IOError, ValueError):
+        return None
+
+    if profile.get("format") != FORMAT or profile.get("firmware") != firmware(uname):
+        logging.info("profile of %s is outdated" % unique_id)
+        return None
+
+    logging.info("loaded profile of %s" % unique_id)
+    return profile
+
+
+def save(cache_dir, profile):
+
+    profile["updated"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    path = _path(cache_dir, profile["unique_id"])
+
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        # write a complete file, or none
+        with open(path + ".tmp", "w") as f:
+            json.dump(profile, f, indent=2, sort_keys=True)
+        os.replace(path + ".tmp", path)
+    except (IOError, OSError) as e:
+        logging.warning("could not save profile %s: %s" % (path, e))
+
+
+def describe(profile):
+    """
+    :return:    lines describing the profile for humans
+    """
+
+    facts = profile["facts"]
+
+    def known(value, fmt="%s"):
+        return "unknown" if value is None else fmt % value
+
+    return [
+        "device:       %s (%s)" % (profile["unique_id"], profile["machine"]),
+        "firmware:     %s" % profile["firmware"],
+        "raw-paste:    %s" % known(profile["raw_paste"]),
+        "codecs:       %s" % ", ".join(facts["codecs"]),
+        "hashes:       %s" % ", ".join(facts["hashes"]),
+        "compression:  %s" % (", ".join(facts["compression"]) or "none"),
+        "heap size:    %d bytes" % facts["heap_size"],
+        "free memory:  %d bytes" % facts["mem_free"],
+        "block size:   %d bytes" % facts["block_size"],
+        "chunk size:   %s" % known(profile["chunk_size"], "%d bytes"),
+        "link latency: %s" % known(profile["link_latency"], "%.1f ms"),
+        "link speed:   %s" % known(profile["link_speed"], "%d bytes/s"),
+        "updated:      %s" % profile["updated"],
+    ]
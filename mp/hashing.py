@@ -0,0 +1,280 @@
+##
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Stefan Wendler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+import hashlib
+import zlib
+
+
+class Hash(object):
+    """
+    A content hash which can be computed the same way on the host and on the
+    device. Digests are short hex strings.
+    """
+
+    name = None
+
+    # device code making the hash available
+    remote_import = ""
+
+    def remote_new(self, var):
+        """
+        :return:    device statement initializing a hash in var
+        """
+        raise NotImplementedError
+
+    def remote_update(self, var, data):
+        """
+        :return:    device statement feeding the bytes in data to the hash in var
+        """
+        raise NotImplementedError
+
+    def remote_digest(self, var):
+        """
+        :return:    device expression for the hex digest (str) of the hash in var
+        """
+        raise NotImplementedError
+
+    def new(self):
+        """
+        :return:    host side hash object with update() and digest()
+        """
+        raise NotImplementedError
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.name)
+
+
+class ShaHash(Hash):
+    """
+    SHA hash from (u)hashlib, truncated to 64 bits.
+    """
+
+    remote_import = (
+        "try:\n    import uhashlib\nexcept ImportError:\n    import hashlib as uhashlib"
+    )
+
+    class _Local(object):
+        def __init__(self, name):
+            self.h = hashlib.new(name)
+
+        def update(self, data):
+            self.h.update(data)
+
+        def digest(self):
+            return self.h.hexdigest()[:16]
+
+    def __init__(self, name):
+        self.name = name
+
+    def remote_new(self, var):
+        return "%s = uhashlib.%s()" % (var, self.name)
+
+    def remote_update(self, var, data):
+        return "%s.update(%s)" % (var, data)
+
+    def remote_digest(self, var):
+        return "ubinascii.hexlify(%s.digest()[:8]).decode()" % var
+
+    def new(self):
+        return self._Local(self.name)
+
+
+class Crc32Hash(Hash):
+    """
+    CRC32 from (u)binascii, for firmwares built without hashlib.
+    """
+
+    name = "crc32"
+
+    class _Local(object):
+        def __init__(self):
+            self.h = 0
+
+        def update(self, data):
+            self.h = zlib.crc32(data, self.h)
+
+        def digest(self):
+            return "%08x" % (self.h & 0xFFFFFFFF)
+
+    def remote_new(self, var):
+        return "%s = 0" % var
+
+    def remote_update(self, var, data):
+        return "%s = ubinascii.crc32(%s, %s)" % (var, data, var)
+
+    def remote_digest(self, var):
+        return "'%%08x' %% (%s & 0xffffffff)" % var
+
+    def new(self):
+        return self._Local()
+
+
+# all known hashes, in order of preference
+HASHES = [ShaHash("sha256"), ShaHash("sha1"), Crc32Hash()]
+
+
+# device code printing the names of the available hashes
+PROBE = (
+    "r = []\n"
+    "try:\n"
+    "    import uhashlib\n"
+    "except ImportError:\n"
+    "    try:\n"
+    "        import hashlib as uhashlib\n"
+    "    except ImportError:\n"
+    "        uhashlib = None\n"
+    "r += [n for n in ('sha256', 'sha1') if hasattr(uhashlib, n)]\n"
+    "if hasattr(ubinascii, 'crc32'):\n"
+    "    r.append('crc32')\n"
+    "print(r)"
+)
+
+
+def supported(names):
+    """
+    :param names:   hashes available on the device
+    :return:        usable hashes, in order of preference
+    """
+
+    return [h for h in HASHES if h.name in names]
+
+
+def remote_block_hashes(hash, path, block_size):
+    """
+    :return:    device code printing one digest line per block of the file at path
+    """
+
+    return (
+        "%s\n"
+        "with open('%s', 'rb') as hf:\n"
+        "    while True:\n"
+        "        b = hf.read(%d)\n"
+        "        if not b:\n"
+        "            break\n"
+        "        %s\n"
+        "        %s\n"
+        "        sys.stdout.write(%s + '\\n')"
+        % (
+            hash.remote_import,
+            path,
+            block_size,
+            hash.remote_new("h"),
+            hash.remote_update("h", "b"),
+            hash.remote_digest("h"),
+        )
+    )
+
+
+def block_hashes(hash, f, block_size):
+    """
+    :param f:   binary file to hash, read from its current position to the end
+    :return:    list of digests, one per block
+    """
+
+    digests = []
+
+    while True:
+        b = f.read(block_size)
+        if not b:
+            break
+
+        h = hash.new()
+        h.update(b)
+        digests.append(h.digest())
+
+    return digests
+
+
+def remote_file_hash(hash, block_size, name="hs", imports=True):
+    """
+    :param imports: import the hash module first
+    :return:        device code defining a function name(path, size=-1),
+                    which returns the digest of the file at path (or of its
+                    first size bytes)
+    """
+
+    return (
+        "%s"
+        "def %s(p, n=-1):\n"
+        "    %s\n"
+        "    with open(p, 'rb') as hf:\n"
+        "        while n:\n"
+        "            b = hf.read(%d if n < 0 else min(n, %d))\n"
+        "            if not b:\n"
+        "                break\n"
+        "            n -= len(b)\n"
+        "            %s\n"
+        "    return %s"
+        % (
+            hash.remote_import + "\n" if imports else "",
+            name,
+            hash.remote_new("h"),
+            block_size,
+            block_size,
+            hash.remote_update("h", "b"),
+            hash.remote_digest("h"),
+        )
+    )
+
+
+def file_hash(hash, path, block_size=4096, size=-1):
+    """
+    :param size:    only hash the first size bytes (all if negative)
+    :return:        digest of the local file at path
+    """
+
+    h = hash.new()
+
+    with open(path, "rb") as f:
+        while size:
+            b = f.read(block_size if size < 0 else min(size, block_size))
+            if not b:
+                break
+            size -= len(b)
+            h.update(b)
+
+    return h.digest()
+
+
+def changed_runs(local, remote, block_size):
+    """
+    Compare two lists of block digests.
+
+    :return:    list of (offset, length) tuples, covering runs of consecutive
+                blocks which differ in local, or which are missing in remote
+    """
+
+    runs = []
+
+    for i, digest in enumerate(local):
+        if i < len(remote) and remote[i] == digest:
+            continue
+
+        offset = i * block_size
+
+        if runs and runs[-1][0] + runs[-1][1] == offset:
+            runs[-1] = (runs[-1][0], runs[-1][1] + block_size)
+        else:
+            runs.append((offset, block_size))
+
+    return runs
@@ -0,0 +1,175 @@
+##
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Stefan Wendler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+import sys
+import time
+
+
+def format_size(n):
+    """
+    :return:    human readable byte count, e.g. "12.3 KB"
+    """
+
+    for unit in ("B", "KB", "MB"):
+        if n < 1024 or unit == "MB":
+            break
+        n /= 1024.0
+
+    return ("%d %s" if unit == "B" else "%.1f %s") % (n, unit)
+
+
+class TransferStats(object):
+    """
+    Counters for one file transfer, or for a batch of them.
+    """
+
+    def __init__(self, kind, name, total=None, key=None):
+        """
+        :param kind:    "put", "get" or "batch"
+        :param name:    file (or command) the transfer is about
+        :param total:   expected number of bytes, if known
+        :param key:     identifies the transfer when it is retried
+        """
+
+        self.kind = kind
+        self.name = name
+        self.total = total
+        self.key = key
+        self.bytes = 0
+        self.chunks = 0
+        self.round_trips = 0
+        self.retries = 0
+        self.files = 0
+        self.start = time.time()
+        self.end = None
+
+    @property
+    def elapsed(self):
+        return (self.end or time.time()) - self.start
+
+    @property
+    def rate(self):
+        """
+        :return:    effective throughput in bytes per second
+        """
+
+        elapsed = self.elapsed
+        return self.bytes / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        """
+        :return:    estimated seconds left, None if unknown
+        """
+
+        rate = self.rate
+        if not self.total or not rate:
+            return None
+
+        return max(self.total - self.bytes, 0) / rate
+
+    def __str__(self):
+
+        s = "%s %s: %s in %.2fs (%s/s), %d chunks, %d round trips, %d retries" % (
+            self.kind,
+            self.name,
+            format_size(self.bytes),
+            self.elapsed,
+            format_size(self.rate),
+            self.chunks,
+            self.round_trips,
+            self.retries,
+        )
+
+        if self.kind == "batch":
+            s += ", %d files" % self.files
+
+        return s
+
+
+class TransferListener(object):
+    """
+    Base class for objects which want to be notified about transfers, see
+    MpFileExplorer.add_listener(). Batch transfers (e.g. mput) report a
+    TransferStats of kind "batch" around the ones of the single files.
+    """
+
+    def started(self, stats):
+        pass
+
+    def progress(self, stats):
+        pass
+
+    def finished(self, stats):
+        pass
+
+
+class StatusLine(TransferListener):
+    """
+    Shows a live status line with throughput and ETA of the running transfer.
+    """
+
+    INTERVAL = 0.2
+
+    def __init__(self, out=None):
+
+        self.out = out or sys.stdout
+        self.__shown = 0
+        self.__last = 0
+
+    def __show(self, line):
+
+        self.out.write("\r%s%s\r" % (line, " " * max(self.__shown - len(line), 0)))
+        self.out.flush()
+        self.__shown = len(line)
+
+    def progress(self, stats):
+
+        if stats.kind == "batch" or time.time() - self.__last < self.INTERVAL:
+            return
+
+        self.__last = time.time()
+
+        line = " %s %s %s" % (stats.kind, stats.name, format_size(stats.bytes))
+        if stats.total:
+            line += "/%s" % format_size(stats.total)
+        line += " %s/s" % format_size(stats.rate)
+
+        eta = stats.eta
+        if eta is not None:
+            line += " ETA %d:%02d" % (eta // 60, eta % 60)
+
+        self.__show(line)
+
+    def __clear(self):
+
+        if self.__shown:
+            self.__show("")
+            self.__shown = 0
+
+    def started(self, stats):
+        # a failed transfer leaves its line behind
+        self.__clear()
+
+    def finished(self, stats):
+        self.__clear()
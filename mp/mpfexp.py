@@ -23,18 +23,30 @@
 ##
 import ast
 import binascii
+import contextlib
 import getpass
+import io
 import logging
 import os
 import posixpath  # force posix-style slashes
 import re
 import sre_constants
 import subprocess
-
+import time
+
+from mp import agent
+from mp import codec
+from mp import compression
+from mp import devprofile
+from mp import hashing
+from mp.chunksize import AdaptiveChunkSize
 from mp.conbase import ConError
 from mp.conserial import ConSerial
+from mp.consim import ConSim
 from mp.contelnet import ConTelnet
 from mp.conwebsock import ConWebsock
+from mp.metrics import TransferStats
+from mp.profiler import profiled
 from mp.pyboard import Pyboard
 from mp.pyboard import PyboardError
 from mp.retry import retry
@@ -55,6 +67,10 @@ def _was_file_not_existing(exception):
     return any(err in stre for err in ("ENOENT", "ENODEV", "EINVAL", "OSError:"))
 
 
+# best chunk size found so far per connection string
+_chunk_sizes = {}
+
+
 class RemoteIOError(IOError):
     pass
 
@@ -62,28 +78,82 @@ class RemoteIOError(IOError):
 class MpFileExplorer(Pyboard):
 
     BIN_CHUNK_SIZE = 64
+    MAX_CHUNK_SIZE = 4096
+    RAW_REPL_MAX_CHUNK_SIZE = 256
+    DELTA_BLOCK_SIZE = 512
+    COMPRESS_MIN_SIZE = 512
+    TEMP_SUFFIX = ".mpfs~"
+    SYNC_MANIFEST = ".mpfs-manifest.json"
     MAX_TRIES = 3
 
-    def __init__(self, constr, reset=False):
+    def __init__(
+        self,
+        constr,
+        reset=False,
+        compress=False,
+        use_agent=False,
+        profiler=None,
+        profiles=None,
+        low_latency=False,
+    ):
         """
         Supports the following connection strings.
 
             ser:/dev/ttyUSB1,<baudrate>
-            tn:192.168.1.101,<login>,<passwd>
-            ws:192.168.1.102,<passwd>
+            tn:192.168.1.101[:<port>],<login>,<passwd>
+            ws:192.168.1.102[:<port>],<passwd>
+            sim:/tmp/device,<baudrate>
 
         :param constr:      Connection string as defined above.
+        :param compress:    Compress file transfers if the device supports it.
+        :param use_agent:   Install a helper module on the device, which turns
+                            most operations into short function calls.
+        :param profiler:    mp.profiler.Profiler recording the time spent in
+                            each operation and its phases.
+        :param profiles:    Directory to keep a profile of the capabilities of
+                            each device in (see mp.devprofile), None to probe
+                            them on each connect.
+        :param low_latency: Tune serial connections for latency (see
+                            mp.conserial).
         """
 
         self.reset = reset
+        self.low_latency = low_latency
+        self.compress = compress
+        self.use_agent = use_agent
+        self.constr = constr
+        self.profiler = profiler
+        self.profiles = profiles
+        self.profile = None
 
         try:
-            Pyboard.__init__(self, self.__con_from_str(constr))
+            start = time.time()
+            with self.span("connect"):
+                con = self.__con_from_str(constr)
+            Pyboard.__init__(self, con, profiler)
         except Exception as e:
             raise ConError(e)
 
+        # seconds spent in each phase of connecting
+        self.connect_times = {"open": time.time() - start}
+
         self.dir = None
         self.sysname = None
+        self.facts = None
+        self.codecs = None
+        self.codec = None
+        self.chunk_size = None
+        self.hash = None
+        self.compression = None
+        self.agent = False
+        # use the file transfer protocol of the connection, if it has one
+        self.native_transfer = con.supports_file_transfer()
+        self.listeners = []
+        self.last_transfer = None
+        self.last_batch = None
+        self.__interrupted = None
+        self.__failed = None
+        self.__running = []
         self.setup()
 
     def __del__(self):
@@ -102,7 +172,7 @@ class MpFileExplorer(Pyboard):
 
         con = None
 
-        proto, target = constr.split(":")
+        proto, target = constr.split(":", 1)
         params = target.split(",")
 
         if proto.strip(" ") == "ser":
@@ -113,11 +183,21 @@ class MpFileExplorer(Pyboard):
             else:
                 baudrate = 115200
 
-            con = ConSerial(port=port, baudrate=baudrate, reset=self.reset)
+            con = ConSerial(
+                port=port,
+                baudrate=baudrate,
+                reset=self.reset,
+                low_latency=self.low_latency,
+            )
 
         elif proto.strip(" ") == "tn":
 
             host = params[0].strip(" ")
+            port = ConTelnet.PORT
+
+            if ":" in host:
+                host, port = host.rsplit(":", 1)
+                port = int(port)
 
             if len(params) > 1:
                 login = params[1].strip(" ")
@@ -131,29 +211,544 @@ class MpFileExplorer(Pyboard):
                 passwd = getpass.getpass("telnet passwd: ")
 
             # print("telnet connection to: %s, %s, %s" % (host, login, passwd))
-            con = ConTelnet(ip=host, user=login, password=passwd)
+            con = ConTelnet(ip=host, user=login, password=passwd, port=port)
 
         elif proto.strip(" ") == "ws":
 
             host = params[0].strip(" ")
+            port = ConWebsock.PORT
+
+            if ":" in host:
+                host, port = host.rsplit(":", 1)
+                port = int(port)
 
             if len(params) > 1:
                 passwd = params[1].strip(" ")
             else:
                 passwd = getpass.getpass("webrepl passwd: ")
 
-            con = ConWebsock(host, passwd)
+            con = ConWebsock(host, passwd, port)
+
+        elif proto.strip(" ") == "sim":
+
+            root = params[0].strip(" ")
+
+            if len(params) > 1:
+                baudrate = int(params[1].strip(" "))
+            else:
+                baudrate = None
+
+            con = ConSim(root, baudrate)
 
         return con
 
+    def add_listener(self, listener):
+        """
+        :param listener:    metrics.TransferListener to notify about transfers
+        """
+
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+
+        self.listeners.remove(listener)
+
+    def __notify(self, event, stats):
+
+        for listener in self.listeners:
+            getattr(listener, event)(stats)
+
+    def exec_(self, command, data_consumer=None):
+
+        for stats in self.__running:
+            stats.round_trips += 1
+
+        return Pyboard.exec_(self, command, data_consumer)
+
+    @contextlib.contextmanager
+    def __transfer(self, kind, name, key=None):
+        """
+        Context for one file transfer (kind "put" or "get") or for a batch of
+        them (kind "batch"), yielding its TransferStats. A transfer with the
+        same key as the last failed one is a retry, and keeps its stats.
+        """
+
+        stats = self.__failed
+
+        if key is not None and stats is not None and stats.key == key:
+            stats.retries += 1
+        else:
+            stats = TransferStats(kind, name, key=key)
+            for batch in self.__running:
+                batch.files += 1
+            self.__notify("started", stats)
+
+        if key is not None:
+            self.__failed = stats
+
+        self.__running.append(stats)
+        try:
+            yield stats
+        finally:
+            self.__running.remove(stats)
+
+        if key is not None:
+            self.__failed = None
+
+        stats.end = time.time()
+        if kind == "batch":
+            self.last_batch = stats
+        else:
+            self.last_transfer = stats
+        self.__notify("finished", stats)
+
+    def __set_total(self, total):
+        """
+        Set the number of bytes the running file transfer still has to move.
+        """
+
+        stats = self.__running[-1]
+        stats.total = stats.bytes + total
+
+    def __progress(self, nbytes, chunks=1):
+
+        for stats in self.__running:
+            stats.bytes += nbytes
+            stats.chunks += chunks
+            self.__notify("progress", stats)
+
+    def __retried(self):
+
+        for stats in self.__running:
+            stats.retries += 1
+
     def _fqn(self, name):
         return posixpath.join(self.dir, name)
 
+    def __probe_setup(self, facts=True, identify=False):
+        """
+        Do everything setup() needs from the device in one round trip: import
+        the modules used by all commands, get the current directory and, if
+        facts is set, find out about the device (uname, heap and free memory,
+        file system block size, and the modules available for codecs, hashes
+        and compression). If identify is set, its unique id and uname are
+        probed, with the agent its installed version.
+
+        :return:    tuple (cwd, (unique id, uname) or None, dict of facts or
+                    None, agent version or None)
+        """
+
+        code = (
+            "try:\n    import uos\nexcept ImportError:\n    import os as uos\n"
+            "import sys\n"
+            "try:\n    import ubinascii\n"
+            "except ImportError:\n    import binascii as ubinascii\n"
+            "print(repr(uos.getcwd()))\n"
+        )
+
+        if identify:
+            code += devprofile.IDENTIFY + "\n"
+
+        if facts:
+            code += (
+                "import gc\n"
+                "try:\n"
+                "    b = uos.statvfs(uos.getcwd())[0]\n"
+                "except Exception:\n"
+                "    b = 0\n"
+                "m = (gc.mem_free(), gc.mem_alloc())\n"
+                "print(repr((tuple(uos.uname()), m, b)))\n"
+                "print(%s)\n%s\n%s\n"
+                % (codec.probe_expression(), hashing.PROBE, compression.PROBE)
+            )
+
+        if self.use_agent:
+            code += agent.PROBE
+
+        lines = [
+            ast.literal_eval(line)
+            for line in self.exec_(code).decode("utf-8").splitlines()
+        ]
+        cwd = lines.pop(0)
+        ident = lines.pop(0) if identify else None
+
+        if facts:
+            (uname, (mem_free, mem_alloc), bsize), codecs, hashes, names = lines[:4]
+            del lines[:4]
+            facts = {
+                "sysname": uname[0],
+                "release": uname[2],
+                "version": uname[3],
+                "machine": uname[4],
+                "mem_free": mem_free,
+                "heap_size": mem_free + mem_alloc,
+                "block_size": bsize,
+                "codecs": codecs,
+                "hashes": hashes,
+                "compression": names,
+            }
+            logging.info("device facts: %s" % facts)
+        else:
+            facts = None
+
+        return cwd, ident, facts, lines[0] if self.use_agent else None
+
+    def __setup_facts(self):
+        """
+        Take the facts about the device from its profile, or probe them.
+
+        :return:    tuple (cwd, agent version or None)
+        """
+
+        ident = None
+
+        if self.profiles is not None:
+            cwd, ident, _, installed = self.__probe_setup(facts=False, identify=True)
+            self.profile = devprofile.load(self.profiles, *ident)
+
+            if self.profile is not None:
+                self.facts = self.profile["facts"]
+                if self.profile["chunk_size"]:
+                    _chunk_sizes.setdefault(self.constr, self.profile["chunk_size"])
+                return cwd, installed
+
+        cwd, _, self.facts, installed = self.__probe_setup()
+
+        if ident is not None and ident[0] is not None:
+            self.profile = devprofile.new(ident[0], ident[1], self.facts)
+            self.__measure_link()
+
+        return cwd, installed
+
+    def __measure_link(self):
+        """
+        Measure round trip time and speed of the link for the profile.
+        """
+
+        start = time.time()
+        self.exec_("pass")
+        latency = time.time() - start
+
+        start = time.time()
+        self.exec_("print('x' * %d)" % devprofile.LINK_TEST_SIZE)
+        elapsed = time.time() - start
+
+        # without the round trip, if it can be told apart
+        if elapsed > latency:
+            elapsed -= latency
+
+        self.profile["link_latency"] = latency * 1000
+        self.profile["link_speed"] = devprofile.LINK_TEST_SIZE / elapsed
+
+    def save_profile(self):
+        """
+        Store what was learned about the device in its profile.
+        """
+
+        if self.profile is None:
+            return
+
+        # for information only, the first exec of each session tries
+        # raw-paste mode anyway, and that is before the device is identified
+        self.profile["raw_paste"] = self.use_raw_paste
+        if self.chunk_size is not None:
+            self.profile["chunk_size"] = _chunk_sizes.get(
+                self.constr, self.chunk_size.best_size
+            )
+
+        devprofile.save(self.profiles, self.profile)
+
+    def refresh_profile(self):
+        """
+        Probe the device again, and replace its profile.
+        """
+
+        if self.profiles is None:
+            return
+
+        _, ident, self.facts, _ = self.__probe_setup(identify=True)
+        self.profile = None
+
+        if ident[0] is not None:
+            self.profile = devprofile.new(ident[0], ident[1], self.facts)
+            self.__measure_link()
+            self.save_profile()
+
     def __set_sysname(self):
         self.sysname = self.eval("uos.uname()[0]").decode("utf-8")
 
+    def __probe_codecs(self, names=None):
+
+        if names is None:
+            try:
+                names = ast.literal_eval(
+                    self.eval(codec.probe_expression()).decode("utf-8")
+                )
+            except (PyboardError, ValueError, SyntaxError):
+                # assume an old firmware, which is known to support hex
+                names = codec.HexCodec.requires
+
+        self.codecs = codec.supported(names)
+        self.codec = self.codecs[0]
+        logging.info("transfer codecs: %s" % [c.name for c in self.codecs])
+
+    def __probe_hash(self, names=None):
+
+        if names is None:
+            try:
+                names = ast.literal_eval(self.exec_(hashing.PROBE).decode("utf-8"))
+            except (PyboardError, ValueError, SyntaxError):
+                names = []
+
+        hashes = hashing.supported(names)
+        self.hash = hashes[0] if hashes else False
+        logging.info("content hash: %s" % (self.hash.name if self.hash else None))
+
+    def __probe_compression(self, names=None):
+
+        if names is None:
+            try:
+                names = ast.literal_eval(self.exec_(compression.PROBE).decode("utf-8"))
+            except (PyboardError, ValueError, SyntaxError):
+                names = []
+
+        self.compression = names
+        logging.info("compression: %s" % names)
+
+    def __load_agent(self, installed):
+        """
+        Import the agent on the device, (re)installing it in the start
+        directory if it is missing or its version doesn't match. The plain
+        raw REPL commands are used if this fails.
+
+        :param installed:   version of the agent found by agent.PROBE
+        """
+
+        version, src = agent.source(self.codecs, self.hash, self.DELTA_BLOCK_SIZE)
+        path = posixpath.join(self.dir, agent.NAME + ".py")
+
+        try:
+            if installed != version:
+                logging.info("installing agent %s to %s" % (version, path))
+
+                self.exec_(agent.UNLOAD)
+                self.exec_("f = open('%s', 'wb')" % path)
+                self.__send(io.BytesIO(src.encode("utf-8")))
+                self.exec_("f.close()")
+
+                if ast.literal_eval(self.exec_(agent.PROBE).decode("utf-8")) != version:
+                    raise PyboardError("agent version mismatch after install")
+
+            self.agent = True
+
+        except (PyboardError, ValueError, SyntaxError) as e:
+            logging.warning("agent not available, using plain commands: %s" % e)
+            self.agent = False
+
+    def __probe_chunk_size(self, mem_free=None, bsize=None):
+
+        if mem_free is None:
+            try:
+                mem_free, bsize = ast.literal_eval(
+                    self.exec_(
+                        "import gc\nprint((gc.mem_free(), uos.statvfs('%s')[0]))"
+                        % self.dir
+                    ).decode("utf-8")
+                )
+            except (PyboardError, ValueError, SyntaxError):
+                mem_free, bsize = 0, self.BIN_CHUNK_SIZE
+
+        bsize = bsize or self.BIN_CHUNK_SIZE
+
+        # leave room for the encoded command, its compiled form and the result
+        maximum = self.MAX_CHUNK_SIZE
+        if mem_free:
+            maximum = min(maximum, mem_free // 8)
+
+        # without raw-paste mode there is no flow control, and long commands
+        # overrun the input buffer of older boards
+        if not self.use_raw_paste:
+            maximum = min(maximum, self.RAW_REPL_MAX_CHUNK_SIZE)
+
+        self.chunk_size = AdaptiveChunkSize(
+            _chunk_sizes.get(self.constr, bsize), self.BIN_CHUNK_SIZE, maximum
+        )
+        logging.info(
+            "chunk size: %d (max. %d)" % (self.chunk_size.size, self.chunk_size.maximum)
+        )
+
+    def __chunks(self, src, end=None):
+        """
+        Generator yielding (offset, chunk) tuples read from the binary file
+        src, up to offset end. Each chunk is as large as the current chunk size
+        and is a view into one reused buffer, so it is only valid until the
+        next one is requested. Seeking src between chunks is allowed.
+        """
+
+        buf = memoryview(bytearray(self.chunk_size.maximum))
+
+        while True:
+            pos = src.tell()
+            size = self.chunk_size.size
+            if end is not None:
+                size = min(size, end - pos)
+
+            n = src.readinto(buf[:size]) if size > 0 else 0
+            if not n:
+                break
+
+            yield pos, buf[:n]
+
+    def __send(self, src, end=None):
+
+        sizer = self.chunk_size
+        enc = None
+
+        for pos, c in self.__chunks(src, end):
+
+            # choose the codec once per transfer, based on the first chunk
+            if enc is None:
+                enc = codec.smallest(self.codecs, c)
+
+            start = time.time()
+
+            try:
+                # the length check detects characters lost on the line
+                if self.agent:
+                    self.exec_("%s.w(f, %s, %d)" % (agent.VAR, enc.encode(c), len(c)))
+                else:
+                    self.exec_(
+                        "if f.write(%s) != %d:\n    raise ValueError('short write')"
+                        % (enc.encode(c), len(c))
+                    )
+            except PyboardError as e:
+                if not any(err in str(e) for err in ("MemoryError", "short write")):
+                    raise e
+                if not sizer.shrink():
+                    raise e
+
+                logging.warning("chunk failed, reducing size to %d" % sizer.size)
+                self.__retried()
+                self.exec_("f.seek(%d)" % pos)
+                src.seek(pos)
+                continue
+
+            sizer.measure(len(c), time.time() - start)
+            self.__progress(len(c))
+
+        _chunk_sizes[self.constr] = sizer.best_size
+
+    def __native(self, op, path, *args):
+        """
+        Transfer a file with the file transfer protocol of the connection.
+
+        :param op:      "put_file" or "get_file" of the connection
+        :param path:    remote file name (full path)
+        :return:        False if the connection has no such protocol, or the
+                        device refused, so the raw REPL has to be used
+        """
+
+        if not self.native_transfer:
+            return False
+
+        try:
+            with self.direct() as con, self.span(op):
+                done = getattr(con, op)(path, *args, progress=self.__progress)
+        except ConError as e:
+            # the device might not be in a state to answer the raw REPL
+            # either, but the retry of the transfer will tell
+            logging.warning("%s of %s failed, using the raw REPL: %s" % (op, path, e))
+            self.native_transfer = False
+            raise PyboardError(str(e))
+
+        if not done:
+            logging.info("%s of %s refused, using the raw REPL" % (op, path))
+
+        return done
+
+    def __native_put(self, src, path):
+        """
+        Upload the binary file src, from its current position on, to the
+        remote file path (full path).
+
+        :return:    False if the raw REPL has to be used
+        """
+
+        return self.__native(
+            "put_file", path, src, os.fstat(src.fileno()).st_size - src.tell()
+        )
+
+    def __size_code(self, path):
+        """
+        :return:    device code printing the size of the remote file path
+        """
+
+        if self.agent:
+            return "%s.size('%s')" % (agent.VAR, path)
+
+        return "print(uos.stat('%s')[6])" % path
+
+    def __size(self, path):
+        """
+        :return:    size of the remote file path (full path)
+        """
+
+        return int(self.exec_(self.__size_code(path)))
+
+    def __receive(self, src, write, offset=0):
+
+        path = self._fqn(src)
+
+        if not offset and self.native_transfer:
+            if self.__running:
+                self.__set_total(self.__size(path))
+            if self.__native("get_file", path, write):
+                return
+        total = int(
+            self.exec_(
+                "f = open('%s', 'rb')\nf.seek(%d)\n%s"
+                % (path, offset, self.__size_code(path))
+            )
+        )
+
+        if self.__running:
+            self.__set_total(total - offset)
+
+        decoder = codec.LineDecoder(self.codec, write)
+        received = [0, 0]
+
+        def data_consumer(data):
+            decoder.feed(data)
+            if decoder.size > received[0]:
+                self.__progress(decoder.size - received[0], decoder.lines - received[1])
+                received[:] = decoder.size, decoder.lines
+
+        if self.agent:
+            code = "%s.r(f, %d, %r)" % (
+                agent.VAR,
+                self.chunk_size.size,
+                self.codec.name,
+            )
+        else:
+            code = (
+                "while True:\r\n"
+                "  c = f.read(%s)\r\n"
+                "  if not len(c):\r\n"
+                "    break\r\n"
+                "  sys.stdout.write(%s)\r\n"
+                % (self.chunk_size.size, self.codec.remote_encode("c"))
+            )
+
+        self.exec_(code, data_consumer=data_consumer)
+
+        decoder.close()
+        self.exec_("f.close()")
+
     def close(self):
 
+        if self.con is not None and self.dir is not None:
+            self.save_profile()
+
         Pyboard.close(self)
         self.dir = None
 
@@ -162,30 +757,71 @@ class MpFileExplorer(Pyboard):
         self.exit_raw_repl()
         self.sysname = None
 
+    @profiled
     def setup(self):
 
+        start = time.time()
         self.enter_raw_repl()
-        self.exec_(
-            "try:\n    import uos\nexcept ImportError:\n    import os as uos\nimport sys"
-        )
-        self.exec_(
-            "try:\n    import ubinascii\nexcept ImportError:\n    import binascii as ubinascii"
-        )
+        self.connect_times["raw REPL"] = time.time() - start
+        start = time.time()
+
+        if self.facts is None:
+            try:
+                cwd, installed = self.__setup_facts()
+            except (PyboardError, ValueError, SyntaxError, IndexError) as e:
+                # e.g. a port without gc.mem_free(), ask for one thing at a time
+                logging.warning("probing the device failed: %s" % e)
+                self.profile = None
+                cwd, _, _, installed = self.__probe_setup(facts=False)
+        else:
+            cwd, _, _, installed = self.__probe_setup(facts=False)
 
         # New version mounts files on /flash so lets set dir based on where we are in
         # filesystem.
         # Using the "path.join" to make sure we get "/" if "os.getcwd" returns "".
-        self.dir = posixpath.join("/", self.eval("uos.getcwd()").decode("utf8"))
+        self.dir = posixpath.join("/", cwd)
+
+        facts = self.facts or {}
+
+        if "sysname" in facts:
+            self.sysname = facts["sysname"]
+        else:
+            self.__set_sysname()
+
+        if self.codecs is None:
+            self.__probe_codecs(facts.get("codecs"))
+
+        if self.chunk_size is None:
+            self.__probe_chunk_size(facts.get("mem_free"), facts.get("block_size"))
 
-        self.__set_sysname()
+        if self.hash is None:
+            self.__probe_hash(facts.get("hashes"))
 
+        if self.compress and self.compression is None:
+            self.__probe_compression(facts.get("compression"))
+
+        if self.use_agent:
+            self.__load_agent(installed)
+
+        self.save_profile()
+
+        self.connect_times["setup"] = time.time() - start
+        logging.info(
+            "connect times: %s"
+            % ", ".join("%s %.3fs" % t for t in self.connect_times.items())
+        )
+
+    @profiled
     @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
     def ls(self, add_files=True, add_dirs=True, add_details=False):
 
         files = []
 
         try:
-            res = self.eval("list(uos.ilistdir('%s'))" % self.dir)
+            if self.agent:
+                res = self.exec_("%s.ls('%s')" % (agent.VAR, self.dir))
+            else:
+                res = self.eval("list(uos.ilistdir('%s'))" % self.dir)
         except Exception as e:
             if _was_file_not_existing(e):
                 raise RemoteIOError("No such directory: %s" % self.dir)
@@ -202,7 +838,7 @@ class MpFileExplorer(Pyboard):
                 return [entry[0] for entry in entries]
 
         for entry in entries:
-            fname, ftype, inode = entry[:3]
+            fname, ftype = entry[:2]
             fchar = "D" if ftype == 0x4000 else "F"
             if not ((fchar == "D" and add_dirs) or (fchar == "F" and add_files)):
                 continue
@@ -215,14 +851,23 @@ class MpFileExplorer(Pyboard):
         else:
             return sorted(files)
 
+    @profiled
     @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
     def rm(self, target):
 
         try:
+            if self.agent:
+                # the agent does the 1st and 2nd step in one call
+                self.exec_("%s.rm('%s')" % (agent.VAR, self._fqn(target)))
+                return
+
             # 1st try to delete it as a file
             self.eval("uos.remove('%s')" % (self._fqn(target)))
-        except PyboardError:
+        except PyboardError as e:
             try:
+                if self.agent:
+                    # the agent already tried rmdir, just report the error
+                    raise e
                 # 2nd see if it is empty dir
                 self.eval("uos.rmdir('%s')" % (self._fqn(target)))
             except PyboardError as e:
@@ -240,6 +885,7 @@ class MpFileExplorer(Pyboard):
                 else:
                     raise e
 
+    @profiled
     def mrm(self, pat, verbose=False):
 
         files = self.ls(add_dirs=False)
@@ -252,38 +898,337 @@ class MpFileExplorer(Pyboard):
 
                 self.rm(f)
 
-    @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
-    def put(self, src, dst=None):
+    def __truncate(self, path, size):
+        """
+        Cut the remote file path (full path) down to size bytes. MicroPython
+        files have no truncate(), so the device copies the part to keep to a
+        temporary file and renames it over path. Nothing crosses the link.
 
-        f = open(src, "rb")
-        data = f.read()
-        f.close()
+        :return:    False if the device couldn't (e.g. its file system is full)
+        """
 
-        if dst is None:
-            dst = src
+        tmp = path + self.TEMP_SUFFIX
 
         try:
+            self.exec_(
+                "with open('%s', 'rb') as sf, open('%s', 'wb') as df:\n"
+                "    n = %d\n"
+                "    while n:\n"
+                "        b = sf.read(min(n, %d))\n"
+                "        if not b:\n"
+                "            break\n"
+                "        df.write(b)\n"
+                "        n -= len(b)\n"
+                "uos.remove('%s')\n"
+                "uos.rename('%s', '%s')"
+                % (path, tmp, size, self.chunk_size.size, path, tmp, path)
+            )
+        except PyboardError as e:
+            logging.warning("truncating %s failed: %s" % (path, e))
+            self.__remove_quietly(tmp)
+            return False
 
-            self.exec_("f = open('%s', 'wb')" % self._fqn(dst))
+        return True
 
-            while True:
-                c = binascii.hexlify(data[: self.BIN_CHUNK_SIZE])
-                if not len(c):
-                    break
+    def __send_delta(self, src, dst):
+        """
+        Patch the existing remote file dst in place, sending only the blocks
+        which differ from the local file src.
 
-                self.exec_("f.write(ubinascii.unhexlify('%s'))" % c.decode("utf-8"))
-                data = data[self.BIN_CHUNK_SIZE :]
+        :return:    False if the remote file can't be patched
+        """
 
-            self.exec_("f.close()")
+        path = self._fqn(dst)
 
-        except PyboardError as e:
-            if _was_file_not_existing(e):
-                raise RemoteIOError("Failed to create file: %s" % dst)
-            elif "EACCES" in str(e):
-                raise RemoteIOError("Existing directory: %s" % dst)
-            else:
+        try:
+            remote_size = self.__size(path)
+        except PyboardError:
+            return False
+
+        src.seek(0, os.SEEK_END)
+        local_size = src.tell()
+
+        if local_size < remote_size and not self.__truncate(path, local_size):
+            return False
+
+        if self.agent:
+            code = "%s.bh('%s', %d)" % (agent.VAR, path, self.DELTA_BLOCK_SIZE)
+        else:
+            code = hashing.remote_block_hashes(self.hash, path, self.DELTA_BLOCK_SIZE)
+
+        remote = self.exec_(code)
+        remote = [d.strip().decode("utf-8") for d in remote.split(b"\n") if d.strip()]
+
+        src.seek(0)
+        local = hashing.block_hashes(self.hash, src, self.DELTA_BLOCK_SIZE)
+
+        runs = hashing.changed_runs(local, remote, self.DELTA_BLOCK_SIZE)
+        logging.info(
+            "delta put %s: %d of %d blocks changed"
+            % (dst, sum(r[1] for r in runs) // self.DELTA_BLOCK_SIZE, len(local))
+        )
+        self.__set_total(min(sum(r[1] for r in runs), local_size))
+
+        self.exec_("f = open('%s', 'r+b')" % path)
+
+        for offset, length in runs:
+            src.seek(offset)
+            self.exec_("f.seek(%d)" % offset)
+            self.__send(src, offset + length)
+
+        self.exec_("f.close()")
+
+        return True
+
+    def __send_compressed(self, src, dst):
+        """
+        Upload the binary file src compressed to a temporary remote file, and
+        let the device decompress it to dst.
+
+        :return:    False if the device can not decompress, or if the data
+                    does not compress well enough to be worth it
+        """
+
+        method = next(
+            (m for m in ("deflate", "uzlib") if m in (self.compression or [])), None
+        )
+        size = os.fstat(src.fileno()).st_size
+
+        if method is None or size < self.COMPRESS_MIN_SIZE:
+            return False
+
+        with compression.compress(src) as z:
+
+            zsize = os.fstat(z.fileno()).st_size
+            logging.info("compressed %d to %d bytes" % (size, zsize))
+
+            if zsize * 10 > size * 9:
+                return False
+
+            self.__set_total(zsize)
+
+            path = self._fqn(dst)
+            tmp = path + self.TEMP_SUFFIX
+
+            try:
+                if not self.__native_put(z, tmp):
+                    self.exec_("f = open('%s', 'wb')" % tmp)
+                    self.__send(z)
+                    self.exec_("f.close()")
+                self.exec_(
+                    compression.remote_decompress(
+                        method, tmp, path, self.chunk_size.size
+                    )
+                )
+            except PyboardError as e:
+                self.__remove_quietly(tmp)
                 raise e
 
+        return True
+
+    def __receive_compressed(self, src, write):
+        """
+        Let the device compress the remote file src while it is sent, and
+        decompress it as it arrives.
+
+        :return:    False if the device can not compress the file, part of it
+                    might have been written already
+        """
+
+        if "deflate-compress" not in (self.compression or []):
+            return False
+
+        path = self._fqn(src)
+
+        if self.__running:
+            self.__set_total(self.__size(path))
+
+        def decompressed(data):
+            if data:
+                write(data)
+                self.__progress(len(data))
+
+        decompressor = compression.Decompressor(decompressed)
+        decoder = codec.LineDecoder(self.codec, decompressor.write)
+
+        try:
+            self.exec_(
+                compression.remote_compress(
+                    path, self.chunk_size.size, self.codec.remote_encode("b")
+                ),
+                data_consumer=decoder.feed,
+            )
+        except PyboardError as e:
+            logging.warning(
+                "compression failed, falling back to plain transfer: %s" % e
+            )
+            return False
+
+        decoder.close()
+        decompressor.close()
+        return True
+
+    def __remove_quietly(self, path):
+
+        self.exec_("try:\n    uos.remove('%s')\nexcept OSError:\n    pass" % path)
+
+    def __common_prefix(self, remote, local, size):
+        """
+        Check how much of an interrupted transfer can be kept.
+
+        :param remote:  remote file (full path)
+        :param local:   local file name
+        :param size:    size of the partial file, which is either remote or local
+        :return:        size if the first size bytes of both files are equal
+                        (just trusted if the device has no content hash), else 0
+        """
+
+        if not size or not self.hash:
+            return size
+
+        if self.agent:
+            code = "print(%s.hs('%s', %d))" % (agent.VAR, remote, size)
+        else:
+            code = "%s\nprint(hs('%s', %d))" % (
+                hashing.remote_file_hash(self.hash, self.DELTA_BLOCK_SIZE),
+                remote,
+                size,
+            )
+
+        digest = self.exec_(code)
+
+        if digest.strip().decode("utf-8") != hashing.file_hash(
+            self.hash, local, size=size
+        ):
+            logging.info("partial file %s doesn't match, starting over" % remote)
+            return 0
+
+        return size
+
+    def __resumable(self, transfer):
+        """
+        :param transfer:    tuple ("put" or "get", src, dst)
+        :return:            True if this is the retry of the interrupted
+                            transfer, and its partial file can be checked
+        """
+
+        # without a hash, the size of the partial file would just be trusted
+        return self.__interrupted == transfer and bool(self.hash)
+
+    def __resume_put(self, src, dst):
+        """
+        :return:    number of bytes of the local file src which are already in
+                    the remote file dst
+        """
+
+        path = self._fqn(dst)
+
+        # a file left open by the interrupted transfer is flushed by closing it
+        self.exec_("try:\n    f.close()\nexcept Exception:\n    pass")
+
+        try:
+            size = self.__size(path)
+        except PyboardError:
+            return 0
+
+        if size > os.path.getsize(src):
+            return 0
+
+        return self.__common_prefix(path, src, size)
+
+    def __resume_get(self, src, dst):
+        """
+        :return:    number of bytes of the remote file src which are already in
+                    the local file dst
+        """
+
+        path = self._fqn(src)
+
+        if not os.path.isfile(dst):
+            return 0
+
+        size = os.path.getsize(dst)
+
+        if size > self.__size(path):
+            return 0
+
+        return self.__common_prefix(path, dst, size)
+
+    @profiled
+    def put(self, src, dst=None, delta=False, resume=False):
+        """
+        Upload a local file.
+
+        :param src:     local file name
+        :param dst:     remote file name (same as src if None)
+        :param delta:   if the remote file exists, only send the blocks which
+                        differ (requires a content hash on the device)
+        :param resume:  continue an interrupted upload, keeping the data which
+                        is already in the remote file (a retry after a failed
+                        upload resumes if the device has a content hash)
+        """
+
+        try:
+            self.__retry_put(src, dst, delta, resume)
+        finally:
+            # only the retries of a transfer resume it on their own
+            self.__interrupted = None
+
+    @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
+    def __retry_put(self, src, dst, delta, resume):
+
+        with open(src, "rb") as f:
+
+            if dst is None:
+                dst = src
+
+            resume = resume or self.__resumable(("put", src, dst))
+
+            try:
+
+                with self.__transfer("put", dst, ("put", src, dst)):
+                    self.__put(f, src, dst, delta, resume)
+
+            except PyboardError as e:
+                if _was_file_not_existing(e):
+                    raise RemoteIOError("Failed to create file: %s" % dst)
+                elif "EACCES" in str(e):
+                    raise RemoteIOError("Existing directory: %s" % dst)
+                else:
+                    raise e
+
+    def __put(self, f, src, dst, delta, resume):
+
+        if delta and self.hash and self.__send_delta(f, dst):
+            return
+
+        offset = self.__resume_put(src, dst) if resume else 0
+
+        if offset:
+            logging.info("resuming upload of %s at %d" % (dst, offset))
+        else:
+            f.seek(0)
+            if self.compress and self.__send_compressed(f, dst):
+                return
+
+        self.__interrupted = ("put", src, dst)
+        self.__set_total(os.path.getsize(src) - offset)
+
+        # without truncating, the remote file is patched from offset
+        f.seek(offset)
+
+        if offset or not self.__native_put(f, self._fqn(dst)):
+            self.exec_(
+                "f = open('%s', '%s')\nf.seek(%d)"
+                % (self._fqn(dst), "r+b" if offset else "wb", offset)
+            )
+            f.seek(offset)
+            self.__send(f)
+            self.exec_("f.close()")
+
+        self.__interrupted = None
+
+    @profiled
     def mput(self, src_dir, pat, verbose=False):
 
         try:
@@ -291,39 +1236,60 @@ class MpFileExplorer(Pyboard):
             find = re.compile(pat)
             files = os.listdir(src_dir)
 
-            for f in files:
-                if os.path.isfile(f) and find.match(f):
-                    if verbose:
-                        print(" * put %s" % f)
+            with self.__transfer("batch", "mput %s" % pat):
+                for f in files:
+                    if os.path.isfile(os.path.join(src_dir, f)) and find.match(f):
+                        if verbose:
+                            print(" * put %s" % f)
 
-                    self.put(posixpath.join(src_dir, f), f)
+                        self.put(os.path.join(src_dir, f), f)
 
         except sre_constants.error as e:
             raise RemoteIOError("Error in regular expression: %s" % e)
 
+    @profiled
+    def get(self, src, dst=None, resume=False):
+        """
+        Download a remote file. The data is written to the local file as it
+        arrives.
+
+        :param src:         remote file name
+        :param dst:         local file name (same as src if None)
+        :param resume:      continue an interrupted download, keeping the data
+                            which is already in the local file (a retry after a
+                            failed download resumes if the device has a content
+                            hash)
+        """
+
+        try:
+            self.__retry_get(src, dst, resume)
+        finally:
+            # only the retries of a transfer resume it on their own
+            self.__interrupted = None
+
     @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
-    def get(self, src, dst=None):
+    def __retry_get(self, src, dst, resume):
+
+        if posixpath.dirname(src) == "":
+            exists = src in self.ls()
+        else:
+            try:
+                self.__size(self._fqn(src))
+                exists = True
+            except PyboardError:
+                exists = False
 
-        if src not in self.ls():
+        if not exists:
             raise RemoteIOError("No such file or directory: '%s'" % self._fqn(src))
 
         if dst is None:
             dst = src
 
-        f = open(dst, "wb")
+        resume = resume or self.__resumable(("get", src, dst))
 
         try:
-
-            self.exec_("f = open('%s', 'rb')" % self._fqn(src))
-            ret = self.exec_(
-                "while True:\r\n"
-                "  c = ubinascii.hexlify(f.read(%s))\r\n"
-                "  if not len(c):\r\n"
-                "    break\r\n"
-                "  sys.stdout.write(c)\r\n" % self.BIN_CHUNK_SIZE
-            )
-
-            self.exec_("f.close()")
+            with self.__transfer("get", src, ("get", src, dst)):
+                self.__get(src, dst, resume)
 
         except PyboardError as e:
             if _was_file_not_existing(e):
@@ -331,9 +1297,28 @@ class MpFileExplorer(Pyboard):
             else:
                 raise e
 
-        f.write(binascii.unhexlify(ret))
-        f.close()
+    def __get(self, src, dst, resume):
+
+        offset = self.__resume_get(src, dst) if resume else 0
+
+        with open(dst, "r+b" if offset else "wb") as f:
+
+            self.__interrupted = ("get", src, dst)
+
+            if offset:
+                logging.info("resuming download of %s at %d" % (src, offset))
+                f.seek(offset)
+                f.truncate()
+                self.__receive(src, f.write, offset)
 
+            elif not (self.compress and self.__receive_compressed(src, f.write)):
+                f.seek(0)
+                f.truncate()
+                self.__receive(src, f.write)
+
+            self.__interrupted = None
+
+    @profiled
     def mget(self, dst_dir, pat, verbose=False):
 
         try:
@@ -341,31 +1326,316 @@ class MpFileExplorer(Pyboard):
             files = self.ls(add_dirs=False)
             find = re.compile(pat)
 
-            for f in files:
-                if find.match(f):
-                    if verbose:
-                        print(" * get %s" % f)
+            with self.__transfer("batch", "mget %s" % pat):
+                for f in files:
+                    if find.match(f):
+                        if verbose:
+                            print(" * get %s" % f)
 
-                    self.get(f, dst=posixpath.join(dst_dir, f))
+                        self.get(f, dst=posixpath.join(dst_dir, f))
 
         except sre_constants.error as e:
             raise RemoteIOError("Error in regular expression: %s" % e)
 
-    @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
-    def gets(self, src):
+    def __remote_tree(self, root, manifest=False, hashes=True, skip=()):
+        """
+        Walk the remote directory root in one exec and hash all files.
+
+        :param manifest:    reuse the hashes stored in the sync manifest for
+                            files whose size and mtime did not change
+        :param hashes:      hash the files (digests are empty otherwise)
+        :param skip:        relative paths of files to leave out
+        :return:            dict mapping relative paths to (size, digest),
+                            directories have a size of -1
+        """
+
+        if not (self.hash and hashes):
+            code = "def hs(p, n=-1):\n    return ''"
+        elif self.agent:
+            code = "hs = %s.hs" % agent.VAR
+        else:
+            code = hashing.remote_file_hash(self.hash, self.DELTA_BLOCK_SIZE)
+
+        if manifest:
+            code += (
+                "\ntry:\n    import ujson as json\nexcept ImportError:\n    import json"
+                "\ntry:\n"
+                "    with open('%s') as mf:\n"
+                "        m = json.load(mf)\n"
+                "except Exception:\n"
+                "    m = {}" % posixpath.join(root, self.SYNC_MANIFEST)
+            )
+        else:
+            code += "\nm = {}"
+
+        code += (
+            "\ndef w(d, r):\n"
+            "    for e in uos.ilistdir(d):\n"
+            "        p = d.rstrip('/') + '/' + e[0]\n"
+            "        if e[1] == 0x4000:\n"
+            "            print(repr((r + e[0], -1, '')))\n"
+            "            w(p, r + e[0] + '/')\n"
+            "        elif r + e[0] not in %r:\n"
+            "            st = uos.stat(p)\n"
+            "            c = m.get(r + e[0])\n"
+            "            h = c[1] if c and c[0] == st[6] and c[2] == st[8] else hs(p)\n"
+            "            print(repr((r + e[0], st[6], h)))\n"
+            "w('%s', '')" % (tuple(skip), root)
+        )
+
+        tree = {}
+
+        for line in self.exec_(code).decode("utf-8").splitlines():
+            if line.strip():
+                path, size, digest = ast.literal_eval(line)
+                tree[path] = (size, digest)
+
+        return tree
+
+    @staticmethod
+    def __local_tree(src_dir):
+        """
+        Walk the local directory src_dir.
+
+        :return:    dict mapping relative (posix) paths to (size, local path),
+                    directories have a size of -1
+        """
+
+        tree = {}
+        pending = [("", src_dir)]
+
+        while pending:
+            rel, path = pending.pop()
+
+            with os.scandir(path) as it:
+                for e in it:
+                    if e.is_dir():
+                        tree[rel + e.name] = (-1, e.path)
+                        pending.append((rel + e.name + "/", e.path))
+                    elif e.is_file():
+                        tree[rel + e.name] = (e.stat().st_size, e.path)
+
+        return tree
+
+    def __make_dirs(self, paths):
+        """
+        Create the remote directories in paths (parents first) in one exec,
+        existing directories are skipped.
+        """
+
+        if paths:
+            self.exec_(
+                "for d in %r:\n"
+                "    try:\n"
+                "        uos.mkdir(d)\n"
+                "    except OSError as e:\n"
+                "        if e.args[0] != 17:\n"
+                "            raise\n" % (sorted(paths),)
+            )
+
+    @profiled
+    def put_tree(self, src_dir, dst_dir=None, verbose=False):
+        """
+        Upload the local directory src_dir recursively.
+
+        :param src_dir:     local directory
+        :param dst_dir:     remote directory (same name as src_dir if None)
+        :param verbose:     print every uploaded file
+        :return:            list of uploaded remote paths
+        """
+
+        if not os.path.isdir(src_dir):
+            raise IOError("No such directory: %s" % src_dir)
+
+        if dst_dir is None:
+            dst_dir = os.path.basename(os.path.abspath(src_dir))
+
+        root = self._fqn(dst_dir)
+        local = self.__local_tree(src_dir)
 
         try:
+            self.__make_dirs(
+                [root] + [posixpath.join(root, r) for r, e in local.items() if e[0] < 0]
+            )
+        except PyboardError as e:
+            if "EEXIST" in str(e) or _was_file_not_existing(e):
+                raise RemoteIOError("Failed to create directory: %s" % dst_dir)
+            raise e
 
-            self.exec_("f = open('%s', 'rb')" % self._fqn(src))
-            ret = self.exec_(
-                "while True:\r\n"
-                "  c = ubinascii.hexlify(f.read(%s))\r\n"
-                "  if not len(c):\r\n"
-                "    break\r\n"
-                "  sys.stdout.write(c)\r\n" % self.BIN_CHUNK_SIZE
+        done = []
+
+        with self.__transfer("batch", "put -r %s" % src_dir):
+            for rel in sorted(r for r, e in local.items() if e[0] >= 0):
+                target = posixpath.join(root, rel)
+
+                if verbose:
+                    print(" * put %s" % target)
+
+                self.put(local[rel][1], target)
+                done.append(target)
+
+        return done
+
+    @profiled
+    def get_tree(self, src_dir, dst_dir=None, verbose=False):
+        """
+        Download the remote directory src_dir recursively. The remote tree
+        is listed in one exec.
+
+        :param src_dir:     remote directory
+        :param dst_dir:     local directory (same name as src_dir if None)
+        :param verbose:     print every downloaded file
+        :return:            list of downloaded local paths
+        """
+
+        root = self._fqn(src_dir)
+
+        if dst_dir is None:
+            dst_dir = posixpath.basename(root.rstrip("/")) or "."
+
+        try:
+            remote = self.__remote_tree(root, hashes=False)
+        except PyboardError as e:
+            if _was_file_not_existing(e):
+                raise RemoteIOError("No such directory: %s" % root)
+            raise e
+
+        os.makedirs(dst_dir, exist_ok=True)
+        for rel in sorted(r for r, e in remote.items() if e[0] < 0):
+            os.makedirs(os.path.join(dst_dir, *rel.split("/")), exist_ok=True)
+
+        done = []
+
+        with self.__transfer("batch", "get -r %s" % src_dir):
+            for rel in sorted(r for r, e in remote.items() if e[0] >= 0):
+                target = os.path.join(dst_dir, *rel.split("/"))
+
+                if verbose:
+                    print(" * get %s" % target)
+
+                self.get(posixpath.join(root, rel), target)
+                done.append(target)
+
+        return done
+
+    def __write_manifest(self, root, digests):
+
+        self.exec_(
+            "try:\n    import ujson as json\nexcept ImportError:\n    import json\n"
+            "m = {}\n"
+            "for r, h in %r:\n"
+            "    st = uos.stat('%s/' + r)\n"
+            "    m[r] = [st[6], h, st[8]]\n"
+            "with open('%s', 'w') as mf:\n"
+            "    json.dump(m, mf)"
+            % (
+                sorted(digests.items()),
+                root.rstrip("/"),
+                posixpath.join(root, self.SYNC_MANIFEST),
             )
+        )
 
-            self.exec_("f.close()")
+    @profiled
+    def sync(
+        self,
+        src_dir,
+        dst_dir=None,
+        delete=False,
+        dry_run=False,
+        manifest=False,
+        verbose=False,
+    ):
+        """
+        Make the remote directory dst_dir match the local directory src_dir.
+        New and changed files are uploaded, unchanged files (same size and
+        content hash) are skipped.
+
+        :param src_dir:     local directory
+        :param dst_dir:     remote directory (current directory if None)
+        :param delete:      remove remote files and directories which don't
+                            exist locally
+        :param dry_run:     only compute what would be done
+        :param manifest:    cache remote hashes in a manifest file on the
+                            device, so the next sync doesn't rehash
+        :param verbose:     print every action
+        :return:            list of (action, path) tuples, with action being
+                            one of "md", "put", "update" or "rm"
+        """
+
+        if not os.path.isdir(src_dir):
+            raise IOError("No such directory: %s" % src_dir)
+
+        root = self.dir if dst_dir is None else self._fqn(dst_dir)
+
+        try:
+            remote = self.__remote_tree(
+                root, manifest, skip=(self.SYNC_MANIFEST, agent.NAME + ".py")
+            )
+            root_exists = True
+        except PyboardError as e:
+            if not _was_file_not_existing(e):
+                raise e
+            remote = {}
+            root_exists = False
+
+        local = self.__local_tree(src_dir)
+
+        actions = [] if root_exists else [("md", "")]
+        digests = {}
+
+        for rel in sorted(local):
+            size, path = local[rel]
+
+            if size < 0:
+                if rel not in remote:
+                    actions.append(("md", rel))
+                continue
+
+            digest = hashing.file_hash(self.hash, path) if self.hash else ""
+            digests[rel] = digest
+
+            if rel not in remote:
+                actions.append(("put", rel))
+            elif not self.hash or remote[rel] != (size, digest):
+                # without a hash on the device, equal sizes prove nothing
+                actions.append(("update", rel))
+
+        if delete:
+            # files first, then directories from the deepest up
+            orphans = [r for r in remote if r not in local]
+            orphans.sort(key=lambda r: (remote[r][0] < 0, -r.count("/"), r))
+            actions.extend(("rm", r) for r in orphans)
+
+        if dry_run:
+            return actions
+
+        with self.__transfer("batch", "sync %s" % src_dir):
+            for action, rel in actions:
+                target = posixpath.join(root, rel).rstrip("/") or "/"
+
+                if verbose:
+                    print(" * %s %s" % (action, target))
+
+                if action == "md":
+                    self.md(target)
+                elif action == "rm":
+                    self.rm(target)
+                else:
+                    self.put(local[rel][1], target, delta=action == "update")
+
+        if manifest and self.hash:
+            self.__write_manifest(root, digests)
+
+        return actions
+
+    @profiled
+    @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
+    def gets(self, src):
+
+        try:
+
+            ret = bytearray()
+            self.__receive(src, ret.extend)
 
         except PyboardError as e:
             if _was_file_not_existing(e):
@@ -375,11 +1645,11 @@ class MpFileExplorer(Pyboard):
 
         try:
 
-            return binascii.unhexlify(ret).decode("utf-8")
+            return ret.decode("utf-8")
 
         except UnicodeDecodeError:
 
-            s = ret.decode("utf-8")
+            s = binascii.hexlify(ret).decode("utf-8")
             fs = "\nBinary file:\n\n"
 
             while len(s):
@@ -388,23 +1658,16 @@ class MpFileExplorer(Pyboard):
 
             return fs
 
+    @profiled
     @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
     def puts(self, dst, lines):
 
         try:
 
-            data = lines.encode("utf-8")
+            data = io.BytesIO(lines.encode("utf-8"))
 
             self.exec_("f = open('%s', 'wb')" % self._fqn(dst))
-
-            while True:
-                c = binascii.hexlify(data[: self.BIN_CHUNK_SIZE])
-                if not len(c):
-                    break
-
-                self.exec_("f.write(ubinascii.unhexlify('%s'))" % c.decode("utf-8"))
-                data = data[self.BIN_CHUNK_SIZE :]
-
+            self.__send(data)
             self.exec_("f.close()")
 
         except PyboardError as e:
@@ -415,6 +1678,7 @@ class MpFileExplorer(Pyboard):
             else:
                 raise e
 
+    @profiled
     @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
     def cd(self, target):
 
@@ -440,6 +1704,7 @@ class MpFileExplorer(Pyboard):
     def pwd(self):
         return self.dir
 
+    @profiled
     @retry(PyboardError, tries=MAX_TRIES, delay=1, backoff=2, logger=logging.root)
     def md(self, target):
 
@@ -467,10 +1732,23 @@ class MpFileExplorer(Pyboard):
 
 
 class MpFileExplorerCaching(MpFileExplorer):
-    def __init__(self, constr, reset=False):
-        MpFileExplorer.__init__(self, constr, reset)
+    def __init__(
+        self,
+        constr,
+        reset=False,
+        compress=False,
+        use_agent=False,
+        profiler=None,
+        profiles=None,
+        low_latency=False,
+    ):
+        MpFileExplorer.__init__(
+            self, constr, reset, compress, use_agent, profiler, profiles, low_latency
+        )
 
         self.cache = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
 
     def __cache(self, path, data):
 
@@ -481,10 +1759,13 @@ class MpFileExplorerCaching(MpFileExplorer):
 
         if path in self.cache:
             logging.debug("cache hit for '%s': %s" % (path, self.cache[path]))
+            self.cache_hits += 1
             return self.cache[path]
 
+        self.cache_misses += 1
         return None
 
+    @profiled
     def ls(self, add_files=True, add_dirs=True, add_details=False):
 
         hit = self.__cache_hit(self.dir)
@@ -503,9 +1784,10 @@ class MpFileExplorerCaching(MpFileExplorer):
             files = [f[0] for f in files]
         return files
 
-    def put(self, src, dst=None):
+    @profiled
+    def put(self, src, dst=None, delta=False, resume=False):
 
-        MpFileExplorer.put(self, src, dst)
+        MpFileExplorer.put(self, src, dst, delta, resume)
 
         if dst is None:
             dst = src
@@ -517,9 +1799,10 @@ class MpFileExplorerCaching(MpFileExplorer):
         hit = self.__cache_hit(parent)
 
         if hit is not None:
-            if (dst, "F") not in hit:
+            if (newitm, "F") not in hit:
                 self.__cache(parent, hit + [(newitm, "F")])
 
+    @profiled
     def puts(self, dst, lines):
 
         MpFileExplorer.puts(self, dst, lines)
@@ -531,9 +1814,20 @@ class MpFileExplorerCaching(MpFileExplorer):
         hit = self.__cache_hit(parent)
 
         if hit is not None:
-            if (dst, "F") not in hit:
+            if (newitm, "F") not in hit:
                 self.__cache(parent, hit + [(newitm, "F")])
 
+    @profiled
+    def put_tree(self, src_dir, dst_dir=None, verbose=False):
+
+        done = MpFileExplorer.put_tree(self, src_dir, dst_dir, verbose)
+
+        # the directories were created behind the cache's back
+        self.cache.clear()
+
+        return done
+
+    @profiled
     def md(self, dir):
 
         MpFileExplorer.md(self, dir)
@@ -545,9 +1839,10 @@ class MpFileExplorerCaching(MpFileExplorer):
         hit = self.__cache_hit(parent)
 
         if hit is not None:
-            if (dir, "D") not in hit:
+            if (newitm, "D") not in hit:
                 self.__cache(parent, hit + [(newitm, "D")])
 
+    @profiled
     def rm(self, target):
 
         MpFileExplorer.rm(self, target)
@@ -22,6 +22,7 @@
 # THE SOFTWARE.
 ##
 import argparse
+import atexit
 import binascii
 import cmd
 import glob
@@ -37,17 +38,33 @@ import colorama
 import serial
 from serial.tools.list_ports import comports
 
+from mp import agent
+from mp import daemon
+from mp import devprofile
 from mp import version
 from mp.conbase import ConError
+from mp.metrics import StatusLine
 from mp.mpfexp import MpFileExplorer
 from mp.mpfexp import MpFileExplorerCaching
 from mp.mpfexp import RemoteIOError
+from mp.profiler import NO_SPAN
+from mp.profiler import Profiler
 from mp.pyboard import PyboardError
 from mp.tokenizer import Tokenizer
 
 
 class MpFileShell(cmd.Cmd):
-    def __init__(self, color=False, caching=False, reset=False):
+    def __init__(
+        self,
+        color=False,
+        caching=False,
+        reset=False,
+        compress=False,
+        use_agent=False,
+        profiler=None,
+        profiles=None,
+        low_latency=False,
+    ):
         if color:
             colorama.init()
             cmd.Cmd.__init__(self, stdout=colorama.initialise.wrapped_stdout)
@@ -60,9 +77,22 @@ class MpFileShell(cmd.Cmd):
         self.color = color
         self.caching = caching
         self.reset = reset
+        self.compress = compress
+        self.use_agent = use_agent
+        self.profiler = profiler
+        self.profiles = profiles
+        self.low_latency = low_latency
 
         self.fe = None
         self.repl = None
+
+        # explorers kept open after closing them, by target, see mp.daemon
+        self.pool = None
+        self.__pooled = None
+
+        # number of failed commands, see mp.daemon
+        self.errors = 0
+
         self.tokenizer = Tokenizer()
 
         self.__intro()
@@ -111,21 +141,68 @@ class MpFileShell(cmd.Cmd):
             self.prompt = "mpfs [" + pwd + "]> "
 
     def __error(self, msg):
+        self.errors += 1
+
         if self.color:
             print("\n" + colorama.Fore.RED + msg + colorama.Fore.RESET + "\n")
         else:
             print("\n" + msg + "\n")
 
+    def __reuse(self, port):
+        """
+        Take the explorer for port from the pool, if it still works.
+        """
+
+        fe, start_dir = self.pool.pop(port)
+
+        try:
+            fe.exec_("pass")
+        except PyboardError as e:
+            logging.warning("pooled connection to %s is broken: %s" % (port, e))
+            fe.close()
+            return False
+
+        # start where a new connection would
+        fe.dir = start_dir
+        self.fe = fe
+        self.__pooled = (port, start_dir)
+        return True
+
     def __connect(self, port):
         try:
             self.__disconnect()
 
+            if self.pool is not None and port in self.pool and self.__reuse(port):
+                print("Connected to %s" % self.fe.sysname)
+                self.__set_prompt_path()
+                return True
+
             if self.reset:
                 print("Hard resetting device ...")
             if self.caching:
-                self.fe = MpFileExplorerCaching(port, self.reset)
+                self.fe = MpFileExplorerCaching(
+                    port,
+                    self.reset,
+                    self.compress,
+                    self.use_agent,
+                    self.profiler,
+                    self.profiles,
+                    self.low_latency,
+                )
             else:
-                self.fe = MpFileExplorer(port, self.reset)
+                self.fe = MpFileExplorer(
+                    port,
+                    self.reset,
+                    self.compress,
+                    self.use_agent,
+                    self.profiler,
+                    self.profiles,
+                    self.low_latency,
+                )
+            if sys.stdout.isatty():
+                self.fe.add_listener(StatusLine())
+            if self.pool is not None:
+                self.__pooled = (port, self.fe.dir)
             print("Connected to %s" % self.fe.sysname)
             self.__set_prompt_path()
             return True
@@ -141,7 +218,14 @@ class MpFileShell(cmd.Cmd):
         return False
 
     def __disconnect(self):
-        if self.fe is not None:
+        if self.fe is not None and self.__pooled is not None:
+            port, start_dir = self.__pooled
+            self.pool[port] = (self.fe, start_dir)
+            self.__pooled = None
+            self.fe = None
+            self.__set_prompt_path()
+
+        elif self.fe is not None:
             try:
                 self.fe.close()
                 self.fe = None
@@ -166,6 +250,40 @@ class MpFileShell(cmd.Cmd):
 
         return None
 
+    def __parse_options(self, s_args, allowed):
+        """
+        Split leading options (e.g. "-d") off the parsed arguments.
+
+        :param s_args:      arguments as returned by __parse_file_names
+        :param allowed:     options accepted by the command
+        :return:            tuple (set of options, remaining arguments) or
+                            (None, None) if an unknown option was given
+        """
+
+        opts = set()
+
+        while s_args and s_args[0].startswith("-"):
+            if s_args[0] not in allowed:
+                self.__error("Unknown option: %s" % s_args[0])
+                return None, None
+
+            opts.add(s_args.pop(0))
+
+        return opts, s_args
+
+    def onecmd(self, line):
+
+        span = NO_SPAN
+        if self.profiler is not None and line.strip():
+            span = self.profiler.span("cmd %s" % line.split()[0], "shell")
+
+        with span:
+            return cmd.Cmd.onecmd(self, line)
+
+    def default(self, line):
+        self.errors += 1
+        cmd.Cmd.default(self, line)
+
     def postcmd(self, stop, line):
         # keep the shell open until manually exited
         if line.startswith("exit") or line.startswith("EOF"):
@@ -189,6 +307,7 @@ class MpFileShell(cmd.Cmd):
         - a serial port, e.g.       ttyUSB0, ser:/dev/ttyUSB0
         - a telnet host, e.g        tn:192.168.1.1 or tn:192.168.1.1,login,passwd
         - a websocket host, e.g.    ws:192.168.1.1 or ws:192.168.1.1,passwd
+        - a simulated device, e.g.  sim:/tmp/device or sim:/tmp/device,115200
         """
 
         if not len(args):
@@ -200,6 +319,7 @@ class MpFileShell(cmd.Cmd):
             and not args.startswith("ser:COM")
             and not args.startswith("tn:")
             and not args.startswith("ws:")
+            and not args.startswith("sim:")
         ):
             if platform.system() == "Windows":
                 args = "ser:" + args
@@ -265,6 +385,56 @@ class MpFileShell(cmd.Cmd):
         if self.__is_open():
             print(self.fe.pwd())
 
+    def do_stats(self, args):
+        """stats
+        Show the time spent in each phase of connecting, and bytes, chunks,
+        round trips, retries and throughput of the last file transfer and
+        of the last multi-file command (mput, mget, put -r, get -r or sync).
+        """
+        if self.__is_open():
+            times = self.fe.connect_times
+            print(
+                " connect: %.2fs (%s)"
+                % (
+                    sum(times.values()),
+                    ", ".join("%s %.2fs" % t for t in times.items()),
+                )
+            )
+            if self.fe.last_transfer is None and self.fe.last_batch is None:
+                print("No transfers yet")
+            for stats in (self.fe.last_transfer, self.fe.last_batch):
+                if stats is not None:
+                    print(" %s" % stats)
+
+    def do_profile(self, args):
+        """profile [refresh]
+        Show the capabilities recorded for the connected device, which are
+        used to set up the connection quickly. With "refresh", probe the
+        device again.
+        """
+        if self.__is_open():
+            if self.fe.profiles is None:
+                self.__error("Device profiles are disabled (--no-device-profile)")
+                return
+
+            if args.strip() == "refresh":
+                try:
+                    self.fe.refresh_profile()
+                except PyboardError as e:
+                    logging.error(e)
+                    self.__error(str(e))
+                    return
+            elif args.strip():
+                self.__error("Unknown argument: %s" % args.strip())
+                return
+
+            if self.fe.profile is None:
+                print("No profile, the device has no unique id")
+            else:
+                self.fe.save_profile()
+                for line in devprofile.describe(self.fe.profile):
+                    print(" %s" % line)
+
     def do_cd(self, args):
         """cd <TARGET DIR>
         Change current remote directory to given target.
@@ -369,10 +539,16 @@ class MpFileShell(cmd.Cmd):
         print(os.getcwd())
 
     def do_put(self, args):
-        """put <LOCAL FILE> [<REMOTE FILE>]
+        """put [-d] [--resume] <LOCAL FILE> [<REMOTE FILE>]
+        put -r <LOCAL DIR> [<REMOTE DIR>]
         Upload local file. If the second parameter is given,
         its value is used for the remote file name. Otherwise the
         remote file will be named the same as the local file.
+
+        With "-d", only the blocks which differ from an existing
+        remote file are uploaded. With "--resume", an interrupted
+        upload is continued where it stopped. With "-r", the local
+        directory is uploaded with all its files and subdirectories.
         """
 
         if not len(args):
@@ -382,6 +558,13 @@ class MpFileShell(cmd.Cmd):
             s_args = self.__parse_file_names(args)
             if not s_args:
                 return
+
+            opts, s_args = self.__parse_options(s_args, ("-d", "-r", "--resume"))
+            if opts is None:
+                return
+            elif not s_args:
+                self.__error("Missing arguments: <LOCAL FILE> [<REMOTE FILE>]")
+                return
             elif len(s_args) > 2:
                 self.__error(
                     "Only one ore two arguments allowed: <LOCAL FILE> [<REMOTE FILE>]"
@@ -390,13 +573,27 @@ class MpFileShell(cmd.Cmd):
 
             lfile_name = s_args[0]
 
+            if "-r" in opts:
+                try:
+                    self.fe.put_tree(
+                        lfile_name, s_args[1] if len(s_args) > 1 else None, True
+                    )
+                except IOError as e:
+                    self.__error(str(e))
+                return
+
             if len(s_args) > 1:
                 rfile_name = s_args[1]
             else:
                 rfile_name = lfile_name
 
             try:
-                self.fe.put(lfile_name, rfile_name)
+                self.fe.put(
+                    lfile_name,
+                    rfile_name,
+                    delta="-d" in opts,
+                    resume="--resume" in opts,
+                )
             except IOError as e:
                 self.__error(str(e))
 
@@ -421,11 +618,74 @@ class MpFileShell(cmd.Cmd):
             except IOError as e:
                 self.__error(str(e))
 
+    def do_sync(self, args):
+        """sync [-n] [--delete] [--manifest] <LOCAL DIR> [<REMOTE DIR>]
+        Upload all new and changed files from the local directory (and
+        its subdirectories) to the remote directory. If no remote
+        directory is given, the current remote directory is used.
+        Files with the same size and content hash are skipped.
+
+        -n          dry run, only show what would be done
+        --delete    remove remote files which don't exist locally
+        --manifest  keep the remote hashes in a manifest file on the
+                    device, so unchanged files are not rehashed next time
+        """
+
+        if not len(args):
+            self.__error("Missing arguments: <LOCAL DIR> [<REMOTE DIR>]")
+
+        elif self.__is_open():
+            s_args = self.__parse_file_names(args)
+            if not s_args:
+                return
+
+            opts, s_args = self.__parse_options(
+                s_args, ("-n", "--delete", "--manifest")
+            )
+            if opts is None:
+                return
+            elif not s_args:
+                self.__error("Missing arguments: <LOCAL DIR> [<REMOTE DIR>]")
+                return
+            elif len(s_args) > 2:
+                self.__error(
+                    "Only one ore two arguments allowed: <LOCAL DIR> [<REMOTE DIR>]"
+                )
+                return
+
+            try:
+                actions = self.fe.sync(
+                    s_args[0],
+                    s_args[1] if len(s_args) > 1 else None,
+                    delete="--delete" in opts,
+                    dry_run="-n" in opts,
+                    manifest="--manifest" in opts,
+                    verbose="-n" not in opts,
+                )
+
+                if "-n" in opts:
+                    marks = {"md": "+", "put": "+", "update": "~", "rm": "-"}
+                    for action, path in actions:
+                        print(" %s %s" % (marks[action], path or "."))
+
+                if not actions:
+                    print("Everything up to date")
+
+            except IOError as e:
+                self.__error(str(e))
+
+    complete_sync = complete_lcd
+
     def do_get(self, args):
-        """get <REMOTE FILE> [<LOCAL FILE>]
+        """get [--resume] <REMOTE FILE> [<LOCAL FILE>]
+        get -r <REMOTE DIR> [<LOCAL DIR>]
         Download remote file. If the second parameter is given,
         its value is used for the local file name. Otherwise the
         locale file will be named the same as the remote file.
+
+        With "--resume", an interrupted download is continued where
+        it stopped. With "-r", the remote directory is downloaded with
+        all its files and subdirectories.
         """
 
         if not len(args):
@@ -435,6 +695,13 @@ class MpFileShell(cmd.Cmd):
             s_args = self.__parse_file_names(args)
             if not s_args:
                 return
+
+            opts, s_args = self.__parse_options(s_args, ("-r", "--resume"))
+            if opts is None:
+                return
+            elif not s_args:
+                self.__error("Missing arguments: <REMOTE FILE> [<LOCAL FILE>]")
+                return
             elif len(s_args) > 2:
                 self.__error(
                     "Only one ore two arguments allowed: <REMOTE FILE> [<LOCAL FILE>]"
@@ -443,13 +710,22 @@ class MpFileShell(cmd.Cmd):
 
             rfile_name = s_args[0]
 
+            if "-r" in opts:
+                try:
+                    self.fe.get_tree(
+                        rfile_name, s_args[1] if len(s_args) > 1 else None, True
+                    )
+                except IOError as e:
+                    self.__error(str(e))
+                return
+
             if len(s_args) > 1:
                 lfile_name = s_args[1]
             else:
                 lfile_name = rfile_name
 
             try:
-                self.fe.get(rfile_name, lfile_name)
+                self.fe.get(rfile_name, lfile_name, resume="--resume" in opts)
             except IOError as e:
                 self.__error(str(e))
 
@@ -789,6 +1065,85 @@ def main():
         default=False,
     )
 
+    parser.add_argument(
+        "--low-latency",
+        help="tune the serial port for latency (where the OS and permissions allow)",
+        action="store_true",
+        default=False,
+    )
+
+    parser.add_argument(
+        "--compress",
+        help="compress file transfers (if supported by the device)",
+        action="store_true",
+        default=False,
+    )
+
+    parser.add_argument(
+        "--agent",
+        help="install a helper module (%s.py) on the device to speed up commands"
+        % agent.NAME,
+        action="store_true",
+        default=False,
+    )
+
+    parser.add_argument(
+        "--no-device-profile",
+        help="don't keep profiles of the devices in %s" % devprofile.CACHE_DIR,
+        action="store_true",
+        default=False,
+    )
+
+    parser.add_argument(
+        "--profile",
+        help="print the time spent in each command and its phases at exit",
+        action="store_true",
+        default=False,
+    )
+
+    parser.add_argument(
+        "--profile-trace",
+        help="like --profile, and write the timeline as Chrome trace (JSON) to file",
+        metavar="file",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--daemon",
+        help="run the commands given with -c in a daemon, which keeps the "
+        "connection open for the next call (started if not running)",
+        action="store_true",
+        default=False,
+    )
+
+    parser.add_argument(
+        "--daemon-stop",
+        help="stop the daemon",
+        action="store_true",
+        default=False,
+    )
+
+    parser.add_argument(
+        "--serve",
+        help="run as daemon (in the foreground)",
+        action="store_true",
+        default=False,
+    )
+
+    parser.add_argument(
+        "--socket",
+        help="socket of the daemon (default: %s)" % daemon.socket_path(),
+        default=None,
+    )
+
+    parser.add_argument(
+        "--idle-timeout",
+        help="seconds after which an unused daemon exits (default: %d)"
+        % daemon.IDLE_TIMEOUT,
+        type=int,
+        default=daemon.IDLE_TIMEOUT,
+    )
+
     list_parser = parser.add_mutually_exclusive_group()
     list_parser.add_argument(
         "-ls",
@@ -886,7 +1241,65 @@ def main():
         % (sys.version_info[0], sys.version_info[1], serial.VERSION)
     )
 
-    mpfs = MpFileShell(not args.nocolor, not args.nocache, args.reset)
+    profiler = None
+
+    if args.profile or args.profile_trace is not None:
+        profiler = Profiler()
+
+        def report():
+            sys.stderr.write("\n")
+            profiler.print_summary(sys.stderr)
+            if args.profile_trace is not None:
+                profiler.write_chrome_trace(args.profile_trace)
+
+        atexit.register(report)
+
+    if args.daemon_stop:
+        return 0 if daemon.stop(args.socket) else 1
+
+    if args.daemon and args.command is not None:
+        commands = []
+        if (args.board or args.open) is not None:
+            commands.append("open %s" % (args.board or args.open))
+        commands += [
+            c.strip()
+            for c in " ".join(args.command).split(";")
+            if len(c.strip()) > 0 and not c.strip().startswith("#")
+        ]
+
+        # the daemon is started with the same options
+        start_args = [
+            flag
+            for flag, on in (
+                ("--nocache", args.nocache),
+                ("--reset", args.reset),
+                ("--low-latency", args.low_latency),
+                ("--compress", args.compress),
+                ("--agent", args.agent),
+                ("--no-device-profile", args.no_device_profile),
+            )
+            if on
+        ]
+        start_args += ["--idle-timeout", str(args.idle_timeout)]
+        if args.logfile is not None:
+            start_args += ["--logfile", args.logfile, "--loglevel", args.loglevel]
+
+        return daemon.run(commands, args.socket, start_args)
+
+    mpfs = MpFileShell(
+        not args.nocolor and not args.serve,
+        not args.nocache,
+        args.reset,
+        args.compress,
+        args.agent,
+        profiler,
+        None if args.no_device_profile else devprofile.CACHE_DIR,
+        args.low_latency,
+    )
+
+    if args.serve:
+        daemon.Daemon(mpfs, args.socket, args.idle_timeout).serve()
+        return 0
 
     if args.ask:
         dev = ask_device()
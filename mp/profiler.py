@@ -0,0 +1,167 @@
+##
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Stefan Wendler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+
+class _NoSpan(object):
+    """
+    Span which records nothing, used while profiling is off.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+class _Span(object):
+    def __init__(self, profiler, name, cat):
+
+        self.profiler = profiler
+        self.name = name
+        self.cat = cat
+        self.start = None
+
+    def __enter__(self):
+
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+
+        self.profiler.record(self.name, self.cat, self.start, time.perf_counter())
+        return False
+
+
+class Profiler(object):
+    """
+    Records how long named phases (spans) take, e.g. waiting for the raw REPL
+    prompt or a whole "put". Spans may be nested, the summary and the trace
+    show them as recorded.
+    """
+
+    def __init__(self):
+
+        self.origin = time.perf_counter()
+        self.spans = []
+
+    def span(self, name, cat="mpfs"):
+        """
+        :param name:    name of the phase, spans with the same name are summed up
+        :param cat:     category (e.g. "pyboard"), shown in the Chrome trace
+        :return:        context manager measuring its body
+        """
+
+        return _Span(self, name, cat)
+
+    def record(self, name, cat, start, end):
+
+        self.spans.append((name, cat, start, end, threading.get_ident()))
+
+    def summary(self):
+        """
+        :return:    list of tuples (name, calls, total, max) sorted by total
+                    time, times in seconds
+        """
+
+        totals = {}
+
+        for name, _, start, end, _ in self.spans:
+            calls, total, longest = totals.get(name, (0, 0.0, 0.0))
+            totals[name] = (calls + 1, total + end - start, max(longest, end - start))
+
+        return sorted(((name,) + t for name, t in totals.items()), key=lambda s: -s[2])
+
+    def print_summary(self, out=None):
+
+        out = out or sys.stdout
+
+        out.write(
+            "%-32s %8s %12s %12s %12s\n"
+            % ("span", "calls", "total ms", "mean ms", "max ms")
+        )
+
+        for name, calls, total, longest in self.summary():
+            out.write(
+                "%-32s %8d %12.2f %12.2f %12.2f\n"
+                % (name, calls, total * 1000, total * 1000 / calls, longest * 1000)
+            )
+
+    def chrome_trace(self):
+        """
+        :return:    the spans in the Chrome trace event format, which could be
+                    loaded into chrome://tracing or https://ui.perfetto.dev
+        """
+
+        pid = os.getpid()
+
+        return {
+            "traceEvents": [
+                {
+                    "name": name,
+                    "cat": cat,
+                    "ph": "X",
+                    "ts": (start - self.origin) * 1e6,
+                    "dur": (end - start) * 1e6,
+                    "pid": pid,
+                    "tid": tid,
+                }
+                for name, cat, start, end, tid in self.spans
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def write_chrome_trace(self, path):
+
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+
+def profiled(func):
+    """
+    Decorator recording each call of a method as span, if the object it
+    belongs to has a profiler.
+    """
+
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+
+        if self.profiler is None:
+            return func(self, *args, **kwargs)
+
+        with self.profiler.span(name, "mpfexp"):
+            return func(self, *args, **kwargs)
+
+    return wrapper
@@ -2,8 +2,12 @@
 """
 Pyboard REPL interface
 """
+import contextlib
+import logging
+import struct
 import sys
-import time
+
+from mp.profiler import NO_SPAN
 
 try:
     stdout = sys.stdout.buffer
@@ -23,92 +27,201 @@ class PyboardError(BaseException):
 
 
 class Pyboard:
-    def __init__(self, conbase):
+
+    # attempts (and seconds of silence for each) to get the raw REPL prompt
+    RAW_REPL_TRIES = 5
+    RAW_REPL_TIMEOUT = 1.0
+
+    def __init__(self, conbase, profiler=None):
 
         self.con = conbase
 
+        # try raw-paste mode until the device turns out not to support it
+        self.use_raw_paste = True
+
+        # mp.profiler.Profiler recording the phases of each command, if any
+        self.profiler = profiler
+
+        # bytes received, but not consumed yet (e.g. read beyond an ending)
+        self.rx = bytearray()
+
+    def span(self, name):
+
+        if self.profiler is None:
+            return NO_SPAN
+
+        return self.profiler.span(name, "pyboard")
+
     def close(self):
 
         if self.con is not None:
             self.con.close()
 
+    def __read(self, size):
+        """
+        Read size bytes, blocking like the connection does.
+        """
+
+        if len(self.rx) < size:
+            self.rx += self.con.read(size - len(self.rx))
+
+        data = bytes(self.rx[:size])
+        del self.rx[:size]
+        return data
+
+    def __in_waiting(self):
+
+        return len(self.rx) + self.con.inWaiting()
+
+    def __receive(self, timeout):
+        """
+        Move everything the connection has into rx, if nothing is there yet
+        wait up to timeout seconds for it.
+
+        :return:    False if nothing arrived within timeout
+        """
+
+        n = self.con.inWaiting()
+
+        if not n and not self.rx:
+            if not self.con.wait(timeout):
+                return False
+            n = self.con.inWaiting()
+
+        if n:
+            self.rx += self.con.read(n)
+
+        return True
+
     def read_until(self, min_num_bytes, ending, timeout=10, data_consumer=None):
+        """
+        Read until ending was received, or nothing arrived for timeout seconds.
+
+        If a data_consumer is given, all data is passed to it as it arrives and
+        is not accumulated, only the tail needed to detect ending is returned.
+        """
+
+        if len(self.rx) < min_num_bytes and not self.__receive(timeout):
+            return b""
+
+        data = bytearray(self.__read(min_num_bytes))
+        scanned = 0
+        consumed = 0
 
-        data = self.con.read(min_num_bytes)
-        if data_consumer:
-            data_consumer(data)
-        timeout_count = 0
         while True:
-            if data.endswith(ending):
+            # data up to scanned was searched already, but might hold the
+            # beginning of ending
+            found = data.find(ending, max(scanned - len(ending) + 1, 0))
+
+            if found >= 0:
+                # keep what follows ending for the next read
+                end = found + len(ending)
+                self.rx[:0] = data[end:]
+                del data[end:]
+
+            if data_consumer and len(data) > consumed:
+                data_consumer(bytes(data[consumed:]))
+                del data[: -len(ending)]
+                consumed = len(data)
+
+            if found >= 0:
+                break
+
+            scanned = len(data)
+
+            if not self.__receive(timeout):
                 break
-            elif self.con.inWaiting() > 0:
-                new_data = self.con.read(1)
-                data = data + new_data
-                if data_consumer:
-                    data_consumer(new_data)
-                timeout_count = 0
-            else:
-                timeout_count += 1
-                if timeout is not None and timeout_count >= 100 * timeout:
-                    break
-                time.sleep(0.01)
-        return data
+
+            data += self.rx
+            del self.rx[:]
+
+        return bytes(data)
 
     def enter_raw_repl(self):
 
-        time.sleep(0.5)  # allow some time for board to reset
-        self.con.write(b"\r\x03\x03")  # ctrl-C twice: interrupt any running program
+        with self.span("enter_raw_repl"):
+            self.__enter_raw_repl()
 
-        # flush input (without relying on serial.flushInput())
-        n = self.con.inWaiting()
-        while n > 0:
-            self.con.read(n)
+    def __request_raw_repl(self, prompt):
+        """
+        Send ctrl-A until the raw REPL prompt shows up. Whatever arrives before
+        it (e.g. the output of an interrupted program) is skipped.
+        """
+
+        for _ in range(self.RAW_REPL_TRIES):
+            with self.span("raw_repl_prompt"):
+                self.con.write(b"\r\x01")  # ctrl-A: enter raw REPL
+                data = self.read_until(1, prompt, timeout=self.RAW_REPL_TIMEOUT)
+
+            if data.endswith(prompt):
+                return
+
+            # the board might have been booting, or busy with main.py
+            with self.span("interrupt"):
+                self.con.write(b"\r\x03\x03")
+                self.con.drain()
+                del self.rx[:]
+
+        print(data)
+        raise PyboardError("could not enter raw repl")
+
+    def __enter_raw_repl(self):
+
+        with self.span("interrupt"):
+            # ctrl-C twice: interrupt any running program
+            self.con.write(b"\r\x03\x03")
+
+            # drop what is already there, the rest is skipped while waiting
+            # for the prompt
+            del self.rx[:]
             n = self.con.inWaiting()
+            if n > 0:
+                self.con.read(n)
 
         if self.con.survives_soft_reset():
 
-            self.con.write(b"\r\x01")  # ctrl-A: enter raw REPL
-            data = self.read_until(1, b"raw REPL; CTRL-B to exit\r\n>")
+            self.__request_raw_repl(b"raw REPL; CTRL-B to exit\r\n>")
 
-            if not data.endswith(b"raw REPL; CTRL-B to exit\r\n>"):
-                print(data)
-                raise PyboardError("could not enter raw repl")
-
-            self.con.write(b"\x04")  # ctrl-D: soft reset
-            data = self.read_until(1, b"soft reboot\r\n")
-            if not data.endswith(b"soft reboot\r\n"):
-                print(data)
-                raise PyboardError("could not enter raw repl")
+            with self.span("soft_reset"):
+                self.con.write(b"\x04")  # ctrl-D: soft reset
+                data = self.read_until(1, b"soft reboot\r\n")
+                if not data.endswith(b"soft reboot\r\n"):
+                    print(data)
+                    raise PyboardError("could not enter raw repl")
 
-            # By splitting this into 2 reads, it allows boot.py to print stuff,
-            # which will show up after the soft reboot and before the raw REPL.
-            data = self.read_until(1, b"raw REPL; CTRL-B to exit\r\n")
+                # By splitting this into 2 reads, it allows boot.py to print stuff,
+                # which will show up after the soft reboot and before the raw REPL.
+                data = self.read_until(1, b"raw REPL; CTRL-B to exit\r\n")
             if not data.endswith(b"raw REPL; CTRL-B to exit\r\n"):
                 print(data)
                 raise PyboardError("could not enter raw repl")
 
         else:
 
-            self.con.write(b"\r\x01")  # ctrl-A: enter raw REPL
-            data = self.read_until(1, b"raw REPL; CTRL-B to exit\r\n")
-
-            if not data.endswith(b"raw REPL; CTRL-B to exit\r\n"):
-                print(data)
-                raise PyboardError("could not enter raw repl")
+            self.__request_raw_repl(b"raw REPL; CTRL-B to exit\r\n")
 
     def exit_raw_repl(self):
         self.con.write(b"\r\x02")  # ctrl-B: enter friendly REPL
 
     def follow(self, timeout, data_consumer=None):
 
+        with self.span("follow"):
+            return self.__follow(timeout, data_consumer)
+
+    def __follow(self, timeout, data_consumer=None):
+
         # wait for normal output
-        data = self.read_until(1, b"\x04", timeout=timeout, data_consumer=data_consumer)
+        with self.span("follow_output"):
+            data = self.read_until(
+                1, b"\x04", timeout=timeout, data_consumer=data_consumer
+            )
         if not data.endswith(b"\x04"):
             raise PyboardError("timeout waiting for first EOF reception")
         data = data[:-1]
 
         # wait for error output
-        data_err = self.read_until(1, b"\x04", timeout=timeout)
+        with self.span("follow_error"):
+            data_err = self.read_until(1, b"\x04", timeout=timeout)
         if not data_err.endswith(b"\x04"):
             raise PyboardError("timeout waiting for second EOF reception")
         data_err = data_err[:-1]
@@ -116,27 +229,116 @@ class Pyboard:
         # return normal and error output
         return data, data_err
 
+    def raw_paste_write(self, command_bytes):
+
+        # read initial header, with window size
+        data = self.__read(2)
+        window_size = struct.unpack("<H", data)[0]
+        window_remain = window_size
+
+        # the end of data goes out together with the last window
+        with self.con.buffered():
+
+            # write out the command_bytes data
+            i = 0
+            while i < len(command_bytes):
+                while window_remain == 0 or self.__in_waiting():
+                    # the device can only grant more once it got the data
+                    self.con.flush()
+                    data = self.__read(1)
+                    if data == b"\x01":
+                        # device indicated that a new window of data can be sent
+                        window_remain += window_size
+                    elif data == b"\x04":
+                        # device indicated abrupt end, acknowledge it and finish
+                        self.con.write(b"\x04")
+                        return
+                    else:
+                        raise PyboardError(
+                            "unexpected read during raw paste: {}".format(data)
+                        )
+
+                # send out as much data as possible that fits within the allowed window
+                b = command_bytes[i : min(i + window_remain, len(command_bytes))]
+                self.con.write(b)
+                window_remain -= len(b)
+                i += len(b)
+
+            # indicate end of data
+            self.con.write(b"\x04")
+
+        # wait for device to acknowledge end of data
+        data = self.read_until(1, b"\x04")
+        if not data.endswith(b"\x04"):
+            raise PyboardError("could not complete raw paste: {}".format(data))
+
     def exec_raw_no_follow(self, command):
 
+        with self.span("exec_raw_no_follow"):
+            self.__exec_raw_no_follow(command)
+
+    def __exec_raw_no_follow(self, command):
+
         if isinstance(command, bytes):
             command_bytes = command
         else:
             command_bytes = bytes(command.encode("utf-8"))
 
         # check we have a prompt
-        data = self.read_until(1, b">")
+        with self.span("wait_prompt"):
+            data = self.read_until(1, b">")
         if not data.endswith(b">"):
             raise PyboardError("could not enter raw repl")
 
-        # write command
-        self.con.write(command_bytes)
-        self.con.write(b"\x04")
+        if self.use_raw_paste:
+            # try to enter raw-paste mode
+            with self.span("raw_paste_handshake"):
+                self.con.write(b"\x05A\x01")
+                data = self.__read(2)
+            if data == b"R\x01":
+                # device supports raw-paste mode, write out the command using it
+                with self.span("raw_paste_write"):
+                    return self.raw_paste_write(command_bytes)
+            elif data != b"R\x00":
+                # device doesn't know about raw-paste and just restarted the raw REPL
+                data = self.read_until(1, b"w REPL; CTRL-B to exit\r\n>")
+                if not data.endswith(b"w REPL; CTRL-B to exit\r\n>"):
+                    print(data)
+                    raise PyboardError("could not enter raw repl")
+
+            # don't try to use raw-paste mode again for this connection
+            logging.info("raw-paste mode not supported, using raw REPL")
+            self.use_raw_paste = False
+
+        # write command, and its end in the same packet
+        with self.span("write"), self.con.buffered():
+            self.con.write(command_bytes)
+            self.con.write(b"\x04")
 
         # check if we could exec command
-        data = self.read_until(2, b"OK", timeout=0.5)
+        with self.span("wait_ok"):
+            data = self.read_until(2, b"OK", timeout=0.5)
         if data != b"OK":
             raise PyboardError("could not exec command")
 
+    @contextlib.contextmanager
+    def direct(self):
+        """
+        Context for using the connection directly (e.g. for the file transfer
+        protocol of WebREPL) while the raw REPL waits for a command. The
+        prompt the raw REPL sent is taken before, and still due to the next
+        command after.
+        """
+
+        data = self.read_until(1, b">")
+        if not data.endswith(b">") or self.rx:
+            raise PyboardError("raw repl not waiting for a command")
+
+        try:
+            yield self.con
+        finally:
+            self.rx[:0] = b">"
+
     def exec_raw(self, command, timeout=10, data_consumer=None):
         self.exec_raw_no_follow(command)
         return self.follow(timeout, data_consumer)
@@ -146,8 +348,8 @@ class Pyboard:
         ret = ret.strip()
         return ret
 
-    def exec_(self, command):
-        ret, ret_err = self.exec_raw(command)
+    def exec_(self, command, data_consumer=None):
+        ret, ret_err = self.exec_raw(command, data_consumer=data_consumer)
         if ret_err:
             raise PyboardError("exception", ret, ret_err)
         return ret
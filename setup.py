@@ -13,7 +13,7 @@ setup(
     url="https://github.com/wendlers/mpfshell",
     long_description=open("README.md").read(),
     long_description_content_type="text/markdown",
-    install_requires=["pyserial", "colorama", "websocket_client"],
+    install_requires=["pyserial", "colorama", "websocket_client >= 1.0"],
     packages=["mp"],
     include_package_data=True,
     keywords=["micropython", "shell", "file transfer", "development"],
@@ -0,0 +1,344 @@
+##
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Stefan Wendler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+"""
+Benchmarks for the transfer and listing paths of the MpFileExplorer.
+
+By default, they run against a simulated device (see mp/consim.py) in a
+temporary directory, optionally paced to a baudrate. Results are printed
+(or written) as JSON, to compare them between releases.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from mp import version
+from mp.mpfexp import MpFileExplorer
+from mp.mpfexp import MpFileExplorerCaching
+
+WORK_DIR = "mpfs-bench"
+
+SIZES = [1024, 4096, 16384, 65536]
+DIR_SIZES = [1, 10, 50]
+
+
+def _timed(func, *args, **kwargs):
+
+    start = time.time()
+    func(*args, **kwargs)
+    return time.time() - start
+
+
+def _summary(times):
+
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "max": max(times),
+    }
+
+
+def _make_work_dir(fe):
+
+    if WORK_DIR not in fe.ls(add_files=False):
+        fe.md(WORK_DIR)
+    fe.cd(WORK_DIR)
+
+
+def _remove_work_dir(fe):
+
+    fe.cd("/")
+    fe.exec_(
+        "def rm(p):\n"
+        "    for e in uos.ilistdir(p):\n"
+        "        if e[1] == 0x4000:\n"
+        "            rm(p + '/' + e[0])\n"
+        "        else:\n"
+        "            uos.remove(p + '/' + e[0])\n"
+        "    uos.rmdir(p)\n"
+        "rm('%s')" % fe._fqn(WORK_DIR)
+    )
+
+
+def bench_connect(constr, repeat):
+    """
+    :return:    seconds to connect and set up the explorer
+    """
+
+    times = []
+
+    for _ in range(repeat):
+        start = time.time()
+        fe = MpFileExplorer(constr)
+        times.append(time.time() - start)
+        fe.close()
+
+    return _summary(times)
+
+
+def bench_transfers(fe, sizes, repeat, tmp):
+    """
+    :return:    put and get results per file size
+    """
+
+    results = []
+
+    for size in sizes:
+        src = os.path.join(tmp, "put-%d.bin" % size)
+        dst = os.path.join(tmp, "get-%d.bin" % size)
+
+        with open(src, "wb") as f:
+            f.write(os.urandom(size))
+
+        for op, args in (("put", (src, "data.bin")), ("get", ("data.bin", dst))):
+            times = []
+
+            for _ in range(repeat):
+                times.append(_timed(getattr(fe, op), *args))
+
+            stats = fe.last_transfer
+            results.append(
+                {
+                    "op": op,
+                    "size": size,
+                    "seconds": _summary(times),
+                    "bytes_per_sec": size / statistics.median(times),
+                    "chunks": stats.chunks,
+                    "round_trips": stats.round_trips,
+                }
+            )
+
+        fe.rm("data.bin")
+
+    return results
+
+
+def bench_ls(fe, dir_sizes, repeat):
+    """
+    :return:    ls latency per number of directory entries
+    """
+
+    results = []
+
+    for n in dir_sizes:
+        name = "ls-%d" % n
+        fe.md(name)
+        fe.exec_(
+            "for i in range(%d):\n"
+            "    open('%s/f%%d' %% i, 'w').close()" % (n, fe._fqn(name))
+        )
+
+        fe.cd(name)
+        times = [_timed(fe.ls) for _ in range(repeat)]
+        fe.cd("..")
+
+        results.append({"entries": n, "seconds": _summary(times)})
+
+    return results
+
+
+def bench_caching(constr, dir_sizes, repeat):
+    """
+    Run a typical interactive session (browse, upload, list) against the
+    caching explorer.
+
+    :return:    cache hit rate and cached vs. uncached ls latency
+    """
+
+    fe = MpFileExplorerCaching(constr)
+
+    try:
+        fe.cd(WORK_DIR)
+
+        uncached = []
+        cached = []
+
+        for n in dir_sizes:
+            fe.cd("ls-%d" % n)
+            uncached.append(_timed(fe.ls))
+            for _ in range(repeat):
+                cached.append(_timed(fe.ls))
+            fe.puts("new.py", "pass\n")
+            fe.ls()
+            fe.rm("new.py")
+            fe.cd("..")
+            fe.ls()
+
+        lookups = fe.cache_hits + fe.cache_misses
+
+        return {
+            "hits": fe.cache_hits,
+            "misses": fe.cache_misses,
+            "hit_rate": fe.cache_hits / float(lookups) if lookups else 0.0,
+            "ls_uncached": _summary(uncached),
+            "ls_cached": _summary(cached),
+        }
+
+    finally:
+        fe.close()
+
+
+def run(constr, sizes=SIZES, dir_sizes=DIR_SIZES, repeat=3):
+    """
+    Run all benchmarks.
+
+    :return:    results as a dict, ready to be dumped as JSON
+    """
+
+    results = {
+        "meta": {
+            "version": version.FULL,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "constr": constr,
+            "repeat": repeat,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "connect": bench_connect(constr, repeat),
+    }
+
+    tmp = tempfile.mkdtemp()
+    fe = MpFileExplorer(constr)
+
+    try:
+        _make_work_dir(fe)
+        results["transfers"] = bench_transfers(fe, sizes, repeat, tmp)
+        results["ls"] = bench_ls(fe, dir_sizes, repeat)
+        results["caching"] = bench_caching(constr, dir_sizes, repeat)
+        _remove_work_dir(fe)
+
+    finally:
+        fe.close()
+        shutil.rmtree(tmp)
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare the throughput of put/get against a previous run.
+
+    :return:    list of regressions as strings, empty if there are none
+    """
+
+    before = dict(
+        ((r["op"], r["size"]), r["bytes_per_sec"]) for r in baseline["transfers"]
+    )
+    regressions = []
+
+    for r in results["transfers"]:
+        old = before.get((r["op"], r["size"]))
+        if old and r["bytes_per_sec"] < old * (1 - threshold):
+            regressions.append(
+                "%s %d B: %d B/s, was %d B/s"
+                % (r["op"], r["size"], r["bytes_per_sec"], old)
+            )
+
+    return regressions
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument(
+        "--testcon",
+        help="connection string (default: a simulated device in a temp. directory)",
+        default=None,
+    )
+    parser.add_argument(
+        "--baudrate",
+        help="baudrate to pace the simulated device to (default: unpaced)",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--sizes",
+        help="file sizes for put/get (default: %s)" % ",".join(map(str, SIZES)),
+        default=",".join(map(str, SIZES)),
+    )
+    parser.add_argument(
+        "--dir-sizes",
+        help="directory sizes for ls (default: %s)" % ",".join(map(str, DIR_SIZES)),
+        default=",".join(map(str, DIR_SIZES)),
+    )
+    parser.add_argument("--repeat", help="runs per measurement", type=int, default=3)
+    parser.add_argument("--output", help="write JSON to file", default=None)
+    parser.add_argument(
+        "--compare", help="JSON file of a previous run to compare with", default=None
+    )
+    parser.add_argument(
+        "--threshold",
+        help="throughput drop which counts as regression (default: 0.2)",
+        type=float,
+        default=0.2,
+    )
+
+    args = parser.parse_args()
+
+    sim_root = None
+    constr = args.testcon
+
+    if constr is None:
+        sim_root = tempfile.mkdtemp()
+        open(os.path.join(sim_root, "boot.py"), "w").close()
+        constr = "sim:%s" % sim_root
+        if args.baudrate:
+            constr += ",%d" % args.baudrate
+
+    try:
+        results = run(
+            constr,
+            [int(s) for s in args.sizes.split(",")],
+            [int(s) for s in args.dir_sizes.split(",")],
+            args.repeat,
+        )
+    finally:
+        if sim_root is not None:
+            shutil.rmtree(sim_root)
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print("")
+    else:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+
+        for r in regressions:
+            sys.stderr.write("regression: %s\n" % r)
+
+        return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
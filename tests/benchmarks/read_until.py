@@ -0,0 +1,199 @@
+##
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Stefan Wendler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+"""
+Microbenchmark of Pyboard.read_until: compares exec round trips of the bulk
+reading, blocking implementation with the former byte-wise, sleep-polling one.
+
+The simulated device is served through a pseudo terminal, so the serial
+connection is used like with a real board (POSIX only).
+"""
+
+import argparse
+import json
+import os
+import select
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tty
+
+from mp.conserial import ConSerial
+from mp.consim import ConSim
+from mp.pyboard import Pyboard
+
+SIZES = [10, 1000, 10000]
+
+
+class LegacyPyboard(Pyboard):
+    """
+    Pyboard with read_until as it was before.
+    """
+
+    def read_until(self, min_num_bytes, ending, timeout=10, data_consumer=None):
+
+        data = self.con.read(min_num_bytes)
+        if data_consumer:
+            data_consumer(data)
+        timeout_count = 0
+        while True:
+            if data.endswith(ending):
+                break
+            elif self.con.inWaiting() > 0:
+                new_data = self.con.read(1)
+                data = data + new_data
+                if data_consumer:
+                    data_consumer(new_data)
+                    data = data[-len(ending) :]
+                timeout_count = 0
+            else:
+                timeout_count += 1
+                if timeout is not None and timeout_count >= 100 * timeout:
+                    break
+                time.sleep(0.01)
+        return data
+
+
+class PtyDevice(threading.Thread):
+    """
+    Serves a simulated device on a pseudo terminal, answering delay seconds
+    after a write (e.g. for executing the code).
+    """
+
+    def __init__(self, root, delay=0.0):
+
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+        self.sim = ConSim(root)
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.delay = delay
+        self.running = True
+
+    def run(self):
+
+        while self.running:
+            if not select.select([self.master], [], [], 0.1)[0]:
+                continue
+
+            self.sim.write(os.read(self.master, 4096))
+
+            n = self.sim.inWaiting()
+            if n:
+                time.sleep(self.delay)
+                os.write(self.master, self.sim.read(n))
+
+    def stop(self):
+
+        self.running = False
+        self.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+def bench(cls, port, size, repeat):
+    """
+    :return:    seconds and CPU seconds per exec of a command printing size bytes
+    """
+
+    pyb = cls(ConSerial(port))
+
+    try:
+        pyb.enter_raw_repl()
+        command = "print('x' * %d)" % size
+
+        start = time.time()
+        cpu = time.process_time()
+
+        for _ in range(repeat):
+            out = pyb.exec_(command)
+            assert len(out) == size + 2
+
+        return {
+            "seconds": (time.time() - start) / repeat,
+            "cpu_seconds": (time.process_time() - cpu) / repeat,
+        }
+
+    finally:
+        pyb.close()
+
+
+def run(sizes=SIZES, repeat=20, delay=0.002):
+
+    root = tempfile.mkdtemp()
+    device = PtyDevice(root, delay)
+    device.start()
+
+    results = []
+
+    try:
+        for size in sizes:
+            result = {"size": size}
+
+            for name, cls in (("legacy", LegacyPyboard), ("current", Pyboard)):
+                result[name] = bench(cls, device.port, size, repeat)
+
+            result["speedup"] = (
+                result["legacy"]["seconds"] / result["current"]["seconds"]
+            )
+            results.append(result)
+
+    finally:
+        device.stop()
+        shutil.rmtree(root)
+
+    return results
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument(
+        "--sizes",
+        help="bytes printed per exec (default: %s)" % ",".join(map(str, SIZES)),
+        default=",".join(map(str, SIZES)),
+    )
+    parser.add_argument("--repeat", help="execs per measurement", type=int, default=20)
+    parser.add_argument(
+        "--delay",
+        help="seconds the device takes to answer (default: 0.002)",
+        type=float,
+        default=0.002,
+    )
+
+    args = parser.parse_args()
+
+    json.dump(
+        run([int(s) for s in args.sizes.split(",")], args.repeat, args.delay),
+        sys.stdout,
+        indent=2,
+    )
+    print("")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
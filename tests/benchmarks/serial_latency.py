@@ -0,0 +1,152 @@
+##
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Stefan Wendler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+"""
+Microbenchmark of ConSerial: compares exec round trips in the default and
+the low-latency mode with the former implementation, which formatted its
+debug log messages even with debug logging off.
+
+The simulated device is served through a pseudo terminal (POSIX only). A
+pty has no USB latency timer and no ASYNC_LOW_LATENCY, so the low-latency
+mode only shows its overhead here; on a USB-serial adapter, it saves up to
+the 16 ms the adapter may hold back data for.
+"""
+
+import argparse
+import json
+import logging
+import shutil
+import sys
+import tempfile
+import time
+
+from read_until import PtyDevice
+
+from mp.conserial import ConSerial
+from mp.pyboard import Pyboard
+
+SIZES = [10, 10000]
+
+
+class LegacyConSerial(ConSerial):
+    """
+    ConSerial with logging as it was before.
+    """
+
+    def read(self, size):
+        data = self.serial.read(size)
+        logging.debug("serial read < %s" % str(data))
+        return data
+
+    def _write(self, data):
+        logging.debug("serial write > %s" % str(data))
+        return self.serial.write(data)
+
+
+def bench(con, size, repeat):
+    """
+    :return:    seconds and CPU seconds per exec of a command printing size bytes
+    """
+
+    pyb = Pyboard(con)
+
+    try:
+        pyb.enter_raw_repl()
+        command = "print('x' * %d)" % size
+
+        start = time.time()
+        cpu = time.process_time()
+
+        for _ in range(repeat):
+            out = pyb.exec_(command)
+            assert len(out) == size + 2
+
+        return {
+            "seconds": (time.time() - start) / repeat,
+            "cpu_seconds": (time.process_time() - cpu) / repeat,
+        }
+
+    finally:
+        pyb.close()
+
+
+def run(sizes=SIZES, repeat=50, delay=0.0):
+
+    root = tempfile.mkdtemp()
+    device = PtyDevice(root, delay)
+    device.start()
+
+    # messages are dropped, as with the default log level of the shell
+    logging.getLogger().setLevel(logging.INFO)
+
+    results = []
+
+    try:
+        for size in sizes:
+            result = {"size": size}
+
+            for name, cls, low_latency in (
+                ("legacy", LegacyConSerial, False),
+                ("current", ConSerial, False),
+                ("low_latency", ConSerial, True),
+            ):
+                con = cls(device.port, low_latency=low_latency)
+                result[name] = bench(con, size, repeat)
+
+            results.append(result)
+
+    finally:
+        device.stop()
+        shutil.rmtree(root)
+
+    return results
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument(
+        "--sizes",
+        help="bytes printed per exec (default: %s)" % ",".join(map(str, SIZES)),
+        default=",".join(map(str, SIZES)),
+    )
+    parser.add_argument("--repeat", help="execs per measurement", type=int, default=50)
+    parser.add_argument(
+        "--delay",
+        help="seconds the device takes to answer (default: 0)",
+        type=float,
+        default=0.0,
+    )
+
+    args = parser.parse_args()
+
+    json.dump(
+        run([int(s) for s in args.sizes.split(",")], args.repeat, args.delay),
+        sys.stdout,
+        indent=2,
+    )
+    print("")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,350 @@
+##
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Stefan Wendler
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+##
+"""
+Microbenchmark of ConTelnet: compares login time and put/get throughput of
+the buffered, blocking implementation with the former one, which was built
+on telnetlib, read eagerly and polled with sleeps.
+
+The simulated device is served through a local telnet stand-in, which asks
+for login and password like the telnet server of the WiPy. Both are compared
+on a firmware without raw-paste mode, since telnetlib drops NUL bytes, which
+hangs the former implementation in the raw-paste handshake.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+
+import mp.mpfexp
+from mp.conbase import ConBase
+from mp.conbase import ConError
+from mp.consim import ConSim
+from mp.contelnet import ConTelnet
+from mp.contelnet import IAC
+from mp.contelnet import WILL
+from mp.mpfexp import MpFileExplorer
+
+try:
+    import telnetlib
+except ImportError:
+    # removed from Python 3.13 on, so the former implementation can't run
+    telnetlib = None
+
+SIZES = [1024, 16384, 65536]
+
+USER = "micro"
+PASSWORD = "python"
+
+BANNER = b'\r\nMicroPython (simulated)\r\nType "help()" for more information.\r\n>>> '
+
+
+class LegacyConTelnet(ConBase):
+    """
+    ConTelnet as it was before.
+    """
+
+    PORT = 23
+
+    def __init__(self, ip, user, password, port=PORT):
+        ConBase.__init__(self)
+
+        self.tn = telnetlib.Telnet(ip, port)
+
+        if user == "":
+            self.fifo = deque()
+            return
+
+        if b"Login as:" in self.tn.read_until(b"Login as:", timeout=5.0):
+            self.tn.write(bytes(user.encode("ascii")) + b"\r\n")
+
+            if b"Password:" in self.tn.read_until(b"Password:", timeout=5.0):
+
+                # needed because of internal implementation details of the telnet server
+                time.sleep(0.2)
+                self.tn.write(bytes(password.encode("ascii")) + b"\r\n")
+
+                if b"for more information." in self.tn.read_until(
+                    b'Type "help()" for more information.', timeout=5.0
+                ):
+                    self.fifo = deque()
+                    return
+
+        raise ConError()
+
+    def close(self):
+        self.tn.close()
+
+    def __fill_fifo(self, size):
+
+        while len(self.fifo) < size:
+
+            data = self.tn.read_eager()
+
+            if len(data):
+                self.fifo.extend(data)
+            else:
+                time.sleep(0.25)
+
+    def read(self, size=1):
+
+        self.__fill_fifo(size)
+
+        data = b""
+        while len(data) < size and len(self.fifo) > 0:
+            data += bytes([self.fifo.popleft()])
+
+        return data
+
+    def write(self, data):
+
+        self.tn.write(data)
+        return len(data)
+
+    def inWaiting(self):
+
+        n_waiting = len(self.fifo)
+
+        if not n_waiting:
+            data = self.tn.read_eager()
+            self.fifo.extend(data)
+            return len(data)
+        else:
+            return n_waiting
+
+    def wait(self, timeout):
+
+        start = time.time()
+
+        while not self.inWaiting():
+            if timeout is not None and time.time() - start >= timeout:
+                return False
+            time.sleep(0.001)
+
+        return True
+
+
+class TelnetDevice(threading.Thread):
+    """
+    Serves a simulated device on a local telnet port, one client at a time.
+    """
+
+    def __init__(self, root, raw_paste=True):
+
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+        self.root = root
+        self.raw_paste = raw_paste
+        self.server = socket.socket()
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(1)
+        self.server.settimeout(0.1)
+        self.port = self.server.getsockname()[1]
+        self.running = True
+
+    @staticmethod
+    def __decode(data):
+        """
+        :return:    data from the client without escapes and option answers
+        """
+
+        out = bytearray()
+        i = 0
+
+        while i < len(data):
+            if data[i] != IAC:
+                out.append(data[i])
+                i += 1
+            elif data[i + 1] == IAC:
+                out.append(IAC)
+                i += 2
+            else:
+                i += 3
+
+        return out
+
+    def __readline(self, client, rest):
+
+        while b"\r\n" not in rest:
+            rest += self.__decode(client.recv(4096))
+
+        line, rest = rest.split(b"\r\n", 1)
+        return line.decode(), rest
+
+    def __serve(self, client):
+
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client.sendall(bytes([IAC, WILL, 1, IAC, WILL, 3]) + b"Login as: ")
+        user, rest = self.__readline(client, bytearray())
+        client.sendall(b"Password: ")
+        password, rest = self.__readline(client, rest)
+
+        if (user, password) != (USER, PASSWORD):
+            client.sendall(b"\r\nInvalid credentials, try again.\r\n")
+            return
+
+        client.sendall(BANNER)
+        sim = ConSim(self.root, raw_paste=self.raw_paste)
+        sim.write(bytes(rest))
+        client.settimeout(0.1)
+
+        while self.running:
+            n = sim.inWaiting()
+            if n:
+                client.sendall(sim.read(n).replace(b"\xff", b"\xff\xff"))
+
+            try:
+                data = client.recv(4096)
+            except socket.timeout:
+                continue
+
+            if not data:
+                return
+
+            # the client answers the offered options with DONT (3 bytes), so
+            # a command is never split here for this stand-in
+            sim.write(bytes(self.__decode(data)))
+
+    def run(self):
+
+        while self.running:
+            try:
+                client, _ = self.server.accept()
+            except socket.timeout:
+                continue
+
+            try:
+                self.__serve(client)
+            except socket.error:
+                pass
+            finally:
+                client.close()
+
+    def stop(self):
+
+        self.running = False
+        self.join()
+        self.server.close()
+
+
+def bench(cls, device, raw_paste, sizes, repeat, tmp):
+    """
+    :return:    login seconds, and put/get bytes per second per file size
+    """
+
+    port = device.port
+    device.raw_paste = raw_paste
+    mp.mpfexp.ConTelnet = cls
+    constr = "tn:127.0.0.1:%d,%s,%s" % (port, USER, PASSWORD)
+
+    try:
+        start = time.time()
+        for _ in range(repeat):
+            cls(ip="127.0.0.1", user=USER, password=PASSWORD, port=port).close()
+        result = {"login_seconds": (time.time() - start) / repeat}
+
+        fe = MpFileExplorer(constr)
+
+        try:
+            for size in sizes:
+                src = os.path.join(tmp, "put-%d.bin" % size)
+                dst = os.path.join(tmp, "get-%d.bin" % size)
+
+                with open(src, "wb") as f:
+                    f.write(os.urandom(size))
+
+                for op, args in (
+                    ("put", (src, "data.bin")),
+                    ("get", ("data.bin", dst)),
+                ):
+                    start = time.time()
+                    for _ in range(repeat):
+                        getattr(fe, op)(*args)
+                    result["%s_%d" % (op, size)] = size * repeat / (time.time() - start)
+
+                fe.rm("data.bin")
+
+        finally:
+            fe.close()
+
+        return result
+
+    finally:
+        mp.mpfexp.ConTelnet = ConTelnet
+
+
+def run(sizes=SIZES, repeat=3):
+
+    root = tempfile.mkdtemp()
+    tmp = tempfile.mkdtemp()
+    open(os.path.join(root, "boot.py"), "w").close()
+
+    device = TelnetDevice(root)
+    device.start()
+
+    impls = [("current", ConTelnet, None), ("current_raw_paste", ConTelnet, True)]
+    if telnetlib is not None:
+        impls.insert(0, ("legacy", LegacyConTelnet, None))
+
+    try:
+        return dict(
+            (name, bench(cls, device, raw_paste, sizes, repeat, tmp))
+            for name, cls, raw_paste in impls
+        )
+
+    finally:
+        device.stop()
+        shutil.rmtree(root)
+        shutil.rmtree(tmp)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument(
+        "--sizes",
+        help="file sizes for put/get (default: %s)" % ",".join(map(str, SIZES)),
+        default=",".join(map(str, SIZES)),
+    )
+    parser.add_argument("--repeat", help="runs per measurement", type=int, default=3)
+
+    args = parser.parse_args()
+
+    json.dump(
+        run([int(s) for s in args.sizes.split(",")], args.repeat),
+        sys.stdout,
+        indent=2,
+    )
+    print("")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+import copy
+
+import benchmark
+import serial_latency
+import telnet
+
+
+class TestBenchmark:
+    def test_run(self, tmpdir):
+
+        tmpdir.join("boot.py").write("")
+        results = benchmark.run("sim:%s" % tmpdir, [100, 5000], [1, 5], 1)
+
+        assert ["boot.py"] == sorted(p.basename for p in tmpdir.listdir())
+        assert "sim:%s" % tmpdir == results["meta"]["constr"]
+        assert results["connect"]["min"] > 0
+
+        assert [("put", 100), ("get", 100), ("put", 5000), ("get", 5000)] == [
+            (r["op"], r["size"]) for r in results["transfers"]
+        ]
+        assert all(r["bytes_per_sec"] > 0 for r in results["transfers"])
+        assert [1, 5] == [r["entries"] for r in results["ls"]]
+
+        caching = results["caching"]
+        assert caching["hits"] > 0 and caching["misses"] > 0
+        assert 0 < caching["hit_rate"] < 1
+
+        slower = copy.deepcopy(results)
+        for r in slower["transfers"]:
+            r["bytes_per_sec"] /= 2
+
+        assert [] == benchmark.compare(results, results, 0.2)
+        assert 4 == len(benchmark.compare(slower, results, 0.2))
+
+
+class TestTelnet:
+    def test_run(self):
+
+        results = telnet.run([100], 1)
+
+        for name in ("current", "current_raw_paste"):
+            assert results[name]["login_seconds"] > 0
+            assert results[name]["put_100"] > 0
+            assert results[name]["get_100"] > 0
+
+
+class TestSerialLatency:
+    def test_run(self):
+
+        results = serial_latency.run([10], 2)
+
+        assert [10] == [r["size"] for r in results]
+        for name in ("legacy", "current", "low_latency"):
+            assert results[0][name]["seconds"] > 0
@@ -0,0 +1,90 @@
+import binascii
+import io
+import sys
+
+from mp import agent
+from mp import codec
+from mp import hashing
+
+
+class DeviceStdout:
+    """
+    MicroPython's sys.stdout.write() accepts str and bytes.
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, s):
+        self.data += s.encode("utf-8") if isinstance(s, str) else s
+
+    def getvalue(self):
+        return bytes(self.data)
+
+
+class TestAgent:
+    def __load(self, hash=None):
+
+        version, src = agent.source(codec.CODECS, hash)
+        env = {"ubinascii": binascii}
+        exec(compile(src, agent.NAME + ".py", "exec"), env)
+
+        return version, env
+
+    def test_version(self):
+
+        version, env = self.__load()
+        assert version == env["VERSION"]
+        assert version == agent.source(codec.CODECS)[0]
+        assert version != agent.source(codec.CODECS, hashing.HASHES[0])[0]
+
+    def test_encoders(self):
+
+        _, env = self.__load()
+        data = bytes(range(256))
+
+        for c in codec.CODECS:
+            out = DeviceStdout()
+            stdout, sys.stdout = sys.stdout, out
+            try:
+                env["r"](io.BytesIO(data), 100, c.name)
+            finally:
+                sys.stdout = stdout
+
+            assert data == c.decode_lines(out.getvalue())
+
+    def test_block_hashes(self, tmpdir):
+
+        data = bytes(range(256)) * 5
+        path = str(tmpdir.join("blocks"))
+
+        with open(path, "wb") as f:
+            f.write(data)
+
+        h = hashing.HASHES[0]
+        _, env = self.__load(h)
+
+        out = DeviceStdout()
+        stdout, sys.stdout = sys.stdout, out
+        try:
+            env["bh"](path, 512)
+        finally:
+            sys.stdout = stdout
+
+        with open(path, "rb") as f:
+            assert hashing.block_hashes(h, f, 512) == out.getvalue().decode().split()
+
+    def test_file_hash(self, tmpdir):
+
+        path = tmpdir.join("file")
+        path.write_binary(bytes(range(256)) * 5)
+
+        h = hashing.HASHES[0]
+        _, env = self.__load(h)
+
+        assert hashing.file_hash(h, str(path)) == env["hs"](str(path))
+        assert hashing.file_hash(h, str(path), size=700) == env["hs"](str(path), 700)
+
+        # without a hash, there is no digest
+        _, env = self.__load()
+        assert "" == env["hs"](str(path))
@@ -0,0 +1,52 @@
+from mp.chunksize import AdaptiveChunkSize
+
+
+class TestAdaptiveChunkSize:
+    def __feed(self, sizer, rate_of, rounds=20):
+
+        for _ in range(rounds * sizer.SAMPLES):
+            size = sizer.size
+            sizer.measure(size, size / rate_of(size))
+
+    def test_limits(self):
+
+        assert 64 == AdaptiveChunkSize(1).size
+        assert 4096 == AdaptiveChunkSize(100000).size
+        assert 256 == AdaptiveChunkSize(100000, maximum=256).size
+        assert 64 == AdaptiveChunkSize(512, maximum=1).size
+
+    def test_grows_to_maximum(self):
+
+        # every doubling pays off (fixed round trip cost per chunk)
+        sizer = AdaptiveChunkSize(64, maximum=2048)
+        self.__feed(sizer, lambda size: size / (0.05 + size / 10000.0))
+
+        assert sizer.settled
+        assert 2048 == sizer.size
+
+    def test_settles_on_best(self):
+
+        # throughput peaks at 512 bytes per chunk
+        sizer = AdaptiveChunkSize(64)
+        self.__feed(sizer, lambda size: 1000.0 - abs(512 - size))
+
+        assert sizer.settled
+        assert 512 == sizer.size
+        assert 512 == sizer.best_size
+
+    def test_shrink(self):
+
+        sizer = AdaptiveChunkSize(1024)
+
+        assert sizer.shrink()
+        assert 512 == sizer.size
+        assert 512 == sizer.maximum
+
+        self.__feed(sizer, lambda size: float(size))
+        assert 512 == sizer.size
+
+        while sizer.shrink():
+            pass
+
+        assert 64 == sizer.size
+        assert not sizer.shrink()
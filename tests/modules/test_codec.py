@@ -0,0 +1,87 @@
+import binascii
+
+from mp import codec
+
+
+class TestCodec:
+
+    samples = [
+        b"",
+        b"print('hello world')\n",
+        b"\x00\x11\x22\x33\x44\x55\x66\x77\x88\x99",
+        b"quotes ' and \" and \\ backslash\r\n\t",
+        bytes(range(256)),
+    ]
+
+    def __device_eval(self, expr, **env):
+
+        env["ubinascii"] = binascii
+        ret = eval(expr, env)
+
+        if isinstance(ret, str):
+            ret = ret.encode("utf-8")
+
+        return ret
+
+    def test_upload_roundtrip(self):
+
+        for c in codec.CODECS:
+            for data in self.samples:
+                assert data == self.__device_eval(c.encode(data))
+
+    def test_download_roundtrip(self):
+
+        for c in codec.CODECS:
+            for data in self.samples:
+                out = b""
+                for i in range(0, len(data), 7):
+                    out += self.__device_eval(c.remote_encode("c"), c=data[i : i + 7])
+
+                assert data == c.decode_lines(out)
+                assert data == c.decode_lines(out.replace(b"\n", b"\r\n"))
+
+    def test_supported(self):
+
+        assert [codec.LiteralCodec] == [type(c) for c in codec.supported([])]
+        assert [codec.HexCodec, codec.LiteralCodec] == [
+            type(c) for c in codec.supported(codec.HexCodec.requires)
+        ]
+        assert codec.CODECS == codec.supported(
+            ["hexlify", "unhexlify", "a2b_base64", "b2a_base64"]
+        )
+
+        # CPython's binascii provides everything
+        names = eval(codec.probe_expression(), {"ubinascii": binascii})
+        assert codec.CODECS == codec.supported(names)
+
+    def test_smallest(self):
+
+        assert "literal" == codec.smallest(codec.CODECS, b"import os\n" * 8).name
+        assert "base64" == codec.smallest(codec.CODECS, bytes(range(256))).name
+        assert (
+            "hex"
+            == codec.smallest(codec.supported(["hexlify", "unhexlify"])[:1], b"").name
+        )
+
+    def test_line_decoder(self):
+
+        data = bytes(range(256)) * 3
+
+        for c in codec.CODECS:
+            out = b""
+            for i in range(0, len(data), 50):
+                out += self.__device_eval(c.remote_encode("c"), c=data[i : i + 50])
+
+            # feed byte by byte, as received from the raw REPL
+            chunks = []
+            decoder = codec.LineDecoder(c, chunks.append)
+            for i in range(len(out)):
+                decoder.feed(out[i : i + 1])
+            decoder.feed(b"\x04")
+
+            # whole lines are decoded as soon as their line ending arrived
+            assert data == b"".join(chunks)
+            assert len(data) == decoder.size
+
+            decoder.close()
+            assert data == b"".join(chunks)
@@ -0,0 +1,53 @@
+import io
+import os
+import sys
+import types
+import zlib
+
+from mp import compression
+
+
+class FakeDecompIO:
+    def __init__(self, stream, wbits):
+        self.data = io.BytesIO(zlib.decompress(stream.read(), wbits))
+
+    def read(self, size):
+        return self.data.read(size)
+
+
+class TestCompression:
+    def test_roundtrip(self):
+
+        data = b"".join(b"line %d\n" % i for i in range(2000))
+
+        with compression.compress(io.BytesIO(data)) as z:
+            packed = z.read()
+
+        assert len(packed) < len(data) // 4
+
+        out = io.BytesIO()
+        d = compression.Decompressor(out.write)
+        for i in range(0, len(packed), 100):
+            d.write(packed[i : i + 100])
+        d.close()
+
+        assert data == out.getvalue()
+
+    def test_remote_decompress(self, tmpdir, monkeypatch):
+
+        data = os.urandom(1000) * 5
+        src = str(tmpdir.join("data.mpfs~"))
+        dst = str(tmpdir.join("data"))
+
+        with compression.compress(io.BytesIO(data)) as z, open(src, "wb") as f:
+            f.write(z.read())
+
+        uzlib = types.ModuleType("uzlib")
+        uzlib.DecompIO = FakeDecompIO
+        monkeypatch.setitem(sys.modules, "uzlib", uzlib)
+
+        exec(compression.remote_decompress("uzlib", src, dst, 256), {"uos": os})
+
+        assert not os.path.exists(src)
+        with open(dst, "rb") as f:
+            assert data == f.read()
@@ -0,0 +1,89 @@
+import os
+import time
+
+import pytest
+
+from mp.conbase import ConError
+from mp.consim import ConSim
+from mp.mpfexp import MpFileExplorer
+from mp.mpfexp import RemoteIOError
+from mp.pyboard import Pyboard
+from mp.pyboard import PyboardError
+
+
+class TestConSim:
+    def test_raw_repl(self, tmpdir):
+
+        pyb = Pyboard(ConSim(str(tmpdir)))
+        pyb.enter_raw_repl()
+
+        assert b"3\r\n" == pyb.exec_("print(1 + 2)")
+        pyb.exec_("import sys")
+        assert b"micropython" == pyb.eval("sys.implementation.name")
+
+        with pytest.raises(PyboardError) as e:
+            pyb.exec_("import uos\nuos.stat('nope')")
+        assert "OSError: [Errno 2] ENOENT" in str(e.value)
+
+        pyb.exit_raw_repl()
+
+    def test_classic_raw_repl(self, tmpdir):
+
+        pyb = Pyboard(ConSim(str(tmpdir), raw_paste=False))
+        pyb.enter_raw_repl()
+
+        assert b"ok\r\n" == pyb.exec_("print('ok')")
+        assert not pyb.use_raw_paste
+
+    def test_file_system(self, tmpdir):
+
+        tmpdir.join("boot.py").write("")
+        fe = MpFileExplorer("sim:%s" % tmpdir)
+
+        assert "sim" == fe.sysname
+        assert ["boot.py"] == fe.ls()
+
+        fe.md("lib")
+        fe.puts("lib/a.py", "x = 1\n")
+        assert "x = 1\n" == tmpdir.join("lib", "a.py").read()
+
+        with pytest.raises(RemoteIOError):
+            fe.cd("nope")
+
+        with pytest.raises(RemoteIOError):
+            fe.rm("lib")
+
+        fe.rm("lib/a.py")
+        fe.rm("lib")
+        assert ["boot.py"] == fe.ls()
+
+    def test_put_get(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        data = os.urandom(10000)
+        src = str(tmpdir.join("src.bin"))
+        dst = str(tmpdir.join("dst.bin"))
+
+        with open(src, "wb") as f:
+            f.write(data)
+
+        fe = MpFileExplorer("sim:%s" % device)
+        fe.put(src, "data.bin")
+        fe.get("data.bin", dst)
+
+        assert data == device.join("data.bin").read_binary()
+        with open(dst, "rb") as f:
+            assert data == f.read()
+
+    def test_pacing(self, tmpdir):
+
+        con = ConSim(str(tmpdir), baudrate=100000)
+
+        start = time.time()
+        con.write(b"\x03" * 1000)
+        assert time.time() - start >= 0.1
+
+    def test_missing_root(self, tmpdir):
+
+        with pytest.raises(ConError):
+            ConSim(str(tmpdir.join("nope")))
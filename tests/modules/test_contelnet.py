@@ -0,0 +1,114 @@
+import socket
+import threading
+
+import pytest
+
+from mp.conbase import ConError
+from mp.contelnet import ConTelnet
+from mp.contelnet import DO
+from mp.contelnet import DONT
+from mp.contelnet import IAC
+from mp.contelnet import SB
+from mp.contelnet import SE
+from mp.contelnet import WILL
+from mp.contelnet import WONT
+
+
+class ScriptedServer(threading.Thread):
+    """
+    Telnet server which asks for login and password, and then sends the
+    given packets, one after the other.
+    """
+
+    def __init__(self, packets, password="python"):
+
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+        self.packets = packets
+        self.password = password
+        self.received = b""
+        self.server = socket.socket()
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(1)
+        self.port = self.server.getsockname()[1]
+
+    def __receive(self, client, until):
+
+        start = len(self.received)
+
+        while until not in self.received[start:]:
+            self.received += client.recv(1)
+
+    def run(self):
+
+        client, _ = self.server.accept()
+
+        try:
+            client.sendall(bytes([IAC, WILL, 1]) + b"Login as: ")
+            self.__receive(client, b"\r\n")
+            client.sendall(b"Password: ")
+            self.__receive(client, b"\r\n")
+
+            if not self.received.endswith(self.password.encode() + b"\r\n"):
+                return
+
+            client.sendall(b'Type "help()" for more information.\r\n')
+
+            for packet in self.packets:
+                self.__receive(client, b"next")
+                client.sendall(packet)
+
+            self.__receive(client, b"end")
+
+        finally:
+            client.close()
+            self.server.close()
+
+
+class TestConTelnet:
+    def test_login_and_read(self):
+
+        server = ScriptedServer(
+            [
+                b">>> \xff\xff" + bytes([IAC, DO, 24, IAC]),
+                bytes([WONT, 3, IAC, SB, 24, 1]) + b"x",
+                bytes([IAC, SE]) + b"y" * 10000,
+            ]
+        )
+        server.start()
+
+        con = ConTelnet("127.0.0.1", "micro", "python", port=server.port)
+
+        try:
+            assert b"micro\r\n" in server.received
+            # an option offered by the server is refused
+            assert bytes([IAC, DONT, 1]) in server.received
+
+            con.write(b"next")
+            assert b"\r\n>>> \xff" == con.read(7)
+            assert 0 == con.inWaiting()
+
+            # commands split between packets are dropped as well
+            con.write(b"next")
+            con.write(b"next")
+            assert b"y" * 10000 == con.read(10000)
+            assert bytes([IAC, WONT, 24]) in server.received
+
+            # data is escaped on the way out
+            con.write(b"\xffend")
+            server.join()
+            assert server.received.endswith(b"\xff\xffend")
+
+        finally:
+            con.close()
+
+    def test_wrong_password(self):
+
+        server = ScriptedServer([], password="secret")
+        server.start()
+
+        with pytest.raises(ConError):
+            ConTelnet("127.0.0.1", "micro", "python", port=server.port)
+
+        server.join()
@@ -0,0 +1,281 @@
+import base64
+import hashlib
+import os
+import select
+import socket
+import struct
+import threading
+
+import pytest
+
+from mp.conbase import ConError
+from mp.consim import ConSim
+from mp.conwebsock import ConWebsock
+from mp.mpfexp import MpFileExplorer
+from mp.mpfexp import RemoteIOError
+
+TEXT = 0x1
+BINARY = 0x2
+CLOSE = 0x8
+
+
+class WebreplServer(threading.Thread):
+    """
+    WebREPL stand-in, which serves a simulated device on a local port, or
+    sends the given frames (opcode, payload) one after the other, each when
+    the client writes "next".
+    """
+
+    def __init__(self, root=None, frames=(), password="python"):
+
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+        self.root = root
+        self.frames = list(frames)
+        self.password = password
+        self.file_ops = []
+        self.server = socket.socket()
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(1)
+        self.port = self.server.getsockname()[1]
+
+    @staticmethod
+    def __recv(client, size):
+
+        data = b""
+        while len(data) < size:
+            chunk = client.recv(size - len(data))
+            if not chunk:
+                raise EOFError()
+            data += chunk
+        return data
+
+    def recv_frame(self, client):
+
+        head = self.__recv(client, 2)
+        opcode = head[0] & 0x0F
+        size = head[1] & 0x7F
+
+        if size == 126:
+            size = struct.unpack(">H", self.__recv(client, 2))[0]
+        elif size == 127:
+            size = struct.unpack(">Q", self.__recv(client, 8))[0]
+
+        # frames from the client are always masked
+        mask = self.__recv(client, 4) * (size // 4 + 1)
+        data = self.__recv(client, size)
+        return opcode, bytes(a ^ b for a, b in zip(data, mask))
+
+    @staticmethod
+    def send_frame(client, opcode, data):
+
+        if len(data) < 126:
+            head = struct.pack(">BB", 0x80 | opcode, len(data))
+        else:
+            head = struct.pack(">BBH", 0x80 | opcode, 126, len(data))
+        client.sendall(head + data)
+
+    def __handshake(self, client):
+
+        request = b""
+        while not request.endswith(b"\r\n\r\n"):
+            request += client.recv(1)
+
+        key = [
+            line.split(b":")[1].strip()
+            for line in request.split(b"\r\n")
+            if line.lower().startswith(b"sec-websocket-key:")
+        ][0]
+        accept = base64.b64encode(
+            hashlib.sha1(key + b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11").digest()
+        )
+        client.sendall(
+            b"HTTP/1.1 101 Switching Protocols\r\n"
+            b"Upgrade: websocket\r\nConnection: Upgrade\r\n"
+            b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n"
+        )
+
+    def __login(self, client):
+
+        self.send_frame(client, TEXT, b"Password: ")
+        password = b""
+        while not password.endswith(b"\r"):
+            password += self.recv_frame(client)[1]
+
+        if password[:-1].decode() != self.password:
+            self.send_frame(client, TEXT, b"\r\nAccess denied\r\n")
+            return False
+
+        self.send_frame(client, TEXT, b"\r\nWebREPL connected\r\n>>> ")
+        return True
+
+    def __file_op(self, client, sim, request):
+
+        _, op, _, _, size, n, name = struct.unpack("<2sBBQLH64s", request)
+        path = sim.device.local(name[:n].decode("utf-8"))
+        self.file_ops.append((op, name[:n].decode("utf-8")))
+
+        try:
+            f = open(path, "wb" if op == 1 else "rb")
+        except (IOError, OSError):
+            self.send_frame(client, BINARY, b"WB\x01\x00")
+            return
+
+        self.send_frame(client, BINARY, b"WB\x00\x00")
+
+        with f:
+            if op == 1:
+                while size:
+                    data = self.recv_frame(client)[1]
+                    f.write(data)
+                    size -= len(data)
+            else:
+                while True:
+                    self.recv_frame(client)
+                    data = f.read(256)
+                    self.send_frame(client, BINARY, struct.pack("<H", len(data)) + data)
+                    if not data:
+                        break
+
+        self.send_frame(client, BINARY, b"WB\x00\x00")
+
+    def serve(self, client):
+
+        sim = ConSim(self.root)
+        sim.read(sim.inWaiting())
+
+        while True:
+            n = sim.inWaiting()
+            if n:
+                self.send_frame(client, TEXT, sim.read(min(n, 1024)))
+                continue
+
+            if select.select([client], [], [], 0.01)[0]:
+                opcode, data = self.recv_frame(client)
+                if opcode == CLOSE:
+                    return
+                elif opcode == BINARY:
+                    self.__file_op(client, sim, data)
+                else:
+                    sim.write(data)
+
+    def run(self):
+
+        client, _ = self.server.accept()
+
+        try:
+            self.__handshake(client)
+
+            if not self.__login(client):
+                return
+
+            if self.root is not None:
+                self.serve(client)
+                return
+
+            while self.frames:
+                if self.recv_frame(client)[1] == b"next":
+                    self.send_frame(client, *self.frames.pop(0))
+
+            self.recv_frame(client)
+
+        except (EOFError, socket.error):
+            pass
+
+        finally:
+            client.close()
+            self.server.close()
+
+
+class TestConWebsock:
+    def test_read(self):
+
+        data = bytes(range(256)) * 64
+        server = WebreplServer(
+            frames=[
+                (TEXT, b"\xe2\x82"),
+                (TEXT, b"\xac \xff\xfe"),
+                (BINARY, data),
+            ]
+        )
+        server.start()
+
+        con = ConWebsock("127.0.0.1", "python", server.port)
+
+        try:
+            con.read(con.inWaiting())
+
+            # text frames cut within a UTF-8 sequence, or not even UTF-8
+            con.write(b"next")
+            con.write(b"next")
+            assert "€".encode("utf-8") + b" \xff\xfe" == con.read(6)
+            assert not con.wait(0.01)
+
+            con.write(b"next")
+            assert con.wait(1.0)
+            assert data == con.read(len(data))
+
+        finally:
+            con.close()
+
+        server.join()
+
+    def test_wrong_password(self):
+
+        server = WebreplServer(password="secret")
+        server.start()
+
+        with pytest.raises(ConError):
+            ConWebsock("127.0.0.1", "python", server.port)
+
+        server.join()
+
+    def test_file_transfer(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        data = os.urandom(20000)
+        src = tmpdir.join("data.bin")
+        src.write_binary(data)
+
+        server = WebreplServer(root=str(device))
+        server.start()
+
+        fe = MpFileExplorer("ws:127.0.0.1:%d,python" % server.port)
+
+        try:
+            fe.put(str(src), "data.bin")
+            assert data == device.join("data.bin").read_binary()
+
+            dst = str(tmpdir.join("copy.bin"))
+            fe.get("data.bin", dst)
+            assert data == open(dst, "rb").read()
+            assert 20000 == fe.last_transfer.bytes
+
+            # the raw REPL still works in between
+            assert ["data.bin"] == fe.ls()
+
+            # if the device refuses, the raw REPL reports the error
+            with pytest.raises(RemoteIOError):
+                fe.put(str(src), "missing/data.bin")
+
+            # a name too long for the protocol is sent with the raw REPL,
+            # without giving up on the protocol for other files
+            name = "x" * 70 + ".bin"
+            fe.put(str(src), name)
+            assert data == device.join(name).read_binary()
+            assert fe.native_transfer
+
+            fe.put(str(src), "data.bin")
+
+            assert [
+                (1, "/data.bin"),
+                (2, "/data.bin"),
+                (1, "/missing/data.bin"),
+                (1, "/data.bin"),
+            ] == server.file_ops
+
+        finally:
+            fe.close()
+
+        server.join()
@@ -0,0 +1,88 @@
+import io
+import os
+import threading
+
+from mp import daemon
+from mp.mpfshell import MpFileShell
+
+
+class TestDaemon:
+    def test_reuse_connection(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        tmpdir.join("main.py").write("print('hi')\n")
+        path = str(tmpdir.join("d.sock"))
+
+        d = daemon.Daemon(MpFileShell(), path, idle_timeout=10)
+        thread = threading.Thread(target=d.serve)
+        thread.start()
+
+        try:
+            while not d.running:
+                pass
+
+            cwd = os.getcwd()
+            os.chdir(str(tmpdir))
+
+            try:
+                out = io.StringIO()
+                commands = ["open sim:%s" % device, "put main.py", "ls"]
+                assert 0 == daemon.run(commands, path, out=out)
+                assert "main.py" in out.getvalue()
+                assert "print('hi')\n" == device.join("main.py").read()
+
+                fe, _ = d.shell.pool["sim:%s" % device]
+
+                out = io.StringIO()
+                commands = ["open sim:%s" % device, "md lib", "cd lib", "pwd"]
+                assert 0 == daemon.run(commands, path, out=out)
+                assert "/lib" in out.getvalue()
+
+                # the connection was kept, and starts in the start directory
+                out = io.StringIO()
+                assert 0 == daemon.run(["open sim:%s" % device, "pwd"], path, out=out)
+                assert "/\n" == out.getvalue().split("\n", 1)[1]
+                assert fe is d.shell.pool["sim:%s" % device][0]
+            finally:
+                os.chdir(cwd)
+
+        finally:
+            assert daemon.stop(path)
+            thread.join()
+
+        assert not os.path.exists(path)
+        assert {} == d.shell.pool
+
+    def test_output_and_exit(self, tmpdir):
+
+        path = str(tmpdir.join("d.sock"))
+
+        d = daemon.Daemon(MpFileShell(color=False), path, idle_timeout=10)
+        thread = threading.Thread(target=d.serve)
+        thread.start()
+
+        try:
+            while not d.running:
+                pass
+
+            # cmd.Cmd writes these to its own stdout
+            out = io.StringIO()
+            assert 0 == daemon.run(["help"], path, out=out)
+            assert "Documented commands" in out.getvalue()
+
+            out = io.StringIO()
+            assert 1 == daemon.run(["bogus"], path, out=out)
+            assert "bogus" in out.getvalue()
+
+            out = io.StringIO()
+            assert 1 == daemon.run(
+                ["open sim:%s" % tmpdir.join("nope"), "ls"], path, out=out
+            )
+            assert "Failed to open" in out.getvalue()
+
+            # the errors of one call don't carry over to the next
+            assert 0 == daemon.run(["help"], path, out=io.StringIO())
+
+        finally:
+            assert daemon.stop(path)
+            thread.join()
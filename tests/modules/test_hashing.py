@@ -0,0 +1,71 @@
+import binascii
+import hashlib
+import io
+import sys
+
+from mp import hashing
+
+
+class TestHashing:
+    def __device_exec(self, code, **env):
+
+        out = io.StringIO()
+        env.update(ubinascii=binascii, uhashlib=hashlib, sys=sys)
+
+        stdout, sys.stdout = sys.stdout, out
+        try:
+            exec(code, env)
+        finally:
+            sys.stdout = stdout
+
+        return out.getvalue()
+
+    def test_probe(self):
+
+        names = eval(self.__device_exec(hashing.PROBE))
+        assert hashing.HASHES == hashing.supported(names)
+        assert [] == hashing.supported([])
+
+    def test_host_matches_device(self, tmpdir):
+
+        data = bytes(range(256)) * 9 + b"tail"
+        path = str(tmpdir.join("blocks"))
+
+        with open(path, "wb") as f:
+            f.write(data)
+
+        for h in hashing.HASHES:
+            remote = self.__device_exec(hashing.remote_block_hashes(h, path, 512))
+
+            with open(path, "rb") as f:
+                local = hashing.block_hashes(h, f, 512)
+
+            assert 5 == len(local)
+            assert local == remote.split()
+
+    def test_changed_runs(self):
+
+        remote = ["a", "b", "c", "d"]
+
+        assert [] == hashing.changed_runs(["a", "b", "c", "d"], remote, 10)
+        assert [(10, 10)] == hashing.changed_runs(["a", "x", "c", "d"], remote, 10)
+        assert [(10, 20), (40, 20)] == hashing.changed_runs(
+            ["a", "x", "y", "d", "e", "f"], remote, 10
+        )
+        assert [(0, 20)] == hashing.changed_runs(["a", "b"], [], 10)
+
+    def test_file_hash(self, tmpdir):
+
+        path = str(tmpdir.join("file"))
+
+        with open(path, "wb") as f:
+            f.write(bytes(range(256)) * 9)
+
+        for h in hashing.HASHES:
+            code = hashing.remote_file_hash(h, 100) + "\nprint(hs(%r))" % path
+            assert hashing.file_hash(h, path) == self.__device_exec(code).strip()
+
+            code = hashing.remote_file_hash(h, 100) + "\nprint(hs(%r, 150))" % path
+            assert (
+                hashing.file_hash(h, path, 64, 150) == self.__device_exec(code).strip()
+            )
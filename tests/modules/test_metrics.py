@@ -0,0 +1,48 @@
+import io
+
+from mp import metrics
+
+
+class TestMetrics:
+    def test_format_size(self):
+
+        assert "512 B" == metrics.format_size(512)
+        assert "1.5 KB" == metrics.format_size(1536)
+        assert "2.0 MB" == metrics.format_size(2 * 1024 * 1024)
+
+    def test_rate_and_eta(self):
+
+        stats = metrics.TransferStats("put", "main.py", total=3000)
+        assert stats.eta is None
+
+        stats.start -= 2.0
+        stats.bytes = 1000
+        assert 400 < stats.rate <= 500
+        assert 3.9 < stats.eta < 4.1
+
+        stats.end = stats.start + 4.0
+        assert 250 == stats.rate
+        assert "put main.py: 1000 B in 4.00s (250 B/s)" in str(stats)
+
+    def test_status_line(self):
+
+        out = io.StringIO()
+        line = metrics.StatusLine(out)
+        line.INTERVAL = 0
+
+        stats = metrics.TransferStats("get", "boot.py", total=2048)
+        stats.bytes = 1024
+
+        line.started(stats)
+        line.progress(stats)
+        assert "get boot.py 1.0 KB/2.0 KB" in out.getvalue()
+        assert "ETA" in out.getvalue()
+
+        line.finished(stats)
+        assert out.getvalue().endswith(
+            "\r" + " " * len(out.getvalue().split("\r")[1]) + "\r"
+        )
+
+        out.truncate(0)
+        line.progress(metrics.TransferStats("batch", "mput .*"))
+        assert "" == out.getvalue()
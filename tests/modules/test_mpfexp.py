@@ -0,0 +1,632 @@
+import functools
+import os
+import re
+import types
+import zlib
+
+import pytest
+
+import mp.mpfexp
+import mp.retry
+
+from mp import compression
+from mp.consim import SimDevice
+from mp.mpfexp import MpFileExplorer
+from mp.mpfexp import MpFileExplorerCaching
+from mp.mpfexp import RemoteIOError
+from mp.profiler import Profiler
+from mp.pyboard import PyboardError
+
+
+def round_trips(profiler):
+    return len([s for s in profiler.spans if s[0] == "exec_raw_no_follow"])
+
+
+class TestSetup:
+    def test_single_round_trip(self, tmpdir):
+
+        tmpdir.join("boot.py").write("")
+        profiler = Profiler()
+        fe = MpFileExplorer("sim:%s" % tmpdir, compress=True, profiler=profiler)
+
+        assert 1 == round_trips(profiler)
+        assert "sim" == fe.sysname
+        assert "/" == fe.dir
+        assert 100000 == fe.facts["mem_free"]
+        assert "sha256" in fe.facts["hashes"]
+        assert fe.compression == fe.facts["compression"]
+
+        # returning from the REPL reuses the facts
+        del profiler.spans[:]
+        fe.teardown()
+        fe.setup()
+
+        assert 1 == round_trips(profiler)
+        assert "sim" == fe.sysname
+
+    def test_fallback(self, tmpdir):
+
+        fe = MpFileExplorer("sim:%s" % tmpdir)
+        fe.con.device.shims.pop("gc")
+        fe.facts = fe.codecs = fe.chunk_size = fe.hash = None
+        fe.setup()
+
+        assert fe.facts is None
+        assert "sim" == fe.sysname
+        assert fe.codecs and fe.chunk_size and fe.hash
+
+
+class TestProfile:
+    def test_reconnect(self, tmpdir, monkeypatch):
+
+        device = tmpdir.mkdir("device")
+        profiles = str(tmpdir.join("profiles"))
+
+        fe = MpFileExplorer("sim:%s" % device, profiles=profiles)
+        fe.close()
+
+        profile = fe.profile
+        assert fe.facts == profile["facts"]
+        assert profile["raw_paste"] is True
+        assert profile["link_speed"] > 0
+        assert [profile["unique_id"] + ".json"] == os.listdir(profiles)
+
+        # the profile replaces probing the device
+        profiler = Profiler()
+        fe = MpFileExplorer("sim:%s" % device, profiles=profiles, profiler=profiler)
+        assert 1 == round_trips(profiler)
+        assert profile["facts"] == fe.facts
+        assert fe.hash
+
+        # but only for the firmware it was recorded with
+        monkeypatch.setattr(SimDevice, "VERSION", "v2.0.0")
+        profiler = Profiler()
+        fe = MpFileExplorer("sim:%s" % device, profiles=profiles, profiler=profiler)
+        assert round_trips(profiler) > 1
+        assert "v2.0.0" == fe.profile["facts"]["version"]
+
+
+class TestCaching:
+    def test_sync_updates_listing(self, tmpdir):
+
+        src = tmpdir.mkdir("src")
+        device = tmpdir.mkdir("device")
+        fe = MpFileExplorerCaching("sim:%s" % device)
+
+        src.mkdir("lib")
+        src.join("x.py").write("x = 1\n")
+        fe.sync(str(src))
+        assert ["lib", "x.py"] == fe.ls()
+
+        for i in range(2):
+            src.join("x.py").write("x = %d\n" % (i + 2))
+            assert [("update", "x.py")] == fe.sync(str(src))
+            assert ["lib", "x.py"] == fe.ls()
+
+        # with absolute targets as well
+        fe.put(str(src.join("x.py")), "/x.py")
+        fe.puts("/y.py", "y = 1\n")
+        fe.md("/www")
+        assert ["lib", "www", "x.py", "y.py"] == fe.ls()
+
+
+class TestCompression:
+    def test_get(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        data = b"".join(b"line %d\n" % i for i in range(5000))
+        device.join("log.txt").write_binary(data)
+        dst = tmpdir.join("log.txt")
+
+        fe = MpFileExplorer("sim:%s" % device, compress=True)
+        assert "deflate-compress" in fe.compression
+
+        fe.get("log.txt", str(dst))
+
+        assert data == dst.read_binary()
+        assert ["log.txt"] == [p.basename for p in device.listdir()]
+
+    def test_get_fallback(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        data = b"".join(b"line %d\n" % i for i in range(5000))
+        device.join("log.txt").write_binary(data)
+        dst = tmpdir.join("log.txt")
+
+        fe = MpFileExplorer("sim:%s" % device, compress=True)
+
+        class FailingDeflateIO:
+            def __init__(self, stream, *args):
+                self.stream = stream
+
+            def write(self, b):
+                # part of the file is already sent when this fails
+                z = zlib.compressobj(9, zlib.DEFLATED, compression.WBITS)
+                self.stream.write(z.compress(b) + z.flush(zlib.Z_SYNC_FLUSH))
+                raise OSError(28, "ENOSPC")
+
+        fe.con.device.shims["deflate"].DeflateIO = FailingDeflateIO
+        fe.get("log.txt", str(dst))
+
+        assert data == dst.read_binary()
+
+
+def interrupt(fe, match, after, keep=None, error="link lost"):
+    """
+    Make the exec of the explorer fe with match in its code fail once with
+    error, after letting after - 1 of them through. The failing exec is lost
+    on the way to the device, or with keep given, it is run but only keep
+    bytes of its output are passed on. With after 0, the execs are only
+    recorded.
+
+    :return:    list of the code of all execs
+    """
+
+    execs = []
+    count = [0]
+    exec_ = fe.exec_
+
+    def failing_exec(command, data_consumer=None):
+
+        execs.append(command)
+
+        if match in command:
+            count[0] += 1
+            if count[0] == after:
+                if keep is not None:
+                    data_consumer(exec_(command)[:keep])
+                raise PyboardError(error)
+
+        return exec_(command, data_consumer)
+
+    fe.exec_ = failing_exec
+    return execs
+
+
+def resumed_at(execs, mode):
+    """
+    :return:    offsets at which the remote file was opened with mode
+    """
+
+    return [
+        int(m.group(1))
+        for m in (
+            re.search(r"'%s'\)\nf.seek\((\d+)\)" % re.escape(mode), c) for c in execs
+        )
+        if m
+    ]
+
+
+class TestPut:
+    def test_streaming(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        data = os.urandom(100000)
+        src = tmpdir.join("data.bin")
+        src.write_binary(data)
+
+        fe = MpFileExplorer("sim:%s" % device)
+        execs = interrupt(fe, "f.write(", 0)
+        fe.put(str(src), "data.bin")
+
+        assert data == device.join("data.bin").read_binary()
+
+        sent = [int(n) for n in re.findall(r"!= (\d+):", "".join(execs))]
+        assert len(data) == sum(sent)
+        assert max(sent) <= fe.chunk_size.maximum
+
+    def test_classic_raw_repl(self, tmpdir, monkeypatch):
+
+        device = tmpdir.mkdir("device")
+        data = os.urandom(10000)
+        src = tmpdir.join("data.bin")
+        src.write_binary(data)
+
+        # firmware without raw-paste mode
+        monkeypatch.setattr(
+            mp.mpfexp, "ConSim", functools.partial(mp.mpfexp.ConSim, raw_paste=None)
+        )
+        fe = MpFileExplorer("sim:%s" % device)
+        assert not fe.use_raw_paste
+
+        execs = interrupt(fe, "f.write(", 0)
+        fe.put(str(src), "data.bin")
+
+        assert data == device.join("data.bin").read_binary()
+
+        sent = [int(n) for n in re.findall(r"!= (\d+):", "".join(execs))]
+        assert max(sent) <= MpFileExplorer.RAW_REPL_MAX_CHUNK_SIZE
+
+    def test_shrink(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        data = os.urandom(30000)
+        src = tmpdir.join("data.bin")
+        src.write_binary(data)
+
+        fe = MpFileExplorer("sim:%s" % device)
+        size = fe.chunk_size.size
+        execs = interrupt(fe, "f.write(", 2, error="MemoryError")
+        fe.put(str(src), "data.bin")
+
+        # the failed chunk is sent again, smaller
+        assert data == device.join("data.bin").read_binary()
+        assert fe.chunk_size.size < size
+        assert "f.seek(%d)" % size in execs
+
+    def test_puts(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        text = "".join("line %d\n" % i for i in range(5000))
+
+        fe = MpFileExplorer("sim:%s" % device)
+        fe.puts("text.txt", text)
+
+        assert text == device.join("text.txt").read()
+
+
+class TestDelta:
+    BLOCK = MpFileExplorer.DELTA_BLOCK_SIZE
+
+    def put(self, tmpdir, remote, local):
+        """
+        :return:    execs of a delta put of local over remote
+        """
+
+        device = tmpdir.mkdir("device")
+        device.join("data.bin").write_binary(remote)
+        src = tmpdir.join("data.bin")
+        src.write_binary(local)
+
+        fe = MpFileExplorer("sim:%s" % device)
+        assert fe.hash
+
+        execs = interrupt(fe, "f.write(", 0)
+        fe.put(str(src), "data.bin", delta=True)
+
+        assert local == device.join("data.bin").read_binary()
+        return execs
+
+    @staticmethod
+    def sent(execs):
+        return sum(int(n) for n in re.findall(r"!= (\d+):", "".join(execs)))
+
+    def test_patch(self, tmpdir):
+
+        remote = os.urandom(20 * self.BLOCK)
+        local = bytearray(remote)
+        local[5 * self.BLOCK + 7] ^= 0xFF
+        local[12 * self.BLOCK] ^= 0xFF
+        execs = self.put(tmpdir, remote, bytes(local))
+
+        assert any("'r+b')" in c for c in execs)
+        assert 2 * self.BLOCK == self.sent(execs)
+
+    def test_unchanged(self, tmpdir):
+
+        data = os.urandom(10 * self.BLOCK)
+        execs = self.put(tmpdir, data, data)
+
+        assert 0 == self.sent(execs)
+
+    def test_local_longer(self, tmpdir):
+
+        remote = os.urandom(10 * self.BLOCK + 100)
+        local = remote + os.urandom(1000)
+        execs = self.put(tmpdir, remote, local)
+
+        # the partial last block is sent again
+        assert len(local) - 10 * self.BLOCK == self.sent(execs)
+
+    def test_local_shorter(self, tmpdir):
+
+        remote = os.urandom(10 * self.BLOCK)
+        local = bytearray(remote[: 5 * self.BLOCK + 100])
+        local[self.BLOCK] ^= 0xFF
+        execs = self.put(tmpdir, remote, bytes(local))
+
+        # the device cuts the remote file, then the changed block is sent
+        assert any("'r+b')" in c for c in execs)
+        assert self.BLOCK == self.sent(execs)
+        assert ["data.bin"] == [p.basename for p in tmpdir.join("device").listdir()]
+
+    def test_local_shorter_full(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        remote = os.urandom(10 * self.BLOCK)
+        device.join("data.bin").write_binary(remote)
+        src = tmpdir.join("data.bin")
+        src.write_binary(remote[: 5 * self.BLOCK])
+
+        # the file system is too full for the copy of the part to keep
+        fe = MpFileExplorer("sim:%s" % device)
+        execs = interrupt(fe, "uos.rename(", 1, error="OSError: [Errno 28] ENOSPC")
+        fe.put(str(src), "data.bin", delta=True)
+
+        # so all of the file is sent
+        assert src.read_binary() == device.join("data.bin").read_binary()
+        assert any("'wb')" in c for c in execs)
+        assert 5 * self.BLOCK == self.sent(execs)
+
+    def test_missing(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        data = os.urandom(3000)
+        src = tmpdir.join("data.bin")
+        src.write_binary(data)
+
+        fe = MpFileExplorer("sim:%s" % device)
+        fe.put(str(src), "data.bin", delta=True)
+
+        assert data == device.join("data.bin").read_binary()
+
+
+class TestResume:
+    @pytest.fixture(autouse=True)
+    def no_delay(self, monkeypatch):
+        monkeypatch.setattr(mp.retry, "time", types.SimpleNamespace(sleep=id))
+
+    def test_put(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        data = os.urandom(30000)
+        src = tmpdir.join("data.bin")
+        src.write_binary(data)
+
+        fe = MpFileExplorer("sim:%s" % device)
+        execs = interrupt(fe, "f.write(", 3)
+        fe.put(str(src), "data.bin")
+
+        assert data == device.join("data.bin").read_binary()
+
+        # the two chunks before the failed one are kept
+        sent = [int(n) for n in re.findall(r"!= (\d+):", "".join(execs))]
+        assert [sent[0] + sent[1]] == resumed_at(execs, "r+b")
+        assert len(data) == sum(sent) - sent[2]
+
+    def test_put_given_up(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        src = tmpdir.join("data.bin")
+        src.write_binary(os.urandom(30000))
+
+        fe = MpFileExplorer("sim:%s" % device)
+        exec_ = fe.exec_
+        writes = [0]
+
+        def failing_exec(command, data_consumer=None):
+            if "f.write(" in command:
+                writes[0] += 1
+                if writes[0] > 1:
+                    raise PyboardError("link lost")
+            return exec_(command, data_consumer)
+
+        fe.exec_ = failing_exec
+
+        with pytest.raises(PyboardError):
+            fe.put(str(src), "data.bin")
+
+        # a later upload of the same file doesn't even check the partial one
+        fe.exec_ = exec_
+        execs = interrupt(fe, "f.write(", 0)
+        data = os.urandom(30000)
+        src.write_binary(data)
+        fe.put(str(src), "data.bin")
+
+        assert data == device.join("data.bin").read_binary()
+        assert [0] == resumed_at(execs, "wb")
+        assert not any("hs(" in c for c in execs)
+
+    def test_put_without_hash(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        data = os.urandom(30000)
+        src = tmpdir.join("data.bin")
+        src.write_binary(data)
+
+        fe = MpFileExplorer("sim:%s" % device)
+        fe.hash = None
+        execs = interrupt(fe, "f.write(", 3)
+        fe.put(str(src), "data.bin")
+
+        # the size of the partial file can't be checked, so it starts over
+        assert data == device.join("data.bin").read_binary()
+        assert [0, 0] == resumed_at(execs, "wb")
+        assert [] == resumed_at(execs, "r+b")
+
+    def test_put_mismatch(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        data = os.urandom(10000)
+        src = tmpdir.join("data.bin")
+        src.write_binary(data)
+        device.join("data.bin").write_binary(os.urandom(3000))
+
+        fe = MpFileExplorer("sim:%s" % device)
+        execs = interrupt(fe, "f.write(", 0)
+        fe.put(str(src), "data.bin", resume=True)
+
+        assert data == device.join("data.bin").read_binary()
+        assert [] == resumed_at(execs, "r+b")
+        assert [0] == resumed_at(execs, "wb")
+
+    def test_get(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        data = os.urandom(10000)
+        device.join("data.bin").write_binary(data)
+        dst = tmpdir.join("data.bin")
+
+        fe = MpFileExplorer("sim:%s" % device)
+        execs = interrupt(fe, "sys.stdout.write(", 1, keep=12000)
+        fe.get("data.bin", str(dst))
+
+        assert data == dst.read_binary()
+
+        # the two complete lines received before the failure are kept
+        assert [0, 2 * fe.chunk_size.size] == resumed_at(execs, "rb")
+
+    def test_agent(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        data = os.urandom(30000)
+        src = tmpdir.join("data.bin")
+        src.write_binary(data)
+
+        fe = MpFileExplorer("sim:%s" % device, use_agent=True)
+        assert fe.agent
+
+        execs = interrupt(fe, "_a.w(f", 3)
+        fe.put(str(src), "data.bin")
+
+        assert data == device.join("data.bin").read_binary()
+
+        # the stat and the prefix hash are agent calls
+        assert any(c.startswith("_a.size(") for c in execs)
+        assert any(c.startswith("print(_a.hs(") for c in execs)
+        assert not any("uos.stat(" in c or "def hs(" in c for c in execs)
+
+    def test_get_mismatch(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        data = os.urandom(10000)
+        device.join("data.bin").write_binary(data)
+        dst = tmpdir.join("data.bin")
+        dst.write_binary(os.urandom(3000))
+
+        fe = MpFileExplorer("sim:%s" % device)
+        execs = interrupt(fe, "sys.stdout.write(", 0)
+        fe.get("data.bin", str(dst), resume=True)
+
+        assert data == dst.read_binary()
+        assert [0] == resumed_at(execs, "rb")
+
+
+def files(root):
+    """
+    :return:    dict mapping the relative paths of all files below the local
+                directory root to their content
+    """
+
+    return {
+        p.relto(root).replace(os.sep, "/"): p.read_binary()
+        for p in root.visit()
+        if p.isfile()
+    }
+
+
+class TestTree:
+    @staticmethod
+    def make_tree(root):
+
+        root.join("main.py").write("import lib\n")
+        root.mkdir("lib").join("a.py").write("a = 1\n")
+        root.join("lib").mkdir("sub").join("b.bin").write_binary(os.urandom(5000))
+        root.mkdir("empty")
+
+    def test_put_tree(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        src = tmpdir.mkdir("app")
+        self.make_tree(src)
+
+        fe = MpFileExplorer("sim:%s" % device)
+        done = fe.put_tree(str(src))
+
+        assert 3 == len(done)
+        assert files(src) == files(device.join("app"))
+        assert device.join("app", "empty").isdir()
+
+        # again, into the existing directories
+        src.join("lib", "a.py").write("a = 2\n")
+        fe.put_tree(str(src), "app")
+        assert files(src) == files(device.join("app"))
+
+        with pytest.raises(IOError):
+            fe.put_tree(str(tmpdir.join("nope")))
+
+    def test_get_tree(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        self.make_tree(device.mkdir("app"))
+        dst = tmpdir.join("copy")
+
+        fe = MpFileExplorer("sim:%s" % device)
+        done = fe.get_tree("app", str(dst))
+
+        assert 3 == len(done)
+        assert files(device.join("app")) == files(dst)
+        assert dst.join("empty").isdir()
+
+        with pytest.raises(RemoteIOError):
+            fe.get_tree("nope", str(tmpdir.join("nope")))
+
+    def test_mput(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        src = tmpdir.mkdir("src")
+        src.join("a.py").write("a = 1\n")
+        src.join("b.txt").write("b\n")
+        src.mkdir("c.py")
+
+        fe = MpFileExplorer("sim:%s" % device)
+        fe.mput(str(src), r".*\.py$")
+
+        assert ["a.py"] == fe.ls()
+
+    def test_get_missing(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        device.mkdir("lib")
+        dst = tmpdir.join("a.py")
+
+        fe = MpFileExplorer("sim:%s" % device)
+
+        with pytest.raises(RemoteIOError):
+            fe.get("lib/a.py", str(dst))
+
+        assert not dst.exists()
+
+    def test_get_tree_own_files(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        lib = device.mkdir("lib")
+        lib.join(MpFileExplorer.SYNC_MANIFEST).write("{}")
+        lib.join("_mpfs_agent.py").write("x = 1\n")
+        lib.join("a.py").write("a = 1\n")
+
+        fe = MpFileExplorer("sim:%s" % device)
+        fe.get_tree("lib", str(tmpdir.join("lib")))
+
+        assert files(lib) == files(tmpdir.join("lib"))
+
+    def test_sync_own_files(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        device.join("_mpfs_agent.py").write("x = 1\n")
+        src = tmpdir.mkdir("src")
+        src.join("a.py").write("a = 1\n")
+
+        fe = MpFileExplorer("sim:%s" % device)
+        fe.sync(str(src), delete=True, manifest=True)
+
+        assert {"a.py", "_mpfs_agent.py", MpFileExplorer.SYNC_MANIFEST} == set(
+            files(device)
+        )
+        assert [] == fe.sync(str(src), delete=True, manifest=True)
+
+    def test_sync_agent(self, tmpdir):
+
+        device = tmpdir.mkdir("device")
+        src = tmpdir.mkdir("src")
+        src.join("a.py").write("a = 1\n")
+
+        fe = MpFileExplorer("sim:%s" % device, use_agent=True)
+        execs = interrupt(fe, "", 0)
+
+        assert [("put", "a.py")] == fe.sync(str(src))
+        assert [] == fe.sync(str(src))
+        src.join("a.py").write("a = 2\n")
+        assert [("update", "a.py")] == fe.sync(str(src))
+
+        assert not any("def hs(" in c for c in execs)
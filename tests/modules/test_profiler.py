@@ -0,0 +1,62 @@
+import io
+
+from mp.mpfexp import MpFileExplorer
+from mp.profiler import Profiler
+
+
+class TestProfiler:
+    def test_summary_and_trace(self):
+
+        profiler = Profiler()
+        profiler.record("a", "test", 1.0, 1.5)
+        profiler.record("b", "test", 1.1, 1.2)
+        profiler.record("a", "test", 2.0, 2.5)
+
+        assert [("a", 2, 1.0, 0.5), ("b", 1, 0.1, 0.1)] == [
+            (n, c, round(t, 3), round(m, 3)) for n, c, t, m in profiler.summary()
+        ]
+
+        out = io.StringIO()
+        profiler.print_summary(out)
+        assert out.getvalue().split("\n")[1].split() == [
+            "a",
+            "2",
+            "1000.00",
+            "500.00",
+            "500.00",
+        ]
+
+        events = profiler.chrome_trace()["traceEvents"]
+        assert 3 == len(events)
+        assert "X" == events[0]["ph"]
+        assert 500000 == round(events[0]["dur"])
+
+    def test_explorer_spans(self, tmpdir):
+
+        tmpdir.join("boot.py").write("")
+        profiler = Profiler()
+        fe = MpFileExplorer("sim:%s" % tmpdir, profiler=profiler)
+        fe.ls()
+
+        names = set(s[0] for s in profiler.spans)
+        assert {
+            "connect",
+            "enter_raw_repl",
+            "exec_raw_no_follow",
+            "wait_prompt",
+            "follow",
+            "MpFileExplorer.setup",
+            "MpFileExplorer.ls",
+        } <= names
+
+        # spans of a command are nested in the one of the operation
+        ls = [s for s in profiler.spans if s[0] == "MpFileExplorer.ls"][0]
+        assert any(
+            s[0] == "follow" and ls[2] <= s[2] and s[3] <= ls[3] for s in profiler.spans
+        )
+
+    def test_off(self, tmpdir):
+
+        fe = MpFileExplorer("sim:%s" % tmpdir)
+        assert fe.profiler is None
+        fe.ls()
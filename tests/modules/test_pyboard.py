@@ -0,0 +1,230 @@
+import struct
+
+import pytest
+
+from mp.conbase import ConBase
+from mp.consim import ConSim
+from mp.pyboard import Pyboard
+from mp.pyboard import PyboardError
+
+
+class FakeRawRepl(ConBase):
+    """
+    Minimal raw REPL peer which "executes" a command by reporting its length.
+    """
+
+    WINDOW = 32
+
+    def __init__(self, raw_paste):
+        ConBase.__init__(self)
+
+        self.raw_paste = raw_paste
+        self.pasting = False
+        self.received = 0
+        self.granted = 0
+        self.command = b""
+        self.commands = []
+        self.out = bytearray(b">")
+
+    def __done(self):
+
+        self.commands.append(self.command)
+        self.out += b"%d\x04\x04>" % len(self.command)
+        self.command = b""
+
+    def write(self, data):
+
+        if data == b"\x05A\x01":
+            if self.raw_paste is None:
+                # firmware without raw-paste restarts the raw REPL on ctrl-A
+                self.out += b"raw REPL; CTRL-B to exit\r\n>"
+            elif self.raw_paste:
+                self.pasting = True
+                self.received = 0
+                self.granted = self.WINDOW
+                self.out += b"R\x01" + struct.pack("<H", self.WINDOW)
+            else:
+                self.out += b"R\x00"
+        elif data == b"\x04":
+            if self.pasting:
+                self.pasting = False
+                self.out += b"\x04"
+            else:
+                self.out += b"OK"
+            self.__done()
+        else:
+            self.command += data
+            if self.pasting:
+                # a pasting host never writes beyond the window it was granted
+                self.received += len(data)
+                assert self.received <= self.granted
+                # consume the data right away and grant a new window
+                while self.granted - self.received < self.WINDOW:
+                    self.granted += self.WINDOW
+                    self.out += b"\x01"
+
+        return len(data)
+
+    def read(self, size=1):
+
+        data = bytes(self.out[:size])
+        del self.out[:size]
+        return data
+
+    def inWaiting(self):
+        return len(self.out)
+
+
+class BootingRepl(ConBase):
+    """
+    Raw REPL peer which is still booting, and misses the first requests.
+    """
+
+    def __init__(self, busy):
+        ConBase.__init__(self)
+
+        self.busy = busy
+        self.requests = 0
+        self.out = bytearray(b"boot")
+
+    def write(self, data):
+
+        if data == b"\r\x01":
+            self.requests += 1
+            if self.requests > self.busy:
+                self.out += b"\r\nraw REPL; CTRL-B to exit\r\n>"
+            else:
+                self.out += b" messages\r\n"
+
+        return len(data)
+
+    def read(self, size=1):
+
+        data = bytes(self.out[:size])
+        del self.out[:size]
+        return data
+
+    def inWaiting(self):
+        return len(self.out)
+
+    def wait(self, timeout):
+        return len(self.out) > 0
+
+
+class CountingSim(ConSim):
+    """
+    Simulated device which records the writes which reach the line.
+    """
+
+    def __init__(self, root, raw_paste):
+        ConSim.__init__(self, root, raw_paste=raw_paste)
+
+        self.writes = []
+
+    def _write(self, data):
+
+        self.writes.append(bytes(data))
+        return ConSim._write(self, data)
+
+
+class TestPyboard:
+    def test_raw_paste(self):
+
+        con = FakeRawRepl(raw_paste=True)
+        pyb = Pyboard(con)
+
+        command = "x = 1\n" * 50
+        assert str(len(command)).encode() == pyb.exec_(command)
+        assert pyb.use_raw_paste
+        assert [command.encode()] == con.commands
+
+    def test_raw_paste_refused(self):
+
+        for raw_paste in (False, None):
+            con = FakeRawRepl(raw_paste=raw_paste)
+            pyb = Pyboard(con)
+
+            assert b"5" == pyb.exec_("x = 1")
+            assert not pyb.use_raw_paste
+
+            # no further attempts once the device refused
+            assert b"5" == pyb.exec_("x = 2")
+            assert [b"x = 1", b"x = 2"] == con.commands
+
+    def test_read_until(self):
+
+        con = FakeRawRepl(raw_paste=True)
+        con.out = bytearray(b"out\x04err\x04>")
+        pyb = Pyboard(con)
+
+        # what is read beyond ending is kept for the next read
+        assert b"out\x04" == pyb.read_until(1, b"\x04")
+        assert b"err\x04" == pyb.read_until(1, b"\x04")
+        assert b">" == pyb.read_until(1, b">")
+
+    def test_read_until_consumer(self):
+
+        con = FakeRawRepl(raw_paste=True)
+        con.out = bytearray(b"x" * 1000 + b"\x04rest")
+        pyb = Pyboard(con)
+        consumed = []
+
+        assert b"\x04" == pyb.read_until(1, b"\x04", data_consumer=consumed.append)
+        assert b"x" * 1000 + b"\x04" == b"".join(consumed)
+        assert b"rest" == pyb.read_until(1, b"rest")
+
+    def test_read_until_timeout(self):
+
+        con = FakeRawRepl(raw_paste=True)
+        con.out = bytearray(b"no end")
+        pyb = Pyboard(con)
+
+        assert b"no end" == pyb.read_until(1, b"\x04", timeout=0.05)
+
+    def test_enter_raw_repl(self):
+
+        con = BootingRepl(busy=2)
+        Pyboard(con).enter_raw_repl()
+        assert 3 == con.requests
+
+        con = BootingRepl(busy=10)
+        with pytest.raises(PyboardError):
+            Pyboard(con).enter_raw_repl()
+        assert Pyboard.RAW_REPL_TRIES == con.requests
+
+    def test_coalesced_writes(self, tmpdir):
+
+        for raw_paste, writes in (
+            (True, [b"\x05A\x01", b"x = 1\x04"]),
+            (None, [b"x = 1\x04"]),
+        ):
+            con = CountingSim(str(tmpdir), raw_paste)
+            pyb = Pyboard(con)
+            pyb.enter_raw_repl()
+            # the first exec finds out about raw-paste mode
+            pyb.exec_("pass")
+
+            del con.writes[:]
+            pyb.exec_("x = 1")
+            assert writes == con.writes
+
+    def test_buffered(self):
+
+        con = CountingSim(".", True)
+
+        with con.buffered():
+            con.write(b"a")
+            with con.buffered():
+                con.write(b"b")
+            assert [] == con.writes
+            con.flush()
+            con.write(b"c")
+
+        assert [b"ab", b"c"] == con.writes
+
+        with pytest.raises(ValueError):
+            with con.buffered():
+                con.write(b"d")
+                raise ValueError()
+
+        assert [b"ab", b"c"] == con.writes